@@ -0,0 +1,69 @@
+# coding: utf-8
+# Raytheon BBN Technologies 2016
+# Contributiors: Graham Rowlands
+#
+# This file contains structural analyses of the pipeline that find work
+# the acquisition does not need to do, such as redundant filters.
+
+from collections import deque
+
+from .pipeline import *
+
+# Types whose output leaves the pipeline. These are never merged, since
+# each one writes its own file or plot.
+SINK_TYPES = ('WriteToHDF5', 'Plotter', 'XYPlotter', 'MeshPlotter', 'DataBuffer', 'Print')
+
+def canonical_ids(pipeline, exclude_types=SINK_TYPES):
+    """Number the nodes so that two nodes share an id exactly when they have
+    the same type, the same parameters, and structurally identical inputs.
+    Ids are assigned in topological order, so that identical subtrees are
+    found bottom up. Digitizers, disabled nodes, nodes on cycles, and nodes
+    of the excluded types are always given an id of their own."""
+    order, cyclic = pipeline.topological_order()
+    ids  = {}
+    keys = {}
+    for name in order:
+        node = pipeline[name]
+        if node.is_instrument or not node.enabled or node.type in exclude_types:
+            key = ('unique', name)
+        else:
+            params  = tuple(sorted((str(k), repr(v)) for k, v in node.params.items()))
+            # Sources that don't exist are kept by name, tagged so that they
+            # never have to be compared with the ids of the existing ones
+            sources = tuple(sorted(((0, ids[s]) if s in ids else (1, s), c) for s, c in node.sources))
+            key = (node.type, params, sources)
+        ids[name] = keys.setdefault(key, len(keys))
+    for name in sorted(cyclic):
+        ids[name] = keys.setdefault(('unique', name), len(keys))
+    return ids
+
+def redundant_groups(pipeline, exclude_types=SINK_TYPES):
+    """Lists of the names of identical nodes, the node to keep first"""
+    members = {}
+    for name, cid in canonical_ids(pipeline, exclude_types).items():
+        members.setdefault(cid, []).append(name)
+    return [sorted(names) for names in members.values() if len(names) > 1]
+
+def sink_types(catalog, bases=SINK_TYPES):
+    """The types in bases along with every catalog type derived from one of
+    them, so that custom writers and plotters count as sinks too."""
+    sinks = set(bases)
+    base_classes = tuple(catalog[b].cls for b in bases if b in catalog and catalog[b].cls is not None)
+    if len(base_classes) > 0:
+        for name, spec in catalog.items():
+            if spec.cls is not None and issubclass(spec.cls, base_classes):
+                sinks.add(name)
+    return sinks
+
+def unused_nodes(pipeline, sinks=SINK_TYPES):
+    """Names of the enabled filters whose output never reaches an enabled
+    node of one of the sink types, found by walking upstream from the sinks."""
+    queue = deque(n.name for n in pipeline.nodes.values() if n.enabled and n.type in sinks)
+    used  = set(queue)
+    while queue:
+        for source_name in pipeline[queue.popleft()].source_names():
+            if source_name in pipeline and source_name not in used and pipeline[source_name].enabled:
+                used.add(source_name)
+                queue.append(source_name)
+    return [n.name for n in pipeline.nodes.values()
+            if n.enabled and not n.is_instrument and n.name not in used]
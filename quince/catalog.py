@@ -0,0 +1,155 @@
+# coding: utf-8
+# Raytheon BBN Technologies 2016
+# Contributiors: Graham Rowlands
+#
+# This file contains a headless catalog of the node types that Auspex
+# provides, i.e. their connectors and parameter limits, for use by
+# tools that do not construct any graphics items.
+
+import importlib
+import pkgutil
+import inspect
+from collections import OrderedDict
+
+NO_AUSPEX = False
+try:
+    import auspex.config
+    auspex.config.auspex_dummy_mode = True
+    import auspex
+    import auspex.filters as auspex_filt
+    import auspex.instruments as instr
+    from auspex.filters.filter import Filter
+    import auspex.parameter
+    from auspex.instruments.instrument import Instrument, SCPIInstrument, CLibInstrument
+except ImportError as e:
+    NO_AUSPEX = True
+    print("Failed to load Auspex with error '{}'. There will be no nodes.".format(str(e)))
+
+class ParameterSpec(object):
+    """Description of a single quince parameter of an Auspex filter"""
+    def __init__(self, name, kind, datatype=None, low=None, high=None,
+                 increment=None, snap=None, allowed_values=None, default=None):
+        self.name           = name
+        self.kind           = kind # 'numerical', 'boolean', 'filename', 'combo', or 'string'
+        self.datatype       = datatype
+        self.low            = low
+        self.high           = high
+        self.increment      = increment
+        self.snap           = snap
+        self.allowed_values = allowed_values
+        self.default        = default
+
+    def check(self, value):
+        """Return None if value is acceptable, otherwise a description of the problem."""
+        if self.kind == 'numerical':
+            try:
+                value = self.datatype(value)
+            except (TypeError, ValueError):
+                return "{} is not a valid {}".format(value, self.datatype.__name__)
+            if self.low is not None and value < self.low:
+                return "{} is below the minimum of {}".format(value, self.low)
+            if self.high is not None and value > self.high:
+                return "{} is above the maximum of {}".format(value, self.high)
+        elif self.kind == 'combo':
+            if value not in self.allowed_values:
+                return "{} is not one of {}".format(value, ", ".join(str(v) for v in self.allowed_values))
+        elif self.kind == 'boolean':
+            if not isinstance(value, bool):
+                return "{} is not a boolean".format(value)
+        return None
+
+class NodeSpec(object):
+    """Description of a node type, i.e. an Auspex filter or digitizer"""
+    def __init__(self, name, category, cls, is_instrument=False):
+        self.name          = name
+        self.category      = category
+        self.cls           = cls
+        self.is_instrument = is_instrument
+        self.inputs        = []
+        self.outputs       = []
+        self.parameters    = OrderedDict()
+
+def parameter_spec(auspex_param):
+    """Translate an Auspex parameter into a ParameterSpec, following the
+    same conventions used when building the parameter widgets."""
+    if isinstance(auspex_param, (auspex.parameter.FloatParameter, auspex.parameter.IntParameter)):
+        datatype = float if isinstance(auspex_param, auspex.parameter.FloatParameter) else int
+        if auspex_param.value_range:
+            low  = min(auspex_param.value_range)
+            high = max(auspex_param.value_range)
+            increment = auspex_param.increment or 0.05*(high-low)
+        else:
+            low  = -1e15
+            high = 1e15
+            increment = 2e14
+        spec = ParameterSpec(auspex_param.name, 'numerical', datatype, low, high,
+                             increment, auspex_param.snap)
+    elif isinstance(auspex_param, auspex.parameter.BoolParameter):
+        spec = ParameterSpec(auspex_param.name, 'boolean', bool)
+    elif isinstance(auspex_param, auspex.parameter.FilenameParameter):
+        spec = ParameterSpec(auspex_param.name, 'filename', str)
+    elif auspex_param.allowed_values:
+        spec = ParameterSpec(auspex_param.name, 'combo', str,
+                             allowed_values=list(auspex_param.allowed_values))
+    else:
+        spec = ParameterSpec(auspex_param.name, 'string', str)
+    if hasattr(auspex_param, 'default') and auspex_param.default:
+        spec.default = auspex_param.default
+    return spec
+
+def filter_modules():
+    modules = {
+        name: importlib.import_module('auspex.filters.' + name)
+        for loader, name, is_pkg in pkgutil.iter_modules(auspex_filt.__path__)
+    }
+    modules.pop('filter') # We don't want the base class
+    modules.pop('elementwise') # This one is also an abstract base class
+    return modules
+
+def instrument_modules():
+    return {
+        name: importlib.import_module('auspex.instruments.' + name)
+        for loader, name, is_pkg in pkgutil.iter_modules(instr.__path__)
+    }
+
+def is_digitizer(cls):
+    return hasattr(cls, 'instrument_type') and "Digitizer" in cls.instrument_type
+
+def module_classes(mod, base_class, mod_filter=None):
+    classes = {n: f for n, f in mod.__dict__.items() if inspect.isclass(f)
+                                                        and issubclass(f, base_class)
+                                                        and f != base_class}
+    if mod_filter:
+        classes = {n: f for n, f in classes.items() if mod_filter(f)}
+    return classes
+
+_catalog = None
+
+def load_catalog():
+    """Return a dictionary of NodeSpecs keyed by type name. The catalog is
+    built once, since it requires instantiating every Auspex filter."""
+    global _catalog
+    if _catalog is not None:
+        return _catalog
+
+    _catalog = OrderedDict()
+    if NO_AUSPEX:
+        return _catalog
+
+    for mod_name, mod in sorted(filter_modules().items(), key=lambda m: m[0].lower()):
+        for name, cls in sorted(module_classes(mod, Filter).items()):
+            spec = NodeSpec(name, mod_name, cls)
+            obj_instance = cls()
+            spec.outputs = list(obj_instance._output_connectors)
+            spec.inputs  = list(obj_instance._input_connectors)
+            for auspex_param in obj_instance.quince_parameters:
+                spec.parameters[auspex_param.name] = parameter_spec(auspex_param)
+            _catalog[name] = spec
+
+    for mod_name, mod in sorted(instrument_modules().items(), key=lambda m: m[0].lower()):
+        for name, cls in sorted(module_classes(mod, Instrument, is_digitizer).items()):
+            spec = NodeSpec(name, mod_name, cls, is_instrument=True)
+            spec.outputs = ['source']
+            _catalog[name] = spec
+
+    return _catalog
@@ -0,0 +1,92 @@
+# coding: utf-8
+# Raytheon BBN Technologies 2016
+# Contributiors: Graham Rowlands
+#
+# This file contains the yaml reading and writing procedures. It
+# deliberately avoids Qt so that it can be used headlessly.
+
+import os, os.path
+from shutil import move
+
+try:
+    import ruamel.yaml as yaml
+except:
+    try:
+        import ruamel_yaml as yaml
+    except:
+        raise Exception("Could not find ruamel.yaml or ruamel_yaml")
+
+class Include():
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'r') as f:
+            self.data = yaml.load(f, Loader=yaml.RoundTripLoader)
+    def __getitem__(self, key):
+        return self.data[key]
+    def __setitem__(self, key, value):
+        self.data[key] = value
+    def items(self):
+        return self.data.items()
+    def keys(self):
+        return self.data.keys()
+    def pop(self, key):
+        if key in self.keys():
+            return self.data.pop(key)
+        else:
+            raise KeyError("Could not find key {}".format(key))
+    def write(self):
+        with open(self.filename+".tmp", 'w') as fid:
+            round_trip_dump(self.data, fid)
+        # Upon success
+        move(self.filename+".tmp", self.filename)
+
+class Loader(yaml.RoundTripLoader):
+    def __init__(self, stream):
+        try:
+            self._root = os.path.split(stream.name)[0]
+        except AttributeError:
+            self._root = os.path.curdir
+        super().__init__(stream)
+        self.filenames = []
+
+    def include(self, node):
+        shortname = self.construct_scalar(node)
+        filename = os.path.abspath(os.path.join(
+            self._root, shortname
+        ))
+        self.filenames.append(filename)
+        return Include(filename)
+
+class Dumper(yaml.RoundTripDumper):
+    def include(self, data):
+        data.write()
+        return self.represent_scalar(u'!include', data.filename)
+
+def round_trip_dump(data, stream):
+    """Dump keeping comments, which the legacy RoundTripDumper of recent
+    versions of ruamel silently drops"""
+    if hasattr(yaml, 'YAML'):
+        dumper = yaml.YAML()
+        dumper.default_flow_style = None
+        dumper.representer.add_representer(Include, Dumper.include)
+        dumper.dump(data, stream)
+    else:
+        Dumper.add_representer(Include, Dumper.include)
+        yaml.dump(data, stream, Dumper=Dumper)
+
+def yaml_load(filename):
+    with open(filename, 'r') as fid:
+        Loader.add_constructor('!include', Loader.include)
+        load = Loader(fid)
+        code = load.get_single_data()
+        filenames = load.filenames
+        load.dispose()
+    filenames.append(os.path.abspath(filename))
+    dirname = os.path.dirname(filename)
+    return code, filenames, dirname
+
+def yaml_dump(data, filename):
+    with open(filename+".tmp", 'w') as fid:
+        round_trip_dump(data, fid)
+    # Upon success
+    move(filename+".tmp", filename)
@@ -24,46 +24,60 @@ class Connector(QGraphicsEllipseItem):
         self.wires_in  = []
         self.wires_out = []
 
-        # Text label and area
-        self.label = QGraphicsTextItem(self.name, parent=self)
-        self.label.setDefaultTextColor(Qt.black)
-
-        if self.connector_type == 'output':
-            self.label.setPos(-5-self.label.boundingRect().topRight().x(),-10)      
-            self.setBrush(Qt.white)
-            self.setPen(QColor(50,50,50))
-        else:
-            self.label.setPos(5,-10)      
-            self.setBrush(Qt.white)
-            self.setPen(QColor(50,50,50))
+        # Text label, painted by the node alongside the connector
+        self.label = static_text(self.name)
+        self.setBrush(Qt.white)
+        self.setPen(QColor(50,50,50))
 
         # Associate with auspex connectors
         self.auspex_object = None
 
-        # self.timeline = QTimeLine()
+        # Persistent explode/implode animations, rebuilt only when the
+        # incoming wires or the order of their sources change.
         self.wire_anim_group = QParallelAnimationGroup()
         self.exploded = False
         self.wires_to_anims = {}
+        self.wire_dummies = []
+        self.wire_offsets = np.zeros((0, 2))
+        self.wire_key = None
+
+    def rebuild_wire_anims(self, wires):
+        self.wire_anim_group.stop()
+        self.wire_anim_group.clear()
+        self.wires_to_anims = {}
+        self.wire_dummies = []
+
+        # Fan the wire ends out over an arc in the given order, which is by the
+        # height of their source nodes
+        rad = 18
+        angles = np.linspace(np.pi/6.0, 5.0*np.pi/6.0, len(wires))
+        self.wire_offsets = -rad*np.column_stack((np.sin(angles), np.cos(angles)))
+
+        for wire in wires:
+            wire_dummy = dummy_object_QPointF(lambda w=wire: w.end, wire.set_end)
+            anim = QPropertyAnimation(wire_dummy, bytes("dummy".encode("ascii")))
+            anim.setEasingCurve(QEasingCurve.OutQuad)
+            anim.setDuration(150)
+            self.wire_anim_group.addAnimation(anim)
+            self.wires_to_anims[wire] = anim
+            self.wire_dummies.append(wire_dummy)
+        self.wire_key = tuple(wires)
 
     def explode_wires(self):
         if not self.exploded and self.wire_anim_group.state() == QAbstractAnimation.Stopped:
-            self.wires_to_anims = {}
-            self.wire_anim_group.clear()
-            self.wire_anim_group.setDirection(QAbstractAnimation.Forward)
+            # Sources may have moved since the last explode, which reorders the fan
             wires = sorted([w for w in self.wires_in if w.end_obj is not None], key=lambda c: c.start_obj.parent.y())
-            start = np.pi/6.0
-            norm_fac = (np.pi-2*start)/(len(wires)-1)
-            for j, wire in enumerate(wires):
-                rad = 18 #5 + 5*len(wires)
-                offset = QPointF(-rad*np.sin(start + j*norm_fac), -rad*np.cos(start + j*norm_fac))
-                wire_dummy = dummy_object_QPointF(wire.end_image.pos, wire.set_end)
-                anim = QPropertyAnimation(wire_dummy, bytes("dummy".encode("ascii")))
-                anim.setEasingCurve(QEasingCurve.OutQuad)
-                anim.setDuration(150)
-                anim.setStartValue(self.scenePos())
-                anim.setEndValue(self.scenePos() + offset)
-                self.wire_anim_group.addAnimation(anim)
-                self.wires_to_anims[wire] = anim
+            if tuple(wires) != self.wire_key:
+                self.rebuild_wire_anims(wires)
+
+            # Only the endpoints need refreshing since the connector may have moved
+            center = self.scenePos()
+            for j in range(self.wire_anim_group.animationCount()):
+                anim = self.wire_anim_group.animationAt(j)
+                anim.setStartValue(center)
+                anim.setEndValue(center + QPointF(*self.wire_offsets[j]))
+
+            self.wire_anim_group.setDirection(QAbstractAnimation.Forward)
             self.wire_anim_group.start()
             self.exploded = True
         if not self.exploded and self.wire_anim_group.state() == QAbstractAnimation.Running:
@@ -72,11 +86,12 @@ class Connector(QGraphicsEllipseItem):
             self.wire_anim_group.resume()
 
     def implode_wires(self):
-        for wire in self.wires_to_anims.copy().keys():
-            if wire not in self.wires_in:
-                if not wire.end_obj:
-                    self.wire_anim_group.removeAnimation(self.wires_to_anims[wire])
-                    self.wires_to_anims.pop(wire)
+        # Wires unhooked while exploded no longer animate; the pool is
+        # rebuilt on the next explode.
+        for wire in list(self.wires_to_anims.keys()):
+            if wire not in self.wires_in and not wire.end_obj:
+                self.wire_anim_group.removeAnimation(self.wires_to_anims.pop(wire))
+                self.wire_key = None
 
         if self.exploded and self.wire_anim_group.state() == QAbstractAnimation.Stopped:
             self.wire_anim_group.setDirection(QAbstractAnimation.Backward)
@@ -89,7 +104,14 @@ class Connector(QGraphicsEllipseItem):
         self.exploded = False
 
     def width(self):
-        return self.label.boundingRect().topRight().x()
+        # Including the margins of the text items this replaces
+        return self.label.size().width() + 8
+
+    def label_pos(self):
+        """Top left of the label in the coordinates of the node"""
+        if self.connector_type == 'output':
+            return self.pos() + QPointF(-9-self.label.size().width(), -6)
+        return self.pos() + QPointF(9, -6)
 
     def height(self):
         return 15
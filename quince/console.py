@@ -0,0 +1,74 @@
+# coding: utf-8
+# Raytheon BBN Technologies 2016
+# Contributiors: Graham Rowlands
+#
+# This file contains the embedded python console
+
+from qtpy.QtGui import *
+from qtpy.QtCore import *
+from qtpy.QtWidgets import *
+
+import code
+import io
+from contextlib import redirect_stdout, redirect_stderr
+
+class ConsoleDock(QDockWidget):
+    """Python console running in the app, with the names in namespace
+    available to the commands entered."""
+    def __init__(self, namespace, parent=None):
+        super(ConsoleDock, self).__init__("Console", parent=parent)
+        self.interpreter = code.InteractiveConsole(namespace)
+        self.history = []
+        self.history_index = 0
+
+        self.output = QPlainTextEdit(self)
+        self.output.setReadOnly(True)
+        self.output.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.output.setMaximumBlockCount(5000)
+        self.prompt = QLabel(">>>", self)
+        self.prompt.setFont(self.output.font())
+        self.input = QLineEdit(self)
+        self.input.setFont(self.output.font())
+        self.input.returnPressed.connect(self.run)
+        self.input.installEventFilter(self)
+
+        line = QHBoxLayout()
+        line.addWidget(self.prompt)
+        line.addWidget(self.input)
+        layout = QVBoxLayout()
+        layout.setContentsMargins(2,2,2,2)
+        layout.addWidget(self.output)
+        layout.addLayout(line)
+        widget = QWidget(self)
+        widget.setLayout(layout)
+        self.setWidget(widget)
+
+        self.write("Quince console. The canvas is available as graph, see quince.script.\n")
+
+    def write(self, text):
+        self.output.moveCursor(QTextCursor.End)
+        self.output.insertPlainText(text)
+        self.output.ensureCursorVisible()
+
+    def run(self):
+        line = self.input.text()
+        self.input.clear()
+        if line.strip():
+            self.history.append(line)
+        self.history_index = len(self.history)
+        self.write("{} {}\n".format(self.prompt.text(), line))
+
+        out = io.StringIO()
+        with redirect_stdout(out), redirect_stderr(out):
+            more = self.interpreter.push(line)
+        self.write(out.getvalue())
+        self.prompt.setText("..." if more else ">>>")
+
+    def eventFilter(self, obj, event):
+        # Up and down step through the history
+        if obj is self.input and event.type() == QEvent.KeyPress and event.key() in (Qt.Key_Up, Qt.Key_Down):
+            step = -1 if event.key() == Qt.Key_Up else 1
+            self.history_index = min(max(self.history_index + step, 0), len(self.history))
+            self.input.setText(self.history[self.history_index] if self.history_index < len(self.history) else "")
+            return True
+        return super(ConsoleDock, self).eventFilter(obj, event)
@@ -0,0 +1,243 @@
+# coding: utf-8
+# Raytheon BBN Technologies 2016
+# Contributiors: Graham Rowlands
+#
+# This file contains the structural comparison and three-way merging of
+# measurement libraries. Nodes are compared through a hash of their entry,
+# so that only the handful of nodes that actually differ are looked at in
+# any detail. It deliberately avoids Qt so that it can be used headlessly:
+#
+#   python -m quince.diff old.yml new.yml
+#   python -m quince.diff base.yml ours.yml theirs.yml -o merged.yml
+
+import sys
+import argparse
+from collections import OrderedDict
+
+from .config import *
+from .pipeline import *
+
+ADDED    = "added"
+REMOVED  = "removed"
+CHANGED  = "changed"
+CONFLICT = "conflict"
+
+class Missing(object):
+    """Stands in for a key that an entry does not have"""
+    def __repr__(self):
+        return "<missing>"
+
+MISSING = Missing()
+
+# Values that a missing key stands for, as the canvas always writes these out
+DEFAULTS = {'enabled': True}
+
+class NodeDiff(object):
+    """Difference of a single node between two versions. params maps each
+    changed key, other than the source, to its (old, new) values, and the
+    source edges are given as (node name, connector name) pairs."""
+    def __init__(self, name, status, node_type=None, params=None, added_sources=(), removed_sources=()):
+        self.name            = name
+        self.status          = status
+        self.type            = node_type
+        self.params          = params or OrderedDict()
+        self.added_sources   = list(added_sources)
+        self.removed_sources = list(removed_sources)
+
+    def summary(self):
+        if self.status != CHANGED:
+            return self.status
+        changes = ["{} {!r} -> {!r}".format(k, o, n) for k, (o, n) in self.params.items()]
+        changes += ["source +" + format_source([s]) for s in self.added_sources]
+        changes += ["source -" + format_source([s]) for s in self.removed_sources]
+        return "; ".join(changes)
+
+    def is_empty(self):
+        return len(self.params) + len(self.added_sources) + len(self.removed_sources) == 0
+
+class Conflict(object):
+    """Key of a node that was changed differently on both sides of a merge.
+    A key of None means that one side removed the node and the other
+    changed it."""
+    def __init__(self, name, key, base, ours, theirs):
+        self.name   = name
+        self.key    = key
+        self.base   = base
+        self.ours   = ours
+        self.theirs = theirs
+
+    def marker(self):
+        if self.key is None:
+            return "<<<<<<< ours {} ======= theirs {} >>>>>>>".format(self.ours, self.theirs)
+        return "<<<<<<< ours {!r} ||||||| base {!r} ======= theirs {!r} >>>>>>>".format(
+            self.ours, self.base, self.theirs)
+
+def load_entries(filename):
+    """Settings and pipeline entries of a measurement file, including any
+    filters and instruments pulled in through !include."""
+    settings, _, _ = yaml_load(filename)
+    return settings, settings_entries(settings)
+
+def entry_fingerprints(entries):
+    return {name: fingerprint(entry) for name, (entry, is_instrument) in entries.items()}
+
+def value_of(entry, key):
+    return plain(entry[key]) if key in entry else DEFAULTS.get(key, MISSING)
+
+def entry_diff(name, old, new):
+    """NodeDiff between two entries of the same node"""
+    params = OrderedDict()
+    for k in list(old.keys()) + [k for k in new.keys() if k not in old]:
+        if k == 'source':
+            continue
+        o, n = value_of(old, k), value_of(new, k)
+        if o != n:
+            params[k] = (o, n)
+    old_sources = parse_source(old.get('source', ""))
+    new_sources = parse_source(new.get('source', ""))
+    return NodeDiff(name, CHANGED, new.get('type'), params,
+                    [s for s in new_sources if s not in old_sources],
+                    [s for s in old_sources if s not in new_sources])
+
+def same_entry(old, new, old_fingerprint=None, new_fingerprint=None):
+    """Whether two entries of a node, either of which may be None for a
+    missing node, mean the same thing. Entries that only differ in formatting
+    or in values that are left at their defaults are the same."""
+    if old is None or new is None:
+        return old is new
+    if old_fingerprint is not None and old_fingerprint == new_fingerprint:
+        return True
+    return entry_diff(None, old, new).is_empty()
+
+def diff_entries(old, new, old_fingerprints=None, new_fingerprints=None):
+    """Ordered name -> NodeDiff of the nodes that were added, removed or
+    changed going from the old to the new entries. Fingerprints that are
+    already known, e.g. from a Pipeline, can be passed in."""
+    old_fingerprints = old_fingerprints or entry_fingerprints(old)
+    new_fingerprints = new_fingerprints or entry_fingerprints(new)
+    diffs = OrderedDict()
+    for name, (entry, is_instrument) in new.items():
+        if name not in old:
+            diffs[name] = NodeDiff(name, ADDED, entry.get('type'))
+        elif old_fingerprints[name] != new_fingerprints[name]:
+            # Hashes also differ on formatting, e.g. the spacing of sources
+            diff = entry_diff(name, old[name][0], entry)
+            if not diff.is_empty():
+                diffs[name] = diff
+    for name, (entry, is_instrument) in old.items():
+        if name not in new:
+            diffs[name] = NodeDiff(name, REMOVED, entry.get('type'))
+    return diffs
+
+def merge_sources(base, ours, theirs):
+    """Edges are merged as sets, so that edges added or removed on either
+    side never conflict."""
+    base, ours, theirs = [parse_source(s) for s in (base, ours, theirs)]
+    merged  = [s for s in ours if s in theirs or s not in base]
+    merged += [s for s in theirs if s not in ours and s not in base]
+    return format_source(merged)
+
+def merge_entry(name, base, ours, theirs):
+    """Merge a node that was changed on both sides, key by key. Conflicting
+    keys keep our value. Returns the merged entry and the conflicts."""
+    merged, conflicts = OrderedDict(), []
+    for k in list(ours.keys()) + [k for k in theirs.keys() if k not in ours]:
+        if k == 'source':
+            merged[k] = merge_sources(base.get(k, ""), ours.get(k, ""), theirs.get(k, ""))
+            continue
+        b, o, t = value_of(base, k), value_of(ours, k), value_of(theirs, k)
+        if o == t or t == b:
+            choice = ours
+        elif o == b:
+            choice = theirs
+        else:
+            conflicts.append(Conflict(name, k, b, o, t))
+            choice = ours if o is not MISSING else theirs
+        if k in choice:
+            merged[k] = choice[k]
+    if 'source' in merged and not merged['source'] and 'source' not in ours:
+        merged.pop('source')
+    return merged, conflicts
+
+def merge_entries(base, ours, theirs):
+    """Three-way merge of the node entries (name -> (entry, is_instrument)).
+    Nodes that were only changed on one side are taken from that side, and
+    nodes changed on both sides are merged key by key. Returns the merged
+    entries, in our order followed by the nodes only added by them, and the
+    list of conflicts. Whether a side changed a node is decided on the
+    meaning of the entries rather than on their formatting."""
+    fingerprints = [entry_fingerprints(e) for e in (base, ours, theirs)]
+    merged, conflicts = OrderedDict(), []
+    for name in list(ours.keys()) + [n for n in theirs.keys() if n not in ours]:
+        b, o, t = [e[name][0] if name in e else None for e in (base, ours, theirs)]
+        fb, fo, ft = [f.get(name) for f in fingerprints]
+        if same_entry(b, t, fb, ft) or same_entry(o, t, fo, ft):
+            if o is not None:
+                merged[name] = ours[name]
+        elif same_entry(b, o, fb, fo):
+            if t is not None:
+                merged[name] = theirs[name]
+        elif o is None or t is None:
+            # Removed on one side and changed on the other, so keep the change
+            conflicts.append(Conflict(name, None, None,
+                                      REMOVED if o is None else CHANGED,
+                                      REMOVED if t is None else CHANGED))
+            merged[name] = theirs[name] if o is None else ours[name]
+        else:
+            entry, node_conflicts = merge_entry(name, base[name][0] if name in base else {},
+                                                ours[name][0], theirs[name][0])
+            merged[name] = (entry, ours[name][1])
+            conflicts.extend(node_conflicts)
+    return merged, conflicts
+
+def mark_conflicts(settings, entries, conflicts):
+    """Add a conflict marker comment next to every conflicting key, or next
+    to the type of a node that was removed on one side."""
+    for c in conflicts:
+        section = settings["instruments" if entries[c.name][1] else "filters"]
+        entry = section[c.name]
+        if not hasattr(entry, 'yaml_add_eol_comment'):
+            # New entries are plain dictionaries, which can't hold comments
+            entry = section[c.name] = yaml.comments.CommentedMap(entry.items())
+        key = c.key if c.key is not None else 'type'
+        if key in entry:
+            entry.yaml_add_eol_comment(c.marker(), key)
+
+def merge_files(base_file, ours_file, theirs_file, output=None):
+    """Merge theirs into ours and write the result to output, which defaults
+    to our file. Included files are written in place, as when saving from the
+    app. Returns the conflicts."""
+    _, base = load_entries(base_file)
+    settings, ours = load_entries(ours_file)
+    _, theirs = load_entries(theirs_file)
+    merged, conflicts = merge_entries(base, ours, theirs)
+    update_settings(settings, merged, exact=True)
+    mark_conflicts(settings, merged, conflicts)
+    yaml_dump(settings, output or ours_file)
+    return conflicts
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two measurement libraries, or merge three of them.")
+    parser.add_argument('filenames', type=str, nargs='+', help='old new, or base ours theirs')
+    parser.add_argument('-o', '--output', type=str, help='Merged library filename, defaults to ours')
+    args = parser.parse_args()
+
+    if len(args.filenames) == 2:
+        diffs = diff_entries(load_entries(args.filenames[0])[1], load_entries(args.filenames[1])[1])
+        for d in diffs.values():
+            mark = {ADDED: "+", REMOVED: "-", CHANGED: "~"}[d.status]
+            if d.status == CHANGED:
+                print("{} {} ({}): {}".format(mark, d.name, d.type, d.summary()))
+            else:
+                print("{} {} ({})".format(mark, d.name, d.type))
+        return 1 if len(diffs) > 0 else 0
+    elif len(args.filenames) == 3:
+        conflicts = merge_files(*args.filenames, output=args.output)
+        for c in conflicts:
+            print("conflict: {} {}".format(c.name, c.key if c.key is not None else "(removed)"))
+        print("{} conflicts".format(len(conflicts)))
+        return 1 if len(conflicts) > 0 else 0
+    parser.error("Expected two files to compare or three files to merge")
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,194 @@
+# coding: utf-8
+# Raytheon BBN Technologies 2016
+# Contributiors: Graham Rowlands
+#
+# This file contains the headless compilation of a measurement pipeline
+# into an Auspex experiment graph
+
+import os, os.path
+import sys
+import json
+import argparse
+from collections import OrderedDict
+
+from .config import *
+from .catalog import *
+from .pipeline import *
+
+if not NO_AUSPEX:
+    from auspex.experiment import Experiment
+    from auspex.stream import OutputConnector
+
+def enabled_branches(pipeline):
+    """Group the enabled filters by the set of enabled digitizers feeding them.
+    Data only flows through enabled nodes, so disabled nodes cut the branch."""
+    digitizers = [n.name for n in pipeline.nodes.values() if n.is_instrument and n.enabled]
+    feeders = {}
+    for digitizer in digitizers:
+        seen  = set()
+        stack = [digitizer]
+        while stack:
+            for consumer in pipeline.downstream(stack.pop()):
+                if consumer not in seen and pipeline[consumer].enabled:
+                    seen.add(consumer)
+                    stack.append(consumer)
+        for name in seen:
+            feeders.setdefault(name, set()).add(digitizer)
+
+    branches = OrderedDict()
+    for name in pipeline.nodes:
+        if name in feeders:
+            branches.setdefault(frozenset(feeders[name]), []).append(name)
+    return digitizers, branches
+
+class CompiledBranch(object):
+    """Auspex filters instantiated for the nodes fed by one set of digitizers"""
+    def __init__(self, key, filters):
+        self.key     = key
+        self.filters = filters
+
+class ExperimentCompiler(object):
+    """Turns a Pipeline into an Auspex Experiment without any graphics items.
+
+    Filters are instantiated per branch, i.e. for the nodes fed by a given
+    digitizer (or set of digitizers). A branch whose nodes are unchanged
+    since the last compile reuses its filters, so after an edit only the
+    affected branches are instantiated again."""
+    def __init__(self, catalog=None):
+        self.loaded_catalog = catalog
+        self.branches = {}
+
+    @property
+    def catalog(self):
+        # Shared with the validator through load_catalog, and only loaded once needed
+        if self.loaded_catalog is None:
+            self.loaded_catalog = load_catalog()
+        return self.loaded_catalog
+
+    def compile(self, pipeline):
+        if NO_AUSPEX:
+            raise Exception("Auspex is required to construct an experiment.")
+
+        exp = Experiment()
+        digitizers, branches = enabled_branches(pipeline)
+
+        # Add output connectors to the experiment
+        outputs = {}
+        for name in digitizers:
+            conn = OutputConnector(name=name, data_name=name, parent=exp)
+            exp.output_connectors[name] = conn
+            setattr(exp, name, conn)
+            outputs[name] = conn
+
+        filters  = {}
+        compiled = {}
+        for feeders, names in branches.items():
+            key = tuple((name, pipeline[name].fingerprint) for name in names)
+            branch = self.branches.get(feeders)
+            if branch is None or branch.key != key:
+                branch = CompiledBranch(key, {name: self.instantiate(pipeline[name]) for name in names})
+            else:
+                for filt in branch.filters.values():
+                    reset_connectors(filt)
+            compiled[feeders] = branch
+            filters.update(branch.filters)
+        self.branches = compiled
+
+        graph = []
+        for source_name, conn_name, sink_name in pipeline.edges():
+            if sink_name not in filters:
+                continue
+            if source_name in outputs:
+                start = outputs[source_name]
+            elif source_name in filters:
+                start = filters[source_name].output_connectors[conn_name]
+            else:
+                continue
+            graph.append((start, filters[sink_name].input_connectors['sink']))
+        exp.set_graph(graph)
+        return exp
+
+    def instantiate(self, node):
+        spec = self.catalog.get(node.type)
+        if spec is None:
+            raise Exception("Unknown filter type {} for {}".format(node.type, node.name))
+        filt = spec.cls()
+        filt.name = node.name
+        for auspex_param in filt.quince_parameters:
+            if auspex_param.name in node.params:
+                auspex_param.value = node.params[auspex_param.name]
+        return filt
+
+def reset_connectors(filt):
+    # Streams are attached by Experiment.set_graph, so drop the ones from the
+    # previous experiment before reusing a filter.
+    for conn in filt.input_connectors.values():
+        conn.input_streams = []
+    for conn in filt.output_connectors.values():
+        conn.output_streams = []
+
+def cache_filename(meas_file):
+    dirname, basename = os.path.split(os.path.abspath(meas_file))
+    return os.path.join(dirname, "." + basename + ".quince-graph.json")
+
+def file_stamps(filenames):
+    return [[f, os.path.getmtime(f), os.path.getsize(f)] for f in sorted(set(filenames))]
+
+def load_pipeline(meas_file, use_cache=True):
+    """Pipeline for a measurement file. The parsed entries are cached next to
+    the file, so that as long as none of the yaml files (including those
+    pulled in through !include) have changed, they need not be parsed again."""
+    cache = cache_filename(meas_file)
+    if use_cache and os.path.exists(cache):
+        try:
+            with open(cache, 'r') as f:
+                cached = json.load(f)
+            if cached["files"] == file_stamps(name for name, _, _ in cached["files"]):
+                pipeline = Pipeline()
+                pipeline.sync(OrderedDict((n, (e, i)) for n, e, i in cached["entries"]))
+                return pipeline
+        except (OSError, ValueError, KeyError):
+            pass
+
+    settings, filenames, _ = yaml_load(meas_file)
+    entries  = settings_entries(settings)
+    pipeline = Pipeline()
+    pipeline.sync(entries)
+
+    if use_cache:
+        try:
+            with open(cache+".tmp", 'w') as f:
+                json.dump({"files": file_stamps(filenames),
+                           "entries": [[n, plain(e), i] for n, (e, i) in entries.items()]}, f)
+            os.replace(cache+".tmp", cache)
+        except OSError as e:
+            print("Could not write the pipeline cache: {}".format(str(e)))
+    return pipeline
+
+def compile_file(meas_file, use_cache=True, compiler=None):
+    compiler = ExperimentCompiler() if compiler is None else compiler
+    return compiler.compile(load_pipeline(meas_file, use_cache=use_cache))
+
+def main():
+    parser = argparse.ArgumentParser(description="Construct the Auspex experiment graph without the GUI.")
+    parser.add_argument('filename', type=str, help='Measurement library filename')
+    parser.add_argument('--no-cache', action='store_true', help='Always reparse the yaml files')
+    args = parser.parse_args()
+
+    pipeline = load_pipeline(args.filename, use_cache=not args.no_cache)
+    digitizers, branches = enabled_branches(pipeline)
+    active = set().union(*branches.values())
+    for source_name, conn_name, sink_name in pipeline.edges():
+        if sink_name in active:
+            print("{} {} -> {}".format(source_name, conn_name, sink_name))
+
+    if NO_AUSPEX:
+        print("Auspex is not available, so only the graph could be checked.")
+        return 1
+    compiler = ExperimentCompiler()
+    compiler.compile(pipeline)
+    print("Constructed experiment with {} filters from {} digitizers.".format(len(active), len(digitizers)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,7 +7,9 @@
 import networkx as nx
 
 def generate_graph(wires, dag=False):
-    edges = [(w.start_obj.parent.label.toPlainText(), w.end_obj.parent.label.toPlainText()) for w in wires]
+    # Wires into or out of a collapsed group connect to the group itself
+    edges = [((w.start_proxy or w.start_obj).parent.label.toPlainText(),
+              (w.end_proxy or w.end_obj).parent.label.toPlainText()) for w in wires]
     if dag:
         graph = nx.DiGraph()
     else:
@@ -29,6 +31,11 @@ def graph_input_nodes(graph):
     return [n for n in graph.nodes() if graph.in_degree(n) == 0]
 
 def create_experiment_graph(nodes, wires):
+    # Construct directly from the scene items. See quince.experiment for
+    # the headless equivalent.
+    from auspex.experiment import Experiment
+    from auspex.stream import OutputConnector
+
     exp = Experiment()
 
     # Add output connectors to the experiment
@@ -44,8 +51,6 @@ def create_experiment_graph(nodes, wires):
     for wire in wires:
         graph.append((wire.start_obj.auspex_object, wire.end_obj.auspex_object))
     exp.set_graph(graph)
-
-    print(exp)
     return exp
 
 def hierarchy_pos(G, root, width=600., vert_gap = 175, vert_loc = 0, xcenter = 0.0, 
@@ -0,0 +1,148 @@
+# coding: utf-8
+# Raytheon BBN Technologies 2016
+# Contributiors: Graham Rowlands
+#
+# This file contains the group nodes that stand in for collapsed subgraphs
+
+from qtpy.QtGui import *
+from qtpy.QtCore import *
+from qtpy.QtWidgets import *
+
+from .node import *
+from .conn import *
+
+class GroupNode(Node):
+    """Stands in for a collapsed subgraph. The member nodes and the wires
+    between them are taken out of the scene entirely. Wires crossing the
+    boundary stay attached to the member connectors, so the members still
+    report their sources when saved, but are drawn to a connector of the
+    group instead."""
+    def __init__(self, members, scene):
+        super(GroupNode, self).__init__("Group", scene)
+        self.members = list(members)
+        self.bg_color = self.default_bg_color = QColor(225,230,245,235)
+        self.title_color = self.default_title_color = QColor(70,90,130)
+
+        member_set = set(self.members)
+        self.internal_wires = []
+        self.boundary_wires = [] # (wire, proxy connector)
+        proxies = {}
+
+        def proxy_for(conn, conn_type):
+            if conn not in proxies:
+                proxy = Connector("{} {}".format(conn.parent.label.toPlainText(), conn.name), conn_type)
+                # Wires can't be started from or dropped onto a proxy
+                proxy.setEnabled(False)
+                if conn_type == 'output':
+                    self.add_output(proxy)
+                else:
+                    self.add_input(proxy)
+                proxies[conn] = proxy
+            return proxies[conn]
+
+        for member in self.members:
+            for conn in member.outputs.values():
+                for w in conn.wires_out:
+                    if w.end_obj is not None and w.end_obj.parent in member_set:
+                        self.internal_wires.append(w)
+                    elif w.end_obj is not None:
+                        proxy = proxy_for(conn, 'output')
+                        proxy.wires_out.append(w)
+                        self.boundary_wires.append((w, proxy))
+            for conn in list(member.inputs.values()) + list(member.parameters.values()):
+                for w in conn.wires_in:
+                    if w.start_obj.parent not in member_set:
+                        proxy = proxy_for(conn, 'input')
+                        proxy.wires_in.append(w)
+                        self.boundary_wires.append((w, proxy))
+        self.update_min_width()
+
+        # Sit at the center of the members, and move them along on expanding
+        center = sum((m.pos() for m in self.members), QPointF())/max(1, len(self.members))
+        self.setPos(center)
+        self.collapsed_at = center
+
+    def all_members(self):
+        """Member nodes, looking inside any nested groups"""
+        nodes = []
+        for m in self.members:
+            nodes.extend(m.all_members() if isinstance(m, GroupNode) else [m])
+        return nodes
+
+    def release_store_row(self):
+        for m in self.members:
+            m.release_store_row()
+
+    def restore_store_row(self):
+        for m in self.members:
+            m.restore_store_row()
+
+    def collapse(self):
+        for w in self.internal_wires:
+            self.scene.removeItem(w)
+        for m in self.members:
+            m.setSelected(False)
+            self.scene.removeItem(m)
+        self.scene.addItem(self)
+        for w, proxy in self.boundary_wires:
+            if proxy.connector_type == 'output':
+                w.start_proxy = proxy
+                w.set_start(proxy.scenePos())
+            else:
+                w.end_proxy = proxy
+                w.set_end(proxy.scenePos())
+        self.collapsed_at = self.pos()
+
+    def expand(self):
+        offset = self.pos() - self.collapsed_at
+        self.setSelected(False)
+        self.scene.removeItem(self)
+        for m in self.members:
+            self.scene.addItem(m)
+            m.setPos(m.pos() + offset)
+            m.setSelected(True)
+        for w in self.internal_wires:
+            self.scene.addItem(w)
+        for w, proxy in self.boundary_wires:
+            w.start_proxy = None
+            w.end_proxy = None
+            w.set_start(w.start_obj.scenePos())
+            w.set_end(w.end_obj.scenePos())
+
+    def mouseDoubleClickEvent(self, event):
+        if event.pos().y() < 20:
+            # Rename from the title bar
+            super(GroupNode, self).mouseDoubleClickEvent(event)
+        else:
+            self.scene.undo_stack.push(CommandExpandGroups([self], self.scene))
+
+class CommandGroupNodes(QUndoCommand):
+    def __init__(self, nodes, scene):
+        super(CommandGroupNodes, self).__init__("Group nodes {}".format(",".join([n.name for n in nodes])))
+        self.scene = scene
+        self.group = GroupNode(nodes, scene)
+        node_names = [i.label.toPlainText() for i in scene.all_nodes()]
+        node_names.extend([i.label.toPlainText() for i in scene.items() if isinstance(i, GroupNode)])
+        self.group.label.setPlainText(next_available_name(node_names, "Group"))
+
+    def redo(self):
+        self.group.collapse()
+        self.group.setSelected(True)
+
+    def undo(self):
+        self.group.expand()
+
+class CommandExpandGroups(QUndoCommand):
+    def __init__(self, groups, scene):
+        super(CommandExpandGroups, self).__init__("Expand groups {}".format(",".join([g.label.toPlainText() for g in groups])))
+        self.scene  = scene
+        self.groups = groups
+
+    def redo(self):
+        for g in self.groups:
+            g.expand()
+
+    def undo(self):
+        for g in self.groups:
+            g.collapse()
+            g.setSelected(True)
@@ -0,0 +1,99 @@
+# coding: utf-8
+# Raytheon BBN Technologies 2016
+# Contributiors: Graham Rowlands
+#
+# This file contains the parsing of per-filter profiling logs, which are
+# read as a stream so that large logs never have to be held in memory.
+#
+# Logs may be csv with a header row, json lines, or a json array of
+# objects, each with the node label and some of the number of calls, the
+# total time, and the mean time (in seconds).
+
+import csv
+import json
+
+LABEL_KEYS = ('node', 'label', 'name', 'filter')
+CALLS_KEYS = ('calls', 'count', 'ncalls')
+TOTAL_KEYS = ('total', 'total_time', 'tottime', 'cumtime')
+MEAN_KEYS  = ('mean', 'mean_time', 'percall')
+
+def first_of(record, keys, default=None):
+    for k in keys:
+        if k in record and record[k] not in (None, ""):
+            return record[k]
+    return default
+
+def iter_json_array(f, chunk_size=1<<16):
+    """Yield the objects of a top level json array without loading the whole file"""
+    decoder = json.JSONDecoder()
+    buf = f.read(chunk_size).lstrip()
+    if not buf.startswith("["):
+        raise ValueError("Expected a json array")
+    buf = buf[1:]
+    while True:
+        buf = buf.lstrip().lstrip(",").lstrip()
+        if buf.startswith("]"):
+            return
+        try:
+            obj, end = decoder.raw_decode(buf)
+        except ValueError:
+            more = f.read(chunk_size)
+            if not more:
+                raise
+            buf += more
+            continue
+        yield obj
+        buf = buf[end:]
+        if len(buf) < chunk_size:
+            buf += f.read(chunk_size)
+
+def iter_records(filename):
+    with open(filename, 'r') as f:
+        start = f.read(1024).lstrip()
+        f.seek(0)
+        if start.startswith("["):
+            for record in iter_json_array(f):
+                yield record
+        elif start.startswith("{"):
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        else:
+            for record in csv.DictReader(f):
+                yield {k.strip().lower(): v for k, v in record.items() if k is not None}
+
+class NodeTiming(object):
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+
+    @property
+    def mean(self):
+        return self.total/self.calls if self.calls else 0.0
+
+def read_profile(filename):
+    """Dictionary of node label -> NodeTiming, summed over every record of the node"""
+    timings = {}
+    for record in iter_records(filename):
+        if not isinstance(record, dict):
+            # e.g. a bare number or a nested array, which names no node
+            continue
+        label = first_of(record, LABEL_KEYS)
+        if label is None:
+            continue
+        calls = int(float(first_of(record, CALLS_KEYS, 0)))
+        total = first_of(record, TOTAL_KEYS)
+        if total is None:
+            total = float(first_of(record, MEAN_KEYS, 0.0))*calls
+        timing = timings.setdefault(str(label), NodeTiming())
+        timing.calls += calls
+        timing.total += float(total)
+    return timings
+
+def time_shares(timings):
+    """Fraction of the total pipeline time spent in each node"""
+    total = sum(t.total for t in timings.values())
+    if total <= 0:
+        return {label: 0.0 for label in timings}
+    return {label: t.total/total for label, t in timings.items()}
@@ -8,6 +8,10 @@ from qtpy.QtGui import *
 from qtpy.QtCore import *
 from qtpy.QtWidgets import *
 
+from collections import OrderedDict
+
+from .search import rank_names
+
 class NodeListView(QListView):
     """List view with a node-centric model. Probably we'll 
     be doing some more custom work here, later."""
@@ -17,3 +21,261 @@ class NodeListView(QListView):
         self.model = QStandardItemModel(self)
         self.setModel(self.model)
         self.setDragDropMode(QListView.InternalMove)
+
+class NodeTableDock(QDockWidget):
+    """Dock holding a sortable table of nodes. Activating a row centers the
+    view on the corresponding node."""
+    def __init__(self, title, headers, window):
+        super(NodeTableDock, self).__init__(title, parent=window)
+        self.window = window
+        self.table = QTableWidget(0, len(headers), self)
+        self.table.setHorizontalHeaderLabels(headers)
+        self.table.setSortingEnabled(True)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.cellClicked.connect(self.row_clicked)
+        self.setWidget(self.table)
+
+    def set_rows(self, rows):
+        """Each row is a list of (display text, sort key) pairs, the first
+        of which must hold the node label."""
+        self.table.setSortingEnabled(False)
+        self.table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            for j, (text, key) in enumerate(row):
+                item = SortableItem(text, key)
+                self.table.setItem(i, j, item)
+        self.table.setSortingEnabled(True)
+
+    def row_clicked(self, row, column):
+        label = self.table.item(row, 0).text()
+        self.window.view.center_on_label(label)
+
+class SortableItem(QTableWidgetItem):
+    """Table item that sorts on a separate key, e.g. a number behind a formatted string"""
+    def __init__(self, text, key):
+        super(SortableItem, self).__init__(text)
+        self.key = key
+
+    def __lt__(self, other):
+        if isinstance(other, SortableItem):
+            return self.key < other.key
+        return super(SortableItem, self).__lt__(other)
+
+class SearchDock(QDockWidget):
+    """Search box over the labels, types, and parameter values of the nodes.
+    The index is only brought up to date after the scene settles, never
+    while typing."""
+    def __init__(self, window, index, limit=500):
+        super(SearchDock, self).__init__("Find Nodes", parent=window)
+        self.window  = window
+        self.index   = index
+        self.limit   = limit
+        self.matches = []
+
+        self.search_box = QLineEdit(self)
+        self.search_box.setPlaceholderText("Label, type, or parameter value")
+        self.search_box.setClearButtonEnabled(True)
+        self.search_box.textChanged.connect(self.search)
+        self.search_box.returnPressed.connect(self.select_all_matches)
+
+        self.results = QListWidget(self)
+        self.results.itemClicked.connect(self.result_clicked)
+        self.results.itemActivated.connect(self.result_clicked)
+
+        self.select_button = QPushButton("Select All Matches", self)
+        self.select_button.clicked.connect(self.select_all_matches)
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(2,2,2,2)
+        layout.addWidget(self.search_box)
+        layout.addWidget(self.results)
+        layout.addWidget(self.select_button)
+        widget = QWidget(self)
+        widget.setLayout(layout)
+        self.setWidget(widget)
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(500)
+        self.timer.timeout.connect(self.scene_changed)
+        self.window.scene.changed.connect(self.schedule)
+
+    def activate(self):
+        self.show()
+        self.window.scene.sync_pipeline()
+        self.search_box.setFocus()
+        self.search_box.selectAll()
+        self.search()
+
+    def schedule(self, regions=None):
+        if self.isVisible() and not self.timer.isActive():
+            self.timer.start()
+
+    def scene_changed(self):
+        if len(self.window.scene.sync_pipeline()) > 0:
+            self.search()
+
+    def search(self, text=None):
+        self.matches = self.index.search(self.search_box.text())
+        self.results.clear()
+        self.results.addItems(self.matches[:self.limit])
+        if len(self.matches) > self.limit:
+            self.results.addItem("... {} more".format(len(self.matches) - self.limit))
+
+    def result_clicked(self, item):
+        if item.text() in self.index.terms:
+            self.window.view.center_on_label(item.text())
+
+    def select_all_matches(self):
+        if len(self.matches) == 0:
+            return
+        scene = self.window.scene
+        nodes_by_label = {n.label.toPlainText(): n for n in scene.all_nodes()}
+        # Matches hidden inside a collapsed group select the group instead
+        groups = {}
+        for item in scene.items():
+            if hasattr(item, 'all_members'):
+                for member in item.all_members():
+                    groups[member] = item
+        scene.clearSelection()
+        selected = [nodes_by_label[name] for name in self.matches if name in nodes_by_label]
+        for node in selected:
+            groups.get(node, node).setSelected(True)
+        self.window.set_status("Selected {} nodes.".format(len(selected)))
+
+class NodePalette(QDialog):
+    """Popup for finding a node type by typing part of its name. Emits
+    chosen with the type name."""
+    chosen = Signal(str)
+
+    def __init__(self, names, categories, parent=None):
+        super(NodePalette, self).__init__(parent, Qt.Popup)
+        self.names      = names
+        self.categories = categories
+        self.recent     = []
+        self.resize(320, 360)
+
+        self.search_box = QLineEdit(self)
+        self.search_box.setPlaceholderText("Node type")
+        self.search_box.textChanged.connect(self.refresh)
+        self.search_box.returnPressed.connect(self.choose)
+
+        self.results = QListWidget(self)
+        self.results.itemActivated.connect(self.choose)
+        self.results.itemClicked.connect(self.choose)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(2,2,2,2)
+        layout.addWidget(self.search_box)
+        layout.addWidget(self.results)
+
+    def open_at(self, position, recent=()):
+        self.recent = list(recent)
+        self.search_box.clear()
+        self.refresh()
+        self.move(position)
+        self.show()
+        self.search_box.setFocus()
+
+    def refresh(self, text=None):
+        self.results.clear()
+        for name in rank_names(self.search_box.text(), self.names, self.recent):
+            item = QListWidgetItem("{}    ({})".format(name, self.categories.get(name, "")))
+            item.setData(Qt.UserRole, name)
+            self.results.addItem(item)
+        self.results.setCurrentRow(0)
+
+    def keyPressEvent(self, event):
+        # Move through the results without leaving the search box
+        if event.key() in (Qt.Key_Up, Qt.Key_Down):
+            step = -1 if event.key() == Qt.Key_Up else 1
+            row = min(max(self.results.currentRow() + step, 0), self.results.count() - 1)
+            self.results.setCurrentRow(row)
+        else:
+            super(NodePalette, self).keyPressEvent(event)
+
+    def choose(self, item=None):
+        item = item or self.results.currentItem()
+        if item is not None:
+            self.accept()
+            self.chosen.emit(item.data(Qt.UserRole))
+
+class TemplateDialog(QDialog):
+    """Asks for a template, the number of copies, and a pattern for each of
+    its placeholders, in which {i} stands for the copy number."""
+    def __init__(self, templates, parent=None):
+        super(TemplateDialog, self).__init__(parent)
+        self.setWindowTitle("Instantiate Template")
+        self.templates = templates
+
+        self.template_box = QComboBox(self)
+        self.template_box.addItems(list(templates.keys()))
+        self.template_box.currentIndexChanged.connect(self.template_changed)
+        self.count_box = QSpinBox(self)
+        self.count_box.setRange(1, 4096)
+        self.count_box.setValue(8)
+        self.start_box = QSpinBox(self)
+        self.start_box.setRange(0, 1000000)
+        self.start_box.setValue(1)
+
+        self.form = QFormLayout(self)
+        self.form.addRow("Template", self.template_box)
+        self.form.addRow("Copies", self.count_box)
+        self.form.addRow("First {i}", self.start_box)
+        self.pattern_edits = OrderedDict()
+
+        self.buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel, parent=self)
+        self.buttons.accepted.connect(self.accept)
+        self.buttons.rejected.connect(self.reject)
+        self.form.addRow(self.buttons)
+        self.template_changed()
+
+    def template_changed(self, index=None):
+        for edit in self.pattern_edits.values():
+            self.form.removeRow(edit)
+        self.pattern_edits = OrderedDict()
+        template = self.templates[self.template_box.currentText()]
+        for i, placeholder in enumerate(template.placeholders):
+            edit = QLineEdit("q{i}" if placeholder == 'channel' else "", self)
+            self.form.insertRow(3+i, "${" + placeholder + "}", edit)
+            self.pattern_edits[placeholder] = edit
+
+    def result_values(self):
+        return (self.templates[self.template_box.currentText()], self.count_box.value(), self.start_box.value(),
+                {k: e.text() for k, e in self.pattern_edits.items()})
+
+class BulkEditDialog(QDialog):
+    """Asks for a parameter, given as (name, parameter class) pairs, and how
+    to change it on every selected node."""
+    modes = [("Set to", 'set'), ("Add offset", 'offset'), ("Expression of x, i, n", 'expression')]
+
+    def __init__(self, params, parent=None):
+        super(BulkEditDialog, self).__init__(parent)
+        self.setWindowTitle("Bulk Edit Parameters")
+        self.params = params
+
+        self.param_box = QComboBox(self)
+        for name, cls in params:
+            self.param_box.addItem("{} ({})".format(name, cls.__name__.replace("Parameter", "").lower()))
+        self.mode_box = QComboBox(self)
+        for text, mode in self.modes:
+            self.mode_box.addItem(text)
+        self.value_edit = QLineEdit(self)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel, parent=self)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+
+        layout = QFormLayout(self)
+        layout.addRow("Parameter", self.param_box)
+        layout.addRow("Change", self.mode_box)
+        layout.addRow("Value", self.value_edit)
+        layout.addRow(buttons)
+
+    def result_values(self):
+        return (self.params[self.param_box.currentIndex()],
+                self.modes[self.mode_box.currentIndex()][1],
+                self.value_edit.text())
@@ -0,0 +1,77 @@
+# coding: utf-8
+# Raytheon BBN Technologies 2016
+# Contributiors: Graham Rowlands
+#
+# This file contains the node layout of a measurement file, kept in a
+# hidden json sidecar next to it so that libraries which happen to share
+# node names don't share positions. It deliberately avoids Qt so that the
+# layout can be written headlessly, e.g. by scripts.
+
+import os, os.path
+import json
+
+def layout_filename(meas_file):
+    dirname, basename = os.path.split(os.path.abspath(meas_file))
+    return os.path.join(dirname, "." + basename + ".quince-layout.json")
+
+class Layout(object):
+    """Positions of the nodes of one measurement file, by label. The sidecar
+    is read once in bulk, and only written when positions have changed, in
+    which case just those entries are merged into what is on disk."""
+    def __init__(self, meas_file):
+        self.filename  = layout_filename(meas_file)
+        self.positions = {} # label -> (x, y)
+        self.saved     = {} # As last read or written
+        self.read()
+
+    def read(self):
+        self.positions = self.read_file()
+        self.saved = dict(self.positions)
+
+    def read_file(self):
+        try:
+            with open(self.filename, 'r') as f:
+                return {name: tuple(pos) for name, pos in json.load(f)["positions"].items()}
+        except (OSError, ValueError, KeyError, TypeError):
+            return {}
+
+    def __contains__(self, name):
+        return name in self.positions
+
+    def get(self, name):
+        return self.positions.get(name)
+
+    def update(self, positions):
+        """Record positions (label -> (x, y)), rounded to a tenth of a pixel so
+        that nodes that haven't moved compare equal."""
+        for name, (x, y) in positions.items():
+            self.positions[name] = (round(x, 1), round(y, 1))
+
+    def prune(self, names):
+        """Forget the nodes that are not among names"""
+        names = set(names)
+        for name in [n for n in self.positions if n not in names]:
+            self.positions.pop(name)
+
+    def changes(self):
+        changed = {n: p for n, p in self.positions.items() if self.saved.get(n) != p}
+        removed = [n for n in self.saved if n not in self.positions]
+        return changed, removed
+
+    def write(self):
+        """Write the changed and removed entries, returning whether anything
+        was written. The file is replaced atomically, keeping the entries
+        that another instance may have written in the meantime."""
+        changed, removed = self.changes()
+        if len(changed) + len(removed) == 0:
+            return False
+        positions = self.read_file()
+        positions.update(changed)
+        for name in removed:
+            positions.pop(name, None)
+        with open(self.filename+".tmp", 'w') as f:
+            json.dump({"positions": {n: list(p) for n, p in sorted(positions.items())}}, f,
+                      separators=(',', ':'))
+        os.replace(self.filename+".tmp", self.filename)
+        self.saved = dict(self.positions)
+        return True
@@ -17,95 +17,91 @@ import importlib
 import pkgutil
 import inspect
 import sys
-from shutil import move
-
-try:
-    import ruamel.yaml as yaml
-except:
-    try:
-        import ruamel_yaml as yaml
-    except:
-        raise Exception("Could not find ruamel.yaml or ruamel_yaml")
 
 from functools import partial
 
-NO_AUSPEX = False
-try:
-    import auspex.config
-    auspex.config.auspex_dummy_mode = True
-    import auspex
-    import auspex.filters as auspex_filt
-    import auspex.instruments as instr
-    from auspex.filters.filter import Filter
-    import auspex.parameter
-    from auspex.instruments.instrument import Instrument, SCPIInstrument, CLibInstrument
-except ImportError as e:
-    NO_AUSPEX = True
-    print("Failed to load Auspex with error '{}'. There will be no nodes.".format(str(e)))
-
-class Include():
-    def __init__(self, filename):
-        self.filename = filename
-        with open(filename, 'r') as f:
-            self.data = yaml.load(f, Loader=yaml.RoundTripLoader)
-    def __getitem__(self, key):
-        return self.data[key]
-    def __setitem__(self, key, value):
-        self.data[key] = value
-    def items(self):
-        return self.data.items()
-    def keys(self):
-        return self.data.keys()
-    def pop(self, key):
-        if key in self.keys():
-            return self.data.pop(key)
-        else:
-            raise KeyError("Could not find key {}".format(key))
-    def write(self):
-        with open(self.filename+".tmp", 'w') as fid:
-            yaml.dump(self.data, fid, Dumper=yaml.RoundTripDumper)
-        # Upon success
-        move(self.filename+".tmp", self.filename)
-
-class Loader(yaml.RoundTripLoader):
-    def __init__(self, stream):
-        try:
-            self._root = os.path.split(stream.name)[0]
-        except AttributeError:
-            self._root = os.path.curdir
-        super().__init__(stream)
-        self.filenames = []
-
-    def include(self, node):
-        shortname = self.construct_scalar(node)
-        filename = os.path.abspath(os.path.join(
-            self._root, shortname
-        ))
-        self.filenames.append(filename)
-        return Include(filename)
-
-class Dumper(yaml.RoundTripDumper):
-    def include(self, data):
-        data.write()
-        return self.represent_scalar(u'!include', data.filename)
-
-def yaml_load(filename):
-    with open(filename, 'r') as fid:
-        Loader.add_constructor('!include', Loader.include)
-        load = Loader(fid)
-        code = load.get_single_data()
-        filenames = load.filenames
-        load.dispose()
-    filenames.append(os.path.abspath(filename))
-    dirname = os.path.dirname(filename)
-    return code, filenames, dirname
-
-def yaml_dump(data, filename):
-    with open(filename+".tmp", 'w') as fid:
-        Dumper.add_representer(Include, Dumper.include)
-        yaml.dump(data, fid, Dumper=Dumper)
-    # Upon success
-    move(filename+".tmp", filename)
+from .config import *
+from .catalog import *
+from .pipeline import parse_source
+from .layout import Layout
+
+# Beyond this many items the fade-in is skipped entirely
+FADE_ITEM_LIMIT = 400
+
+class FadeLayer(QGraphicsObject):
+    """Temporary parent for freshly loaded items. A single opacity effect
+    on the layer fades all of its children at once, so the children are
+    rendered into one cached pixmap instead of repainting individually."""
+    def __init__(self, items, duration=300):
+        super(FadeLayer, self).__init__()
+        self.faded_items = items
+        self.effect = QGraphicsOpacityEffect()
+        self.effect.setOpacity(0.0)
+        self.setGraphicsEffect(self.effect)
+
+        self.animation = QPropertyAnimation(self.effect, bytes("opacity".encode("ascii")))
+        self.animation.setDuration(duration)
+        self.animation.setStartValue(0.0)
+        self.animation.setEndValue(1.0)
+        self.animation.finished.connect(self.finish)
+
+    def boundingRect(self):
+        return QRectF()
+
+    def paint(self, painter, options, widget):
+        pass
+
+    def start(self):
+        for item in self.faded_items:
+            item.setParentItem(self)
+        self.animation.start()
+
+    def finish(self):
+        # Hand the items back to the scene and release the layer, the
+        # effect, and the animation so nothing outlives the fade.
+        self.animation.stop()
+        scene = self.scene()
+        for item in self.faded_items:
+            if item.parentItem() is self:
+                item.setParentItem(None)
+        self.faded_items = []
+        if scene is not None:
+            scene.removeItem(self)
+            if getattr(scene, 'fade_layer', None) is self:
+                scene.fade_layer = None
+        self.setGraphicsEffect(None)
+        self.animation.deleteLater()
+        self.animation = None
+
+def fade_in_items(graphics_view, items):
+    # Complete any fade still running from a previous load
+    if getattr(graphics_view, 'fade_layer', None) is not None:
+        graphics_view.fade_layer.finish()
+    graphics_view.fade_layer = None
+
+    if len(items) == 0 or len(items) > FADE_ITEM_LIMIT:
+        return
+
+    layer = FadeLayer(items)
+    graphics_view.addItem(layer)
+    graphics_view.fade_layer = layer
+    layer.start()
+
+def legacy_position(qt_settings, name):
+    """Position that older versions kept in QSettings, shared by every file"""
+    try:
+        # Windows is very confused about this data type
+        return (float(qt_settings.value("node_positions/" + name + "_pos_x")),
+                float(qt_settings.value("node_positions/" + name + "_pos_y")))
+    except (TypeError, ValueError):
+        return None
+
+def place_node(graphics_view, node, name):
+    """Position a loaded node from the layout of the measurement file"""
+    pos = graphics_view.layout.get(name) or legacy_position(graphics_view.qt_settings, name)
+    if pos is None:
+        pos = (np.random.random()*500-250, np.random.random()*500-250)
+    node.setPos(QPointF(*pos))
 
 def load_from_yaml(graphics_view):
 
@@ -115,6 +111,7 @@ def load_from_yaml(graphics_view):
     graphics_view.settings, _, _     = yaml_load(graphics_view.window.meas_file)
     graphics_view.filter_settings = graphics_view.settings["filters"]
     graphics_view.instr_settings  = graphics_view.settings["instruments"]
+    graphics_view.layout          = Layout(graphics_view.window.meas_file)
 
     loaded_filter_nodes = {} # Keep track of nodes we create
     loaded_instr_nodes  = {} # Keep track of nodes we create
@@ -139,26 +136,16 @@ def load_from_yaml(graphics_view):
             # Set the quince parameters, and keep references to the remaining parameters
             # that cannot be set directly inside quince.
             new_node.base_params = {}
+            new_node.affinity = filt_par.get('affinity')
             for k, v in filt_par.items():
-                if k in new_node.parameters.keys():
+                if k == 'affinity':
+                    continue
+                elif k in new_node.parameters.keys():
                     new_node.parameters[k].set_value(v)
                 else:
                     new_node.base_params[k] = v
 
-            new_node.setOpacity(0.0)
-            try:
-                # Sometimes the settings get gunked up...
-                loc_x = graphics_view.qt_settings.value("node_positions/" + filt_name + "_pos_x")
-                loc_y = graphics_view.qt_settings.value("node_positions/" + filt_name + "_pos_y")
-                # Windows is very confused about this data type:
-                loc_x = float(loc_x)
-                loc_y = float(loc_y)
-                new_node.setPos(QPointF(loc_x, loc_y))
-            except:
-                print("Error when loading node position from QSettings...")
-                new_node.setPos(np.random.random()*500-250, np.random.random()*500-250)
-                graphics_view.qt_settings.setValue("node_positions/" + filt_name + "_pos_x", new_node.pos().x())
-                graphics_view.qt_settings.setValue("node_positions/" + filt_name + "_pos_y", new_node.pos().y())
+            place_node(graphics_view, new_node, filt_name)
             new_node.label.setPlainText(filt_name)
             loaded_filter_nodes[filt_name] = new_node
 
@@ -177,21 +164,8 @@ def load_from_yaml(graphics_view):
             new_node = getattr(graphics_view, 'create_'+instr_type)()
             new_node.enabled = instr_par['enabled'] if 'enabled' in instr_par.keys() else True
             new_node.base_params = instr_par
-            new_node.setOpacity(0.0)
-
-            try:
-                # Sometimes the settings get gunked up...
-                loc_x = graphics_view.qt_settings.value("node_positions/" + instr_name + "_pos_x")
-                loc_y = graphics_view.qt_settings.value("node_positions/" + instr_name + "_pos_y")
-                # Windows is very confused about this data type:
-                loc_x = float(loc_x)
-                loc_y = float(loc_y)
-                new_node.setPos(QPointF(loc_x, loc_y))
-            except:
-                print("Error when loading node position from QSettings...", )
-                new_node.setPos(np.random.random()*500-250, np.random.random()*500-250)
-                graphics_view.qt_settings.setValue("node_positions/" + instr_name + "_pos_x", new_node.pos().x())
-                graphics_view.qt_settings.setValue("node_positions/" + instr_name + "_pos_y", new_node.pos().y())
+
+            place_node(graphics_view, new_node, instr_name)
             new_node.label.setPlainText(instr_name)
             loaded_instr_nodes[instr_name] = new_node
 
@@ -200,17 +174,7 @@ def load_from_yaml(graphics_view):
         is the node name and the part after is the connector name. Otherwise, the
         connector name is just "source" and the source name is the node name."""
 
-        sources = [s.strip() for s in graphics_view.filter_settings[filt_name]["source"].split(",")]
-        for source in sources:
-
-            source    = source.split()
-            if len(source) == 0:
-                continue
-
-            node_name = source[0]
-            conn_name = "source"
-            if len(source) == 2:
-                conn_name = source[1]
+        for node_name, conn_name in parse_source(graphics_view.filter_settings[filt_name]["source"]):
 
             if node_name in loaded_filter_nodes.keys():
                 start_node = loaded_filter_nodes[node_name]
@@ -218,7 +182,6 @@ def load_from_yaml(graphics_view):
                     if 'sink' in node.inputs.keys():
                         # Create wire and register with scene
                         new_wire = Wire(start_node.outputs[conn_name])
-                        new_wire.setOpacity(0.0)
                         new_wires.append(new_wire)
                         graphics_view.addItem(new_wire)
 
@@ -241,7 +204,6 @@ def load_from_yaml(graphics_view):
                     if 'sink' in node.inputs.keys():
                         # Create wire and register with scene
                         new_wire = Wire(start_node.outputs[conn_name])
-                        new_wire.setOpacity(0.0)
                         new_wires.append(new_wire)
                         graphics_view.addItem(new_wire)
 
@@ -258,24 +220,15 @@ def load_from_yaml(graphics_view):
             else:
                 print("Could not find source for ", filt_name, ":", node_name, conn_name)
 
-    # Stick everything in an animation group and ramp the opacity up to 1 (fade in)
-    graphics_view.anim_group = QParallelAnimationGroup()
-    for item in new_wires + list(loaded_instr_nodes.values()) + list(loaded_filter_nodes.values()):
-        dummy = dummy_object_float(item.opacity, item.setOpacity)
-        anim = QPropertyAnimation(dummy, bytes("dummy".encode("ascii")))
-        anim.setDuration(300)
-        anim.setStartValue(0.0)
-        anim.setEndValue(1.0)
-        graphics_view.anim_group.addAnimation(anim)
-    graphics_view.anim_group.start()
+    # Fade everything in as a single layer (skipped for large graphs). The
+    # wires are all drawn by the wire layer, which fades in along with the nodes.
+    faded = list(loaded_instr_nodes.values()) + list(loaded_filter_nodes.values())
+    if len(new_wires) > 0:
+        faded.append(graphics_view.wire_layer)
+    fade_in_items(graphics_view, faded)
 
 def parse_quince_module(mod_name, mod, base_class, graphics_view, submenu=None, mod_filter=None):
-    new_objects = {n: f for n, f in mod.__dict__.items() if inspect.isclass(f)
-                                                            and issubclass(f, base_class)
-                                                            and f != base_class}
-
-    if mod_filter:
-        new_objects = {n: f for n, f in new_objects.items() if mod_filter(f)}
+    new_objects = module_classes(mod, base_class, mod_filter)
 
     if len(new_objects) > 0:
         if submenu:
@@ -289,11 +242,8 @@ def parse_quince_module(mod_name, mod, base_class, graphics_view, submenu=None,
     for obj_name in sorted(new_objects.keys()):
         obj = new_objects[obj_name]
 
-        # Create a QAction and add to the menu
-        action = QAction(obj_name, graphics_view)
-
         # Create function for dropping node on canvas
-        def create(the_obj, the_name, the_category):
+        def create(the_obj, the_name, the_category, label=None):
             node = Node(the_name, graphics_view)
             node.cat_name = the_category
             obj_instance = the_obj()
@@ -353,12 +303,12 @@ def parse_quince_module(mod_name, mod, base_class, graphics_view, submenu=None,
             node.auspex_object = obj_instance
             node.type = the_name
 
-            # See if names will be duplicated
-            node_names = [i.label.toPlainText() for i in graphics_view.items() if isinstance(i, Node)]
-            nan = next_available_name(node_names, the_name)
-            node.label.setPlainText(nan)
+            # See if names will be duplicated, unless the caller already chose one
+            if label is None:
+                node_names = [i.label.toPlainText() for i in graphics_view.items() if isinstance(i, Node)]
+                label = next_available_name(node_names, the_name)
+            node.label.setPlainText(label)
 
-            node.setPos(graphics_view.backdrop.mapFromParent(graphics_view.last_click))
             node.setPos(graphics_view.last_click)
             graphics_view.addItem(node)
             return node
@@ -366,42 +316,39 @@ def parse_quince_module(mod_name, mod, base_class, graphics_view, submenu=None,
         # Add to class
         name = "create_"+("".join(obj_name.split()))
         setattr(graphics_view, name, partial(create, obj, obj_name, mod_name))
-        func = getattr(graphics_view, name)
 
-        # Connect trigger for action
-        def create_command(name=name,func=func,graphics_view=graphics_view):
-            graphics_view.undo_stack.push(CommandAddNode(name, func, graphics_view))
+    # The actions are only created the first time the submenu is opened
+    if len(new_objects) > 0:
+        sm.aboutToShow.connect(partial(populate_menu, sm, sorted(new_objects.keys()), graphics_view))
+
+def populate_menu(menu, obj_names, graphics_view):
+    if len(menu.actions()) > 0:
+        return
+    for obj_name in obj_names:
+        action = QAction(obj_name, menu)
+        def create_command(checked=False, obj_name=obj_name, graphics_view=graphics_view):
+            graphics_view.add_node(obj_name)
         action.triggered.connect(create_command)
-        graphics_view.sub_menus[mod_name].addAction(action)
+        menu.addAction(action)
 
 def parse_quince_modules(graphics_view):
     if NO_AUSPEX:
         return
 
-    # Find all of the filters
-    filter_modules = {
-        name: importlib.import_module('auspex.filters.' + name)
-        for loader, name, is_pkg in pkgutil.iter_modules(auspex_filt.__path__)
-    }
-    filter_modules.pop('filter') # We don't want the base class
-    filter_modules.pop('elementwise') # This one is also an abstract base class
-
-    # Find all of the instruments
-    instrument_modules = {
-        name: importlib.import_module('auspex.instruments.' + name)
-        for loader, name, is_pkg in pkgutil.iter_modules(instr.__path__)
-    }
-
-    for mod_name in sorted(filter_modules.keys(), key=lambda s: s.lower()):
-        mod = filter_modules[mod_name]
+    # Find all of the filters and instruments
+    filter_mods     = filter_modules()
+    instrument_mods = instrument_modules()
+
+    for mod_name in sorted(filter_mods.keys(), key=lambda s: s.lower()):
+        mod = filter_mods[mod_name]
         parse_quince_module(mod_name, mod, Filter, graphics_view)
 
     graphics_view.menu.addSeparator()
     graphics_view.instruments_menu = graphics_view.menu.addMenu("instruments")
     graphics_view.sub_menus["instruments"] = graphics_view.instruments_menu
 
-    for mod_name in sorted(instrument_modules.keys(), key=lambda s: s.lower()):
-        mod = instrument_modules[mod_name]
+    for mod_name in sorted(instrument_mods.keys(), key=lambda s: s.lower()):
+        mod = instrument_mods[mod_name]
         parse_quince_module(mod_name, mod, Instrument, graphics_view,
                             submenu=graphics_view.instruments_menu,
-                            mod_filter=lambda m: hasattr(m, 'instrument_type') and "Digitizer" in m.instrument_type)
+                            mod_filter=is_digitizer)
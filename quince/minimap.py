@@ -0,0 +1,153 @@
+# coding: utf-8
+# Raytheon BBN Technologies 2016
+# Contributiors: Graham Rowlands
+#
+# This file contains the minimap overview of the scene
+
+from qtpy.QtGui import *
+from qtpy.QtCore import *
+from qtpy.QtWidgets import *
+
+from .node import *
+
+class Minimap(QWidget):
+    """Overview of the whole scene drawn from a cached low resolution image.
+    Only the regions of the scene that changed are rendered into the image
+    again, and the view is never repainted on its account. Clicking or
+    dragging centers the view on that point."""
+    def __init__(self, view, resolution=512, margin=200.0, parent=None):
+        super(Minimap, self).__init__(parent)
+        self.view       = view
+        self.scene      = view.scene
+        self.resolution = resolution
+        self.margin     = margin
+        self.image      = None
+        self.source     = QRectF() # Region of the scene held by the image
+        self.dirty      = []
+        self.setMinimumSize(160, 120)
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(300)
+        self.timer.timeout.connect(self.render_dirty)
+
+        self.scene.changed.connect(self.scene_changed)
+        for bar in (view.horizontalScrollBar(), view.verticalScrollBar()):
+            bar.valueChanged.connect(self.update)
+            bar.rangeChanged.connect(self.update)
+
+    def content_rect(self):
+        rect = QRectF()
+        for item in self.scene.items():
+            if isinstance(item, Node):
+                rect = rect.united(item.sceneBoundingRect())
+        if rect.isEmpty():
+            rect = QRectF(-500, -500, 1000, 1000)
+        return rect.adjusted(-self.margin, -self.margin, self.margin, self.margin)
+
+    def scene_to_image(self):
+        scale = self.image.width()/self.source.width()
+        t = QTransform()
+        t.scale(scale, scale)
+        t.translate(-self.source.left(), -self.source.top())
+        return t
+
+    def render_all(self):
+        self.source = self.content_rect()
+        scale = self.resolution/max(self.source.width(), self.source.height())
+        self.image = QImage(max(1, int(self.source.width()*scale)), max(1, int(self.source.height()*scale)),
+                            QImage.Format_ARGB32_Premultiplied)
+        self.image.fill(self.scene.backgroundBrush().color())
+        painter = QPainter(self.image)
+        self.scene.render(painter, QRectF(self.image.rect()), self.source)
+        painter.end()
+        self.dirty = []
+        self.update()
+
+    def scene_changed(self, regions):
+        if not self.isVisible():
+            return
+        self.dirty.extend(regions)
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def render_dirty(self):
+        if self.image is None:
+            self.render_all()
+            return
+        content = self.content_rect()
+        dirty = [r for r in self.dirty if r.intersects(self.source)]
+        self.dirty = []
+        # Start over when the nodes have moved outside the image
+        if not self.source.contains(content.adjusted(self.margin, self.margin, -self.margin, -self.margin)):
+            self.render_all()
+            return
+        if len(dirty) == 0:
+            return
+
+        # Merge the changed regions in image pixels, there are often many
+        # small overlapping ones for a single edit
+        t = self.scene_to_image()
+        region = QRegion()
+        for r in dirty:
+            region = region.united(t.mapRect(r.intersected(self.source)).toAlignedRect().adjusted(-1, -1, 1, 1))
+        region = region.intersected(self.image.rect())
+        rects = region.rects()
+        area = sum(r.width()*r.height() for r in rects)
+        if len(rects) > 32 or area > 0.5*self.image.width()*self.image.height():
+            self.render_all()
+            return
+
+        inverse = t.inverted()[0]
+        painter = QPainter(self.image)
+        for target in rects:
+            painter.setClipRect(target)
+            painter.fillRect(target, self.scene.backgroundBrush().color())
+            self.scene.render(painter, QRectF(target), inverse.mapRect(QRectF(target)))
+        painter.end()
+        self.update()
+
+    def showEvent(self, event):
+        self.render_all()
+        super(Minimap, self).showEvent(event)
+
+    def widget_to_scene(self):
+        """Transform from widget coordinates to scene coordinates, with the
+        image fitted to the widget keeping its aspect ratio."""
+        scale = min(self.width()/self.source.width(), self.height()/self.source.height())
+        t = QTransform()
+        t.translate(0.5*(self.width() - scale*self.source.width()), 0.5*(self.height() - scale*self.source.height()))
+        t.scale(scale, scale)
+        t.translate(-self.source.left(), -self.source.top())
+        return t
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(40,40,40))
+        if self.image is None:
+            return
+        t = self.widget_to_scene()
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        painter.drawImage(t.mapRect(self.source), self.image)
+
+        visible = self.view.mapToScene(self.view.viewport().rect()).boundingRect()
+        painter.setPen(QPen(QColor(240,240,240), 1.5))
+        painter.setBrush(QColor(240,240,240,40))
+        painter.drawRect(t.mapRect(visible))
+
+    def navigate(self, position):
+        if self.image is not None:
+            self.view.centerOn(self.widget_to_scene().inverted()[0].map(QPointF(position)))
+
+    def mousePressEvent(self, event):
+        self.navigate(event.pos())
+
+    def mouseMoveEvent(self, event):
+        if event.buttons() & Qt.LeftButton:
+            self.navigate(event.pos())
+
+class MinimapDock(QDockWidget):
+    def __init__(self, view, parent=None):
+        super(MinimapDock, self).__init__("Overview", parent=parent)
+        self.minimap = Minimap(view, parent=self)
+        self.setWidget(self.minimap)
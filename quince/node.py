@@ -9,12 +9,27 @@ from qtpy.QtCore import *
 from qtpy.QtWidgets import *
 
 from .wire import *
+from .util import *
+from .store import parameter_column
+from .pipeline import parse_source, scene_entries, STRUCTURAL_KEYS
+
+from collections import OrderedDict
+
+# Milliseconds a node stays collapsed before the value boxes of its parameters
+# are destroyed. They are recreated when it is expanded and shown again.
+VALUE_BOX_LIFETIME = 30000
 
 class Node(QGraphicsRectItem):
     """docstring for Node"""
     def __init__(self, name, scene, parent=None):
         super(Node, self).__init__(parent=parent)
         self.name = name
+
+        # Colored outlines and lines of text drawn around the node by the
+        # various analyses, keyed by the name of the analysis
+        self.overlays = OrderedDict()
+        self.annotations = OrderedDict()
+        self.tint = None
         self.scene = scene
         self.setFlag(QGraphicsItem.ItemIsMovable)
         self.setFlag(QGraphicsItem.ItemIsSelectable)
@@ -32,18 +47,11 @@ class Node(QGraphicsRectItem):
         self.edge_thick = 0.75
         self.setRect(0,0,100,30)
 
-        # Title bar
-        self.title_bar = QGraphicsRectItem(parent=self)
-        self.title_bar.setRect(0,0,100,20)
+        # Title bar. It and the other decorations are painted by the node
+        # rather than being items of their own, which keeps the scene index
+        # small. Only the title editor is an item, and only while renaming.
         self.title_color = self.default_title_color = QColor(80,80,100)
-        self.label = TitleText(self.name, parent=self)
-        self.label.setDefaultTextColor(Qt.white)
-
-        # Glossy flair
-        shiny_part = QGraphicsPolygonItem(QPolygonF([QPointF(0,0), QPointF(120,0), QPointF(0,8)]),
-                                          parent=self)
-        shiny_part.setBrush(QBrush(QColor(200,200,250,50)))
-        shiny_part.setPen(QPen(Qt.NoPen))
+        self.label = NodeLabel(self.name, self)
 
 
         # Enabled by default
@@ -57,26 +65,22 @@ class Node(QGraphicsRectItem):
         # Any additional json we should retain
         self.base_params = None
 
-        # Dividing line and collapse button
-        self.divider = QGraphicsLineItem(20, 0, self.rect().width()-5, 0, self)
-        self.collapse_box = CollapseBox(parent=self)
-        self.collapse_box.setX(10)
+        # Worker process the filter should run in, if assigned
+        self.affinity = None
+
+        # Row of the node in the parameter store, once it has parameters
+        self.store_table = None
+        self.store_row   = None
+
+        # Height of the dividing line and collapse button, if shown
+        self.divider_y = None
+        self.resize_start = None
 
         # Make sure things are properly sized
         self.min_height = 30.0
         self.min_width = 120.0
         self.update_min_width()
 
-        # if self.label.boundingRect().topRight().x() > 120:
-        #     self.min_width = self.label.boundingRect().topRight().x()+20
-        #     self.setRect(0,0,self.label.boundingRect().topRight().x()+20,30)
-        # else:
-        #     self.min_width = 120.0
-
-        # Resize Handle
-        self.resize_handle = ResizeHandle(parent=self)
-        self.resize_handle.setPos(self.rect().width()-8, self.rect().height()-8)
-
         # Disable box
         self.disable_box = None
 
@@ -111,6 +115,40 @@ class Node(QGraphicsRectItem):
             self.title_color = QColor(100,100,100)
         self.update()
 
+    def set_overlay(self, key, color):
+        if self.overlays.get(key) == color:
+            return
+        if key not in self.overlays:
+            self.prepareGeometryChange()
+        self.overlays[key] = color
+        self.update()
+
+    def clear_overlay(self, key):
+        if key in self.overlays:
+            self.prepareGeometryChange()
+            self.overlays.pop(key)
+            self.update()
+
+    def set_tint(self, color):
+        # Translucent fill over the body of the node, e.g. for heatmaps
+        if color != self.tint:
+            self.tint = color
+            self.update()
+
+    def set_annotation(self, key, text):
+        if self.annotations.get(key) == text:
+            return
+        self.prepareGeometryChange()
+        if text:
+            self.annotations[key] = text
+        else:
+            self.annotations.pop(key, None)
+        self.update()
+
+    def boundingRect(self):
+        margin = 1.0 + 3.0*len(self.overlays)
+        return self.rect().adjusted(-margin, -margin, margin, margin + 14.0*len(self.annotations))
+
     def hoverEnterEvent(self, event):
         self.prev_edge_color = self.edge_color
         self.prev_edge_thick = self.edge_thick
@@ -124,9 +162,9 @@ class Node(QGraphicsRectItem):
         self.update()
 
     def update_min_width(self):
-        widths = [p.label.boundingRect().topRight().x() for p in self.parameters.values()]
-        widths.extend([o.label.boundingRect().topRight().x() for o in self.outputs.values()])
-        widths.extend([i.label.boundingRect().topRight().x() for i in self.inputs.values()])
+        widths = [p.width() for p in self.parameters.values()]
+        widths.extend([o.width() for o in self.outputs.values()])
+        widths.extend([i.width() for i in self.inputs.values()])
         widths.append(self.label.boundingRect().topRight().x())
         self.min_width = max(widths)+20
         if self.min_width < 120:
@@ -167,28 +205,37 @@ class Node(QGraphicsRectItem):
     def add_parameter(self, param):
         param.setParentItem(self)
         param.parent = self
+        store = getattr(self.scene, 'parameter_store', None)
+        if store is not None:
+            if self.store_row is None:
+                self.store_table = store.table(self.name)
+                self.store_row = self.store_table.add_row(self)
+            param.attach(self.store_table, self.store_row)
         self.parameters[param.name] = param
         self.parameter_order[len(self.parameter_order)] = param.name
         self.change_collapsed_state(self.collapsed) # Just for resizing in this case
 
+    def release_store_row(self):
+        if self.store_table is not None:
+            self.store_table.release_row(self.store_row)
+
+    def restore_store_row(self):
+        if self.store_table is not None:
+            self.store_table.restore_row(self.store_row, self)
+
     def change_collapsed_state(self, collapsed):
         self.collapsed = collapsed
 
-        self.collapse_box.setRotation(0.0 if self.collapsed else 90.0)
-
         # Update the positions
         pos = 32+15*(len(self.inputs)+len(self.outputs))
         if len(self.parameters) > 0:
-            self.divider.setY(pos)
-            self.collapse_box.setY(pos)
-            self.divider.setVisible(True)
-            self.collapse_box.setVisible(True)
+            self.divider_y = pos
             pos += 10
         else:
-            self.divider.setVisible(False)
-            self.collapse_box.setVisible(False)
+            self.divider_y = None
 
         for i in range(len(self.parameter_order)):
+            self.parameters[self.parameter_order[i]].set_collapsed(self.collapsed)
             # We completely hide parameters without inputs
             if not self.parameters[self.parameter_order[i]].has_input:
                 if self.collapsed:
@@ -200,7 +247,6 @@ class Node(QGraphicsRectItem):
             else:
                 self.parameters[self.parameter_order[i]].setVisible(True)
                 self.parameters[self.parameter_order[i]].setPos(0, pos)
-                self.parameters[self.parameter_order[i]].set_collapsed(self.collapsed)
             
                 if self.collapsed:
                     pos += self.parameters[self.parameter_order[i]].height_collapsed
@@ -216,35 +262,35 @@ class Node(QGraphicsRectItem):
             for w in v.wires_in:
                 w.set_end(v.scenePos())
 
+        # Value boxes are only kept around while they might be used
+        release_later = getattr(self.scene, 'release_value_boxes_later', None)
+        if self.collapsed and len(self.parameters) > 0 and release_later is not None:
+            release_later(self)
+
+    def release_value_boxes(self):
+        # Unless the node has been expanded in the meantime
+        if self.collapsed:
+            for param in self.parameters.values():
+                param.release_value_box()
+
     def update_fields_from_connector(self):
         # This is peculiar to the "Sweep Nodes"
         wires_out = self.outputs['Swept Param.'].wires_out
         if len(wires_out) > 0:
             wire_end = wires_out[0].end_obj
 
-            self.parameters['Start'].datatype = wire_end.value_box.datatype
-            self.parameters['Start'].value_box.datatype  = wire_end.value_box.datatype
-            self.parameters['Start'].value_box.min_value = wire_end.value_box.min_value
-            self.parameters['Start'].value_box.max_value = wire_end.value_box.max_value
-            self.parameters['Start'].value_box.increment = wire_end.value_box.increment
-            self.parameters['Start'].value_box.snap      = wire_end.value_box.snap
-            self.parameters['Start'].value_box.set_value(self.parameters['Start'].value())
-
-            self.parameters['Stop'].datatype = wire_end.value_box.datatype
-            self.parameters['Stop'].value_box.datatype  = wire_end.value_box.datatype
-            self.parameters['Stop'].value_box.min_value = wire_end.value_box.min_value
-            self.parameters['Stop'].value_box.max_value = wire_end.value_box.max_value
-            self.parameters['Stop'].value_box.increment = wire_end.value_box.increment
-            self.parameters['Stop'].value_box.snap      = wire_end.value_box.snap
-            self.parameters['Stop'].value_box.set_value(self.parameters['Stop'].value())
-
-            self.parameters['Incr.'].datatype = wire_end.value_box.datatype
-            self.parameters['Incr.'].value_box.datatype  = wire_end.value_box.datatype
-            self.parameters['Incr.'].value_box.min_value = -2*abs(wire_end.value_box.max_value)
-            self.parameters['Incr.'].value_box.max_value = 2*abs(wire_end.value_box.max_value)
-            self.parameters['Incr.'].value_box.increment = wire_end.value_box.increment
-            self.parameters['Incr.'].value_box.snap      = wire_end.value_box.snap
-            self.parameters['Incr.'].value_box.set_value(self.parameters['Incr.'].value())
+            for name in ('Start', 'Stop', 'Incr.'):
+                param = self.parameters[name]
+                param.datatype  = wire_end.datatype
+                param.min_value = wire_end.min_value
+                param.max_value = wire_end.max_value
+                param.increment = wire_end.increment
+                param.snap      = wire_end.snap
+            self.parameters['Incr.'].min_value = -2*abs(wire_end.max_value)
+            self.parameters['Incr.'].max_value = 2*abs(wire_end.max_value)
+
+            for name in ('Start', 'Stop', 'Incr.'):
+                self.parameters[name].set_value(self.parameters[name].value())
         
     def update_parameters_from(self, other_node):
         # Make sure they are of the same type
@@ -293,16 +339,9 @@ class Node(QGraphicsRectItem):
         self.setRect(r)
         delta.setY(0.0)
 
-        if hasattr(self, 'resize_handle'):
-            self.resize_handle.setPos(self.rect().width()-8, self.rect().height()-8)
-        if hasattr(self, 'title_bar'):
-            self.title_bar.setRect(0,0,self.rect().width(),20)
-
         conn_delta = actual_delta.toPoint()
         conn_delta.setY(0.0)
 
-        self.divider.setLine(20, 0, self.rect().width()-5, 0)
-
         # Move the outputs
         for k, v in self.outputs.items():
             v.setX(self.rect().width())
@@ -318,14 +357,100 @@ class Node(QGraphicsRectItem):
     def create_wire(self, parent):
     	return Wire(parent)
 
+    def resize_rect(self):
+        return QRectF(self.rect().width()-10, self.rect().height()-10, 10, 10)
+
+    def collapse_rect(self):
+        if self.divider_y is None:
+            return QRectF()
+        return QRectF(3, self.divider_y-7, 15, 15)
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton and self.resize_rect().contains(event.pos()):
+            self.resize_start = event.scenePos()
+            event.accept()
+        elif event.button() == Qt.LeftButton and self.collapse_rect().contains(event.pos()):
+            self.change_collapsed_state(not self.collapsed)
+            event.accept()
+        else:
+            super(Node, self).mousePressEvent(event)
+
+    def mouseMoveEvent(self, event):
+        if self.resize_start is not None:
+            actual_delta = self.itemResize(event.scenePos() - self.resize_start)
+            self.resize_start = self.resize_start + actual_delta
+        else:
+            super(Node, self).mouseMoveEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        if self.resize_start is not None:
+            self.resize_start = None
+        else:
+            super(Node, self).mouseReleaseEvent(event)
+
+    def mouseDoubleClickEvent(self, event):
+        if event.pos().y() < 20:
+            self.label.edit()
+        else:
+            super(Node, self).mouseDoubleClickEvent(event)
+
     def paint(self, painter, options, widget):
         painter.setPen(QPen(self.edge_color, self.edge_thick))
-        self.title_bar.setPen(QPen(self.edge_color, self.edge_thick))
-        self.title_bar.setBrush(QBrush(self.title_color))
         painter.setBrush(QBrush(self.bg_color))
         painter.drawRoundedRect(self.rect(), 5.0, 5.0)
 
-    def dict_repr(self):
+        if self.tint is not None:
+            painter.setPen(Qt.NoPen)
+            painter.setBrush(QBrush(self.tint))
+            painter.drawRoundedRect(self.rect(), 5.0, 5.0)
+
+        # Title bar with its glossy flair
+        width = self.rect().width()
+        painter.setPen(QPen(self.edge_color, self.edge_thick))
+        painter.setBrush(QBrush(self.title_color))
+        painter.drawRect(QRectF(0, 0, width, 20))
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QBrush(QColor(200,200,250,50)))
+        painter.drawPolygon(QPolygonF([QPointF(0,0), QPointF(120,0), QPointF(0,8)]))
+
+        painter.setFont(QFont())
+        if self.label.editor is None:
+            painter.setPen(Qt.white)
+            painter.drawStaticText(QPointF(4, 4), self.label.static)
+        painter.setPen(Qt.black)
+        for conn in list(self.inputs.values()) + list(self.outputs.values()):
+            painter.drawStaticText(conn.label_pos(), conn.label)
+
+        # Dividing line and collapse button
+        if self.divider_y is not None:
+            painter.drawLine(QPointF(20, self.divider_y), QPointF(width-5, self.divider_y))
+            painter.save()
+            painter.translate(10, self.divider_y)
+            painter.rotate(0.0 if self.collapsed else 90.0)
+            painter.setPen(QPen(QColor(0,0,0), 1.0))
+            painter.setBrush(QColor(160,200,220))
+            painter.drawPolygon(QPolygonF([QPointF(-4,4), QPointF(4,0), QPointF(-4,-4)]))
+            painter.restore()
+
+        # Resize handle
+        painter.fillRect(QRectF(width-8, self.rect().height()-8, 5, 5), QColor(20,20,20))
+
+        painter.setBrush(Qt.NoBrush)
+        for i, color in enumerate(self.overlays.values()):
+            offset = 1.5 + 3.0*i
+            painter.setPen(QPen(color, 2.5))
+            painter.drawRoundedRect(self.rect().adjusted(-offset, -offset, offset, offset), 5.0+offset, 5.0+offset)
+
+        if len(self.annotations) > 0:
+            painter.setPen(QColor(220,220,220))
+            top = self.rect().bottom() + 3.0*len(self.overlays)
+            for i, text in enumerate(self.annotations.values()):
+                painter.drawText(QRectF(0, top + 14.0*i, self.rect().width(), 14.0), Qt.AlignLeft | Qt.AlignVCenter, text)
+
+    def dict_repr(self, values=None):
+        # Values of the parameters can be passed in when they have already
+        # been read from the parameter store in bulk.
+
         # First spit out any json that can't be modified in Quince.
         # Base_params holds any parameters that aren't flagged as 
         # being "quince_parameters" in the auspex filters.
@@ -338,7 +463,7 @@ class Node(QGraphicsRectItem):
         # Now update and of the parameters that are set within
         # Quince.
         for name, param in self.parameters.items():
-            dict_repr[name] = param.value()
+            dict_repr[name] = values[name] if values is not None else param.value()
 
         # Find the name of the source connectors (assuming one connection)
         # The default connector name is "source", in which case data_source
@@ -370,117 +495,84 @@ class Node(QGraphicsRectItem):
 
         dict_repr['enabled']  = self.enabled
         dict_repr['type']     = self.type
+        if self.affinity is not None:
+            dict_repr['affinity'] = self.affinity
+        else:
+            dict_repr.pop('affinity', None)
         return dict_repr
 
-class TitleText(QGraphicsTextItem):
-    '''QGraphicsTextItem with textChanged() signal.'''
-    textChanged = Signal(str)
-
-    def __init__(self, text, parent=None):
-        super(TitleText, self).__init__(text, parent)
-        self.setTextInteractionFlags(Qt.TextEditorInteraction)
-        self.setFlag(QGraphicsItem.ItemIsFocusable)
+class NodeLabel(object):
+    """Title of a node, painted by the node as static text. It stands in for
+    the text item the title used to be, and only creates one while the title
+    is being edited."""
+    def __init__(self, text, node):
+        self.node   = node
         self._value = text
-        self.parent = parent
+        self.static = static_text(text)
+        self.editor = None
+
+    def toPlainText(self):
+        return self._value
 
     def setPlainText(self, text):
-        if hasattr(self.scene(), 'items'):
-            nodes = [i for i in self.scene().items() if isinstance(i, Node)]
-            nodes.remove(self.parent)
+        scene = QGraphicsItem.scene(self.node)
+        if hasattr(scene, 'items'):
+            nodes = [i for i in scene.items() if isinstance(i, Node)]
+            nodes.remove(self.node)
             node_names = [n.label.toPlainText() for n in nodes]
             if text in node_names:
-                self.scene().window.set_status("Node name already exists")
-            else:
-                # self.scene().inspector_change_name(self._value, text)
-                self._value = text
-            self.textChanged.emit(self.toPlainText())
-        else:
-            self._value = text
-        
-        super(TitleText, self).setPlainText(self._value)
+                scene.window.set_status("Node name already exists")
+                return
+        self._value = text
+        self.static = static_text(text)
+        self.node.update_min_width()
+        self.node.update()
+
+    def boundingRect(self):
+        # Including the margins of the text item this replaces
+        return QRectF(0, 0, self.static.size().width() + 8, 20)
+
+    def edit(self):
+        if self.editor is None:
+            self.editor = TitleText(self, parent=self.node)
+            self.node.update()
+        self.editor.setFocus()
+        cursor = self.editor.textCursor()
+        cursor.select(QTextCursor.Document)
+        self.editor.setTextCursor(cursor)
+
+    def finish_edit(self):
+        editor, self.editor = self.editor, None
+        if editor is None:
+            return
+        self.setPlainText(editor.toPlainText())
+        editor.hide()
+        # The editor may still be handling the event that ended the edit
+        QTimer.singleShot(0, lambda: editor.scene() and editor.scene().removeItem(editor))
+        self.node.update()
+
+class TitleText(QGraphicsTextItem):
+    '''Editor for the title of a node, present only while renaming.'''
+    def __init__(self, label, parent=None):
+        super(TitleText, self).__init__(label.toPlainText(), parent)
+        self.label = label
+        self.setDefaultTextColor(Qt.white)
+        self.setTextInteractionFlags(Qt.TextEditorInteraction)
+        self.setFlag(QGraphicsItem.ItemIsFocusable)
 
     def focusOutEvent(self, event):
-        self.setPlainText(self.toPlainText())
         super(TitleText, self).focusOutEvent(event)
-        self.clearFocus()
-
-    def focusInEvent(self, event):
-        super(TitleText, self).focusInEvent(event)
-        self.setFocus()
+        self.label.finish_edit()
 
     def keyPressEvent(self, event):
-        if event.key() == Qt.Key_Return or event.key() == Qt.Key_Enter:
-            c = self.textCursor()
-            c.clearSelection()
-            self.setTextCursor(c)
+        if event.key() == Qt.Key_Escape:
+            self.setPlainText(self.label.toPlainText())
+            self.clearFocus()
+        elif event.key() == Qt.Key_Return or event.key() == Qt.Key_Enter:
             self.clearFocus()
         else:
             return super(TitleText, self).keyPressEvent(event)
 
-class ResizeHandle(QGraphicsRectItem):
-    """docstring for ResizeHandle"""
-    def __init__(self, parent=None):
-        super(ResizeHandle, self).__init__()
-        self.dragging = False
-        self.parent = parent
-        self.drag_start = None
-        self.setParentItem(parent)
-        self.setRect(0,0,5,5)
-        self.setBrush(QColor(20,20,20))
-
-    def mousePressEvent(self, event):
-        self.dragging = True
-        self.drag_start = event.scenePos()
-
-    def mouseMoveEvent(self, event):
-        if self.dragging:
-            delta = event.scenePos() - self.drag_start
-            actual_delta = self.parent.itemResize(delta)
-            self.drag_start = self.drag_start + actual_delta
-
-    def mouseReleaseEvent(self, event):
-        self.dragging = False
-
-class CollapseBox(QGraphicsItem):
-    """docstring for CollapseBox"""
-    def __init__(self, parent=None):
-        super(CollapseBox, self).__init__(parent=parent)
-        self.parent = parent
-        self.clicking = False
-        self.height = 8
-        self.width = 8
-    
-        self.setRotation(90.0)
-
-    def paint(self, painter, options, widget):
-        # Draw our triangle    
-        painter.setPen(QPen(QColor(0,0,0), 1.0))
-        painter.setBrush(QColor(160,200,220))
-        
-        path = QPainterPath()
-        path.moveTo(-4,4)
-        path.lineTo(4,0)
-        path.lineTo(-4,-4)
-        path.lineTo(-4,4)
-        painter.drawPath(path)
-
-    def boundingRect(self):
-        return QRectF(QPointF(-5,-6), QSizeF(15, 15))
-
-    def shape(self):
-        p = QPainterPath()
-        p.addRect(-5, -6, 15, 15)
-        return p
-
-    def mousePressEvent(self, event):
-        self.clicking = True
-
-    def mouseReleaseEvent(self, event):
-        if self.clicking:
-            self.parent.change_collapsed_state(not self.parent.collapsed)
-            self.setRotation(0.0 if self.parent.collapsed else 90.0)
-        self.clicking = False
-
 class CommandAddNode(QUndoCommand):
     def __init__(self, node_name, create_func, scene):
         super(CommandAddNode, self).__init__("Add node {}".format(node_name))
@@ -490,6 +582,7 @@ class CommandAddNode(QUndoCommand):
         self.new_node = self.create_func()
     def undo(self):
         self.scene.removeItem(self.new_node)
+        self.new_node.release_store_row()
 
 class CommandDeleteNodes(QUndoCommand):
     def __init__(self, nodes, scene):
@@ -519,12 +612,14 @@ class CommandDeleteNodes(QUndoCommand):
                     self.parameter_wires.append(w)
                     self.scene.removeItem(w)
             self.scene.removeItem(node)
+            node.release_store_row()
             node.update()
         self.scene.update()
 
     def undo(self):
         for node in self.nodes:
             self.scene.addItem(node)
+            node.restore_store_row()
         for w in self.output_wires:
             w.end_obj.wires_in.append(w)
             self.scene.addItem(w)
@@ -539,6 +634,187 @@ class CommandDeleteNodes(QUndoCommand):
         self.parameter_wires = []
         self.scene.update()
 
+class CommandSetAffinity(QUndoCommand):
+    def __init__(self, affinities, scene):
+        super(CommandSetAffinity, self).__init__("Assign {} nodes to workers".format(len(affinities)))
+        self.scene = scene
+        self.new_affinities = affinities # Dictionary of node -> worker
+        self.old_affinities = {n: n.affinity for n in affinities.keys()}
+
+    def redo(self):
+        for node, affinity in self.new_affinities.items():
+            node.affinity = affinity
+        self.scene.affinities_changed()
+
+    def undo(self):
+        for node, affinity in self.old_affinities.items():
+            node.affinity = affinity
+        self.scene.affinities_changed()
+
+class CommandSetParameters(QUndoCommand):
+    def __init__(self, changes, scene):
+        # Changes is a list of (parameter, new value)
+        super(CommandSetParameters, self).__init__("Set {} on {} nodes".format(
+            ",".join(sorted(set(p.name for p, v in changes))), len(changes)))
+        self.scene   = scene
+        olds = parameter_column([p for p, v in changes])
+        self.changes = [(p, old, v) for (p, v), old in zip(changes, olds)]
+
+    def redo(self):
+        with self.scene.batch_updates():
+            for param, old, new in self.changes:
+                param.set_value(new)
+
+    def undo(self):
+        with self.scene.batch_updates():
+            for param, old, new in self.changes:
+                param.set_value(old)
+
+class CommandSetEnabled(QUndoCommand):
+    def __init__(self, nodes, enabled, scene):
+        super(CommandSetEnabled, self).__init__("{} nodes {}".format("Enable" if enabled else "Disable",
+                                                                     ",".join([n.name for n in nodes])))
+        self.scene   = scene
+        self.enabled = enabled
+        self.previous = {n: n.enabled for n in nodes}
+
+    def redo(self):
+        for node in self.previous.keys():
+            node.enabled = self.enabled
+
+    def undo(self):
+        for node, enabled in self.previous.items():
+            node.enabled = enabled
+
+class CommandMergeNodes(QUndoCommand):
+    def __init__(self, groups, scene):
+        # Groups is a list of (node to keep, [identical nodes to remove])
+        removed = [n for keep, dups in groups for n in dups]
+        super(CommandMergeNodes, self).__init__("Merge nodes {}".format(",".join([n.name for n in removed])))
+        self.scene  = scene
+        self.groups = groups
+        self.delete = CommandDeleteNodes(removed, scene)
+        self.moved  = [] # (wire, old start connector, new start connector)
+
+    def redo(self):
+        removed = set(self.delete.nodes)
+        for keep, dups in self.groups:
+            for dup in dups:
+                for k, v in dup.outputs.items():
+                    for w in list(v.wires_out):
+                        # Wires into other removed nodes go away with them
+                        if w.end_obj is None or w.end_obj.parent in removed:
+                            continue
+                        v.wires_out.remove(w)
+                        keep.outputs[k].wires_out.append(w)
+                        w.start_obj = keep.outputs[k]
+                        w.set_start(w.start_obj.scenePos())
+                        self.moved.append((w, v, keep.outputs[k]))
+        self.delete.redo()
+
+    def undo(self):
+        self.delete.undo()
+        for w, old, new in reversed(self.moved):
+            new.wires_out.remove(w)
+            old.wires_out.append(w)
+            w.start_obj = old
+            w.set_start(old.scenePos())
+        self.moved = []
+        self.scene.update()
+
+class CommandInstantiateTemplate(QUndoCommand):
+    def __init__(self, template, instances, origin, scene, spacing=150.0):
+        # Instances is a list of placeholder values, one dictionary per copy
+        super(CommandInstantiateTemplate, self).__init__("Instantiate {} x{}".format(template.name, len(instances)))
+        self.template  = template
+        self.instances = instances
+        self.origin    = origin
+        self.scene     = scene
+        self.spacing   = spacing
+        self.new_nodes = []
+        self.new_wires = [] # (wire, start connector, end connector)
+        self.missing   = set() # Types that can't be created
+
+    def build(self):
+        existing  = {n.label.toPlainText(): n for n in self.scene.all_nodes()}
+        allocator = NameAllocator(list(existing.keys()) + [i.label.toPlainText() for i in self.scene.items() if isinstance(i, Node)])
+        heights = [p[1] for p in self.template.positions.values()]
+        step = (max(heights) - min(heights) if len(heights) > 0 else 0.0) + self.spacing
+
+        for copy, values in enumerate(self.instances):
+            filters, positions = self.template.instantiate(values, allocator.unique)
+            created = {}
+            for label, entry in filters.items():
+                create_func = getattr(self.scene, "create_"+("".join(str(entry.get('type')).split())), None)
+                if create_func is None:
+                    self.missing.add(entry.get('type'))
+                    continue
+                node = create_func(label=label)
+                node.base_params = {}
+                for k, v in entry.items():
+                    if k in node.parameters:
+                        node.parameters[k].set_value(v)
+                    elif k not in STRUCTURAL_KEYS:
+                        node.base_params[k] = v
+                node.enabled  = entry.get('enabled', True)
+                node.affinity = entry.get('affinity')
+                node.setPos(self.origin + QPointF(positions[label][0], positions[label][1] + copy*step))
+                created[label] = node
+                self.new_nodes.append(node)
+
+            for label, node in created.items():
+                for source_name, conn_name in parse_source(filters[label].get('source', "")):
+                    start_node = created.get(source_name, existing.get(source_name))
+                    if start_node is None or conn_name not in start_node.outputs or 'sink' not in node.inputs:
+                        continue
+                    start, end = start_node.outputs[conn_name], node.inputs['sink']
+                    wire = Wire(start)
+                    wire.end_obj = end
+                    self.new_wires.append((wire, start, end))
+
+    def redo(self):
+        with self.scene.batch_updates():
+            if len(self.new_nodes) == 0:
+                self.build()
+            else:
+                for node in self.new_nodes:
+                    self.scene.addItem(node)
+                    node.restore_store_row()
+            for wire, start, end in self.new_wires:
+                start.wires_out.append(wire)
+                end.wires_in.append(wire)
+                self.scene.addItem(wire)
+                wire.set_start(start.scenePos())
+                wire.set_end(end.scenePos())
+
+    def undo(self):
+        with self.scene.batch_updates():
+            for wire, start, end in self.new_wires:
+                start.wires_out.remove(wire)
+                end.wires_in.remove(wire)
+                self.scene.removeItem(wire)
+            for node in self.new_nodes:
+                node.setSelected(False)
+                self.scene.removeItem(node)
+                node.release_store_row()
+
+class CommandApplyEntries(QUndoCommand):
+    def __init__(self, entries, positions, scene):
+        # Entries is a dictionary of name -> (entry, is_instrument), as for Pipeline.sync
+        super(CommandApplyEntries, self).__init__("Script edit")
+        self.scene = scene
+        self.new_entries   = OrderedDict((n, (dict(e), i)) for n, (e, i) in entries.items())
+        self.old_entries   = scene_entries(scene)
+        self.old_positions = {n.label.toPlainText(): (n.pos().x(), n.pos().y()) for n in scene.all_nodes()}
+        self.new_positions = dict(self.old_positions)
+        self.new_positions.update(positions)
+
+    def redo(self):
+        self.scene.sync_nodes(self.new_entries, self.new_positions)
+
+    def undo(self):
+        self.scene.sync_nodes(self.old_entries, self.old_positions)
+
 class CommandDuplicateNodes(QUndoCommand):
     def __init__(self, nodes, scene):
         super(CommandDuplicateNodes, self).__init__("Duplicate nodes {}".format(",".join([n.name for n in nodes])))
@@ -561,6 +837,7 @@ class CommandDuplicateNodes(QUndoCommand):
             if sn.base_params:
                 new_node.base_params = dict(sn.base_params)
             new_node.enabled = sn.enabled
+            new_node.affinity = sn.affinity
 
             # Update the mapping
             old_to_new[sn] = new_node
@@ -615,6 +892,7 @@ class CommandDuplicateNodes(QUndoCommand):
                     w.end_obj.wires_in.pop(w.end_obj.wires_in.index(w))
                     self.scene.removeItem(w)
             self.scene.removeItem(node)
+            node.release_store_row()
             node.update()
         for sn in self.nodes:
             sn.setSelected(True)
@@ -0,0 +1,401 @@
+# coding: utf-8
+# Raytheon BBN Technologies 2016
+# Contributiors: Graham Rowlands
+#
+# This file contains the overlays that decorate the nodes and wires
+# of the scene with the results of the various analyses
+
+from qtpy.QtGui import *
+from qtpy.QtCore import *
+from qtpy.QtWidgets import *
+
+import numpy as np
+from collections import OrderedDict
+
+from .node import *
+from .wire import *
+from .rates import *
+from .telemetry import *
+from .heatmap import *
+from .partition import *
+from .analysis import *
+from .diff import *
+
+def load_color(fraction):
+    """Green through yellow to red as fraction goes from 0 to 1"""
+    fraction = min(max(fraction, 0.0), 1.0)
+    return QColor.fromHsvF(0.33*(1.0-fraction), 0.85, 0.95)
+
+class Overlay(object):
+    """Base class for overlays. Subclasses set a unique key, under which the
+    node outlines and annotations are stored, and implement refresh."""
+    key = None
+
+    def __init__(self, scene):
+        self.scene   = scene
+        self.enabled = False
+
+    def nodes_by_label(self):
+        return {i.label.toPlainText(): i for i in self.scene.items() if isinstance(i, Node)}
+
+    def wires(self):
+        return [w for w in self.scene.wires() if w.end_obj is not None]
+
+    def enable(self):
+        self.enabled = True
+        self.refresh()
+
+    def disable(self):
+        self.enabled = False
+        for node in self.nodes_by_label().values():
+            node.clear_overlay(self.key)
+            node.set_annotation(self.key, None)
+
+    def refresh(self, names=None):
+        pass
+
+class RateOverlay(Overlay):
+    """Draws the estimated bytes per second along each wire as its width and
+    color, annotates nodes with their buffer memory, and ranks the nodes that
+    have the most data to process."""
+    key = 'rates'
+
+    def __init__(self, scene, dock=None):
+        super(RateOverlay, self).__init__(scene)
+        self.estimator = RateEstimator(scene.pipeline)
+        self.dock = dock
+        self.peak = None
+
+    def enable(self):
+        self.scene.sync_pipeline()
+        self.estimator.run()
+        # Re-estimate whenever the pipeline is synced, by whoever syncs it,
+        # and have the scene sync shortly after it settles down
+        self.scene.pipeline_listeners.append(self)
+        self.scene.changed.connect(self.scene.schedule_sync)
+        super(RateOverlay, self).enable()
+
+    def disable(self):
+        self.scene.changed.disconnect(self.scene.schedule_sync)
+        self.scene.pipeline_listeners.remove(self)
+        super(RateOverlay, self).disable()
+        for wire in self.wires():
+            wire.set_overlay_style(None)
+        if self.dock:
+            self.dock.set_rows([])
+
+    def update(self, changed):
+        self.estimator.update(changed)
+        if len(changed) > 0:
+            self.refresh(self.scene.pipeline.descendants(changed))
+
+    def refresh(self, names=None):
+        if not self.enabled:
+            return
+        estimates = self.estimator.estimates
+        peak = max([e.output.bytes_per_sec for e in estimates.values()] + [1.0])
+        if peak != self.peak:
+            # Everything is scaled to the busiest wire
+            self.peak = peak
+            names = None
+
+        for wire in self.wires():
+            source_name = wire.start_obj.parent.label.toPlainText()
+            if names is not None and source_name not in names and wire.overlay_style is not None:
+                continue
+            rate = self.estimator.wire_rate(source_name)
+            # Scale logarithmically over six decades below the busiest wire
+            fraction = np.clip(1.0 + np.log10(max(rate, 1.0)/peak)/6.0, 0.0, 1.0)
+            wire.set_overlay_style((load_color(fraction), 2.0 + 8.0*fraction))
+
+        for name, node in self.nodes_by_label().items():
+            if (names is not None and name not in names) or name not in estimates:
+                continue
+            est = estimates[name]
+            node.set_annotation(self.key, "{}/s, {} buffered".format(
+                format_bytes(est.output.bytes_per_sec), format_bytes(est.memory)))
+
+        if self.dock:
+            self.dock.set_rows([[(name, name),
+                                 (format_bytes(est.bytes_in_per_sec, "B/s"), est.bytes_in_per_sec),
+                                 (format_bytes(est.memory), est.memory)]
+                                for name, est in self.estimator.bottlenecks()])
+
+class TelemetryOverlay(Overlay):
+    """Colors nodes by how busy they are, and wires by the records per second
+    leaving their source, from the telemetry of a running acquisition. The
+    reader thread only keeps the latest update per node, and the overlay
+    drains it at a fixed refresh rate, so a flood of updates never reaches
+    the GUI thread."""
+    key = 'telemetry'
+
+    def __init__(self, scene, refresh_rate=4.0):
+        super(TelemetryOverlay, self).__init__(scene)
+        self.reader = None
+        self.loads  = {}
+        self.styled = {} # wire -> (style before telemetry, style telemetry gave it)
+
+        self.timer = QTimer()
+        self.timer.setInterval(int(1000.0/refresh_rate))
+        self.timer.timeout.connect(self.poll)
+
+    def connect(self, address):
+        self.disconnect()
+        self.loads  = {}
+        self.reader = TelemetryReader(address)
+        self.reader.start()
+        self.enable()
+        self.timer.start()
+
+    def disconnect(self):
+        if self.reader is not None:
+            self.reader.stop()
+            self.reader = None
+        self.timer.stop()
+        if self.enabled:
+            self.disable()
+            # Give back the wires whose styling is still ours, e.g. to the data rates
+            for wire, (previous, ours) in self.styled.items():
+                if wire.overlay_style == ours:
+                    wire.set_overlay_style(previous)
+            self.styled = {}
+
+    def poll(self):
+        if self.reader is None:
+            return
+        if not self.reader.running:
+            self.scene.window.set_status("Telemetry stopped: {}".format(self.reader.error or "stream closed"), 5000)
+            self.disconnect()
+            return
+        updates = self.reader.snapshot()
+        for label, update in updates.items():
+            self.loads.setdefault(label, NodeLoad()).add(update)
+        if len(updates) > 0:
+            self.refresh(set(updates.keys()))
+
+    def refresh(self, names=None):
+        if not self.enabled:
+            return
+        nodes = self.nodes_by_label()
+        for name in (self.loads.keys() if names is None else names):
+            if name not in nodes:
+                continue
+            load = self.loads[name]
+            nodes[name].set_overlay(self.key, load_color(load.busy))
+            nodes[name].set_annotation(self.key, "{:.3g} rec/s, queue {}, {:.0f}% busy".format(
+                load.records_per_sec, load.queue, 100.0*load.busy))
+
+        peak = max([l.records_per_sec for l in self.loads.values()] + [1.0])
+        for wire in self.wires():
+            source_name = wire.start_obj.parent.label.toPlainText()
+            if source_name in self.loads and (names is None or source_name in names):
+                fraction = self.loads[source_name].records_per_sec/peak
+                style = (load_color(fraction), 2.0 + 6.0*fraction)
+                previous = wire.overlay_style
+                if wire in self.styled and previous == self.styled[wire][1]:
+                    previous = self.styled[wire][0]
+                wire.set_overlay_style(style)
+                self.styled[wire] = (previous, style)
+
+class HeatmapOverlay(Overlay):
+    """Tints every node by its share of the total pipeline time from a
+    profiling log, and lists the hottest nodes."""
+    key = 'heatmap'
+    levels = 32 # Shares are quantized so that tiny changes don't repaint
+
+    def __init__(self, scene, dock=None):
+        super(HeatmapOverlay, self).__init__(scene)
+        self.dock    = dock
+        self.timings = {}
+        self.shares  = {}
+
+    def load(self, filename):
+        self.timings = read_profile(filename)
+        self.shares  = time_shares(self.timings)
+        self.enable()
+
+    def disable(self):
+        super(HeatmapOverlay, self).disable()
+        for node in self.nodes_by_label().values():
+            node.set_tint(None)
+        if self.dock:
+            self.dock.set_rows([])
+
+    def tint(self, share, peak):
+        # Scale to the hottest node so that the colors span the whole range
+        level = int(round(self.levels*share/peak)) if peak > 0 else 0
+        color = load_color(level/float(self.levels))
+        color.setAlpha(60 + int(120*level/float(self.levels)))
+        return color
+
+    def refresh(self, names=None):
+        if not self.enabled:
+            return
+        peak = max(self.shares.values()) if len(self.shares) > 0 else 0.0
+        for name, node in self.nodes_by_label().items():
+            if name in self.shares:
+                node.set_tint(self.tint(self.shares[name], peak))
+            else:
+                node.set_tint(None)
+
+        if self.dock:
+            self.dock.set_rows([[(name, name),
+                                 ("{:.1f}%".format(100.0*self.shares[name]), self.shares[name]),
+                                 ("{:d}".format(t.calls), t.calls),
+                                 ("{:.4g}".format(t.total), t.total),
+                                 ("{:.4g}".format(1e3*t.mean), t.mean)]
+                                for name, t in self.timings.items()])
+            self.dock.table.sortItems(1, Qt.DescendingOrder)
+
+class PartitionOverlay(Overlay):
+    """Outlines every node in the color of the worker it is assigned to"""
+    key = 'partition'
+
+    def color(self, worker):
+        # Spread the hues using the golden ratio so neighboring workers differ
+        return QColor.fromHsvF((0.61803398875*worker) % 1.0, 0.7, 0.95)
+
+    def refresh(self, names=None):
+        if not self.enabled:
+            return
+        for name, node in self.nodes_by_label().items():
+            if node.affinity is None:
+                node.clear_overlay(self.key)
+                node.set_annotation(self.key, None)
+            else:
+                node.set_overlay(self.key, self.color(node.affinity))
+                node.set_annotation(self.key, "worker {}".format(node.affinity))
+
+class UnusedOverlay(Overlay):
+    """Outlines the enabled filters whose output never reaches a writer or
+    plotter, and which could be disabled without losing any data."""
+    key = 'unused'
+
+    def __init__(self, scene, sinks=None):
+        super(UnusedOverlay, self).__init__(scene)
+        self.loaded_sinks = sinks
+        self.unused = []
+
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(500)
+        self.timer.timeout.connect(self.scene_changed)
+
+    @property
+    def sinks(self):
+        # The catalog is only loaded once it's needed to find types derived from the sinks
+        if self.loaded_sinks is None:
+            self.loaded_sinks = sink_types(self.scene.validator.catalog)
+        return self.loaded_sinks
+
+    def enable(self):
+        self.scene.changed.connect(self.schedule)
+        super(UnusedOverlay, self).enable()
+
+    def disable(self):
+        self.scene.changed.disconnect(self.schedule)
+        self.timer.stop()
+        super(UnusedOverlay, self).disable()
+
+    def schedule(self, regions=None):
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def scene_changed(self):
+        if len(self.scene.sync_pipeline()) > 0:
+            self.refresh()
+
+    def refresh(self, names=None):
+        if not self.enabled:
+            return
+        self.scene.sync_pipeline()
+        self.unused = unused_nodes(self.scene.pipeline, self.sinks)
+        unused = set(self.unused)
+        for name, node in self.nodes_by_label().items():
+            if name in unused:
+                node.set_overlay(self.key, QColor(150, 80, 200))
+                node.set_annotation(self.key, "unused")
+            else:
+                node.clear_overlay(self.key)
+                node.set_annotation(self.key, None)
+
+class DiffOverlay(Overlay):
+    """Outlines the nodes that differ from another version of the library,
+    green when added, orange when changed, and red when they conflict in a
+    merge. Removed nodes are only listed, as they are not on the canvas."""
+    key = 'diff'
+    colors = {ADDED: QColor(60, 180, 75), CHANGED: QColor(245, 130, 48), CONFLICT: QColor(230, 25, 75)}
+
+    def __init__(self, scene, dock=None):
+        super(DiffOverlay, self).__init__(scene)
+        self.dock         = dock
+        self.reference    = OrderedDict()
+        self.fingerprints = {}
+        self.diffs        = OrderedDict()
+        self.conflicts    = {}
+
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(500)
+        self.timer.timeout.connect(self.scene_changed)
+
+    def compare(self, entries, conflicts=()):
+        """Compare the canvas against entries, marking the given merge conflicts"""
+        self.reference    = entries
+        self.fingerprints = entry_fingerprints(entries)
+        self.conflicts    = {}
+        for c in conflicts:
+            self.conflicts.setdefault(c.name, []).append(c)
+        if self.enabled:
+            self.refresh()
+        else:
+            self.enable()
+
+    def enable(self):
+        self.scene.changed.connect(self.schedule)
+        super(DiffOverlay, self).enable()
+
+    def disable(self):
+        if self.enabled:
+            self.scene.changed.disconnect(self.schedule)
+        self.timer.stop()
+        super(DiffOverlay, self).disable()
+        if self.dock:
+            self.dock.set_rows([])
+
+    def schedule(self, regions=None):
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def scene_changed(self):
+        if len(self.scene.sync_pipeline()) > 0:
+            self.refresh()
+
+    def refresh(self, names=None):
+        if not self.enabled:
+            return
+        self.scene.sync_pipeline()
+        # The pipeline already holds the fingerprints of the canvas
+        nodes = self.scene.pipeline.nodes
+        current = OrderedDict((name, (node.entry, node.is_instrument)) for name, node in nodes.items())
+        self.diffs = diff_entries(self.reference, current, self.fingerprints,
+                                  {name: node.fingerprint for name, node in nodes.items()})
+
+        for name, node in self.nodes_by_label().items():
+            if name in self.conflicts:
+                node.set_overlay(self.key, self.colors[CONFLICT])
+                node.set_annotation(self.key, "conflict: " + ", ".join(
+                    c.key if c.key is not None else "removed" for c in self.conflicts[name]))
+            elif name in self.diffs:
+                node.set_overlay(self.key, self.colors[self.diffs[name].status])
+                node.set_annotation(self.key, self.diffs[name].status)
+            else:
+                node.clear_overlay(self.key)
+                node.set_annotation(self.key, None)
+
+        if self.dock:
+            rows = [[(name, name), (CONFLICT, 0), ("; ".join(c.marker() for c in cs), "")]
+                    for name, cs in self.conflicts.items()]
+            rows += [[(name, name), (d.status, 1), (d.summary(), "")]
+                     for name, d in self.diffs.items() if name not in self.conflicts]
+            self.dock.set_rows(rows)
@@ -9,9 +9,34 @@ from qtpy.QtCore import *
 from qtpy.QtWidgets import *
 
 import os
+import math
+
+from .util import static_text
+
+# Names available to the expressions of the bulk editor
+EXPRESSION_NAMES = {k: v for k, v in math.__dict__.items() if not k.startswith('_')}
+EXPRESSION_NAMES.update({'abs': abs, 'min': min, 'max': max, 'round': round, 'int': int, 'float': float, 'str': str})
+
+def bulk_values(values, mode, text):
+    """New values for a bulk edit of the current values. The mode is 'set'
+    for an absolute value, 'offset' to add a number, or 'expression' to
+    evaluate text with x the current value, i the position in the
+    selection, and n the size of the selection."""
+    if mode == 'set':
+        return [text]*len(values)
+    elif mode == 'offset':
+        offset = float(text)
+        return [v + offset for v in values]
+    elif mode == 'expression':
+        code = compile(text, '<expression>', 'eval')
+        names = dict(EXPRESSION_NAMES, n=len(values))
+        return [eval(code, {'__builtins__': {}}, dict(names, x=v, i=i)) for i, v in enumerate(values)]
+    raise ValueError("Unknown bulk edit mode {}".format(mode))
 
 class Parameter(QGraphicsEllipseItem):
-    """docstring for Parameter"""
+    """Parameter of a node. The value is held here, while the value box that
+    shows and edits it is only created once the parameter is on screen, and
+    destroyed again after its node has been collapsed for a while."""
     def __init__(self, name, parent=None):
         self.name = name
         self.parent = parent
@@ -20,6 +45,7 @@ class Parameter(QGraphicsEllipseItem):
 
         self.has_input   = True # Do we draw the connector?
         self.interactive = True # Can we modify the value?
+        self.collapsed   = False
         
         self.setBrush(QBrush(QColor(200,200,240)))
         self.setPen(Qt.black)
@@ -32,13 +58,18 @@ class Parameter(QGraphicsEllipseItem):
         self.wires_in  = []
         self.wires_out = []
 
-        # Text label and area
-        self.label = QGraphicsTextItem(self.name, parent=self)
-        self.label.setDefaultTextColor(Qt.black)
-        self.label.setPos(5,-10)
+        # Text label, painted along with the connector
+        self.label = static_text(self.name)
 
-        # Value Box
+        # Value and the box showing it, if created. Once the parameter
+        # belongs to a node in a scene the value lives in the node's row of
+        # the parameter store instead.
+        self._value = None
+        self.table  = None
+        self.row    = None
         self.value_box = None
+        self.box_width = 100.0
+        self.box_pending = False
 
     def set_changed_flag(self):
         # Would prefer to use signals/slots, but that's apparently too heavy for QGraphics
@@ -49,88 +80,177 @@ class Parameter(QGraphicsEllipseItem):
 
     def set_interactive(self, value):
         self.interactive = value
-        self.value_box.interactive = value
+        if self.value_box is not None:
+            self.value_box.interactive = value
 
     def set_collapsed(self, collapsed):
         self.collapsed = collapsed
-        self.value_box.setVisible(not self.collapsed)
+        if self.value_box is not None:
+            self.value_box.setVisible(not self.collapsed)
 
     def width(self):
-        return self.label.boundingRect().topRight().x()
+        # Including the margins of the text item this replaces
+        return self.label.size().width() + 8
 
     def set_box_width(self, width):
-        self.value_box.set_box_width(width)
+        self.prepareGeometryChange()
+        self.box_width = width
+        if self.value_box is not None:
+            self.value_box.set_box_width(width)
+
+    def kind(self):
+        """Python type of the values, which decides the column they are stored in"""
+        return object
+
+    def attach(self, table, row):
+        table.add_column(self.name, self.kind())
+        table.set(row, self.name, self._value, mark=False)
+        self.table, self.row = table, row
 
     def value(self):
-        return self.value_box.value()
+        if self.table is not None:
+            return self.table.get(self.row, self.name)
+        return self._value
+
+    def coerce(self, value):
+        return value
 
     def set_value(self, value):
-        self.value_box.set_value(value)
+        value = self.coerce(value)
+        if self.table is not None:
+            self.table.set(self.row, self.name, value)
+        else:
+            self._value = value
+        if self.value_box is not None:
+            self.value_box.refresh_value()
         self.set_changed_flag()
 
+    def create_value_box(self):
+        # Parameters without an editor of their own just show their value
+        return ReadOnlyBox(parent=self)
+
+    def show_value_box(self):
+        self.box_pending = False
+        if self.value_box is None and self.isVisible() and not self.collapsed:
+            self.value_box = self.create_value_box()
+            self.value_box.interactive = self.interactive
+            self.value_box.set_box_width(self.box_width)
+            self.value_box.refresh_value()
+
+    def release_value_box(self):
+        if self.value_box is not None:
+            box, self.value_box = self.value_box, None
+            if box.scene() is not None:
+                box.scene().removeItem(box)
+
+    def boundingRect(self):
+        # The whole row, so that it is painted whenever any of it is exposed
+        return QRectF(-5, -10, self.box_width+10, self.height+10)
+
     def paint(self, painter, options, widget):
         if self.has_input:
             super(Parameter, self).paint(painter, options, widget)
+        painter.setFont(QFont())
+        painter.setPen(Qt.black)
+        painter.drawStaticText(QPointF(9, -6), self.label)
+
+        if self.value_box is None and not self.collapsed:
+            if options.levelOfDetailFromTransform(painter.worldTransform()) < 0.4:
+                # Too small to edit, e.g. in the overview, so just suggest the box
+                self.paint_placeholder(painter)
+            elif not self.box_pending:
+                # Items can't be added while painting
+                self.box_pending = True
+                QTimer.singleShot(0, self.show_value_box)
+
+    def paint_placeholder(self, painter):
+        painter.setPen(QPen(QColor(200,200,200), 0.75))
+        painter.setBrush(QColor(175,175,175))
+        painter.drawRoundedRect(QRectF(3, 15, self.box_width-6, 14), 7.0, 7.0)
 
 class NumericalParameter(Parameter):
     """docstring for Parameter"""
     def __init__(self, name, datatype, min_value, max_value,
                  increment, snap, parent=None):
         super(NumericalParameter, self).__init__(name, parent=parent)
-        self.datatype = datatype
-        self.value_box = SliderBox(
-            datatype, min_value, max_value, increment, snap,
-            parent=self)
-        
-    def set_value(self, value):
-        self.value_box.set_value(self.datatype(value))
-        self.set_changed_flag()
+        self.datatype  = datatype
+        self.min_value = min_value
+        self.max_value = max_value
+        self.increment = increment
+        self.snap      = snap
+        self._value    = min_value
+
+    def coerce(self, value):
+        try:
+            if isinstance(value, str):
+                value = int(value) if self.datatype is int else float(value)
+            value = self.datatype(value)
+        except (TypeError, ValueError):
+            if self.scene() is not None:
+                self.scene().window.set_status("Got unreasonable input...")
+            return self.value()
+        if self.snap:
+            value = (value/self.snap)*self.snap
+        return self.datatype(min(max(value, self.min_value), self.max_value))
+
+    def kind(self):
+        return self.datatype
+
+    def create_value_box(self):
+        return SliderBox(parent=self)
 
 class StringParameter(Parameter):
     """docstring for Parameter"""
     def __init__(self, name, parent=None):
         super(StringParameter, self).__init__(name, parent=parent)
-        self.value_box = StringBox(parent=self)
-        self.parent = parent
-        
-    def set_value(self, value):
-        self.value_box.set_value(value)
+        self._value = ""
+
+    def create_value_box(self):
+        return StringBox(parent=self)
 
 class ComboParameter(StringParameter):
     """docstring for Parameter"""
     def __init__(self, name, values, parent=None):
         super(ComboParameter, self).__init__(name, parent=parent)
-        self.value_box.setParentItem(None)
-        self.value_box = ComboBox(values, parent=self)
-    def set_collapsed(self, collapsed):
-        self.collapsed = collapsed
-        self.value_box.setVisible(not self.collapsed)
+        self.values = values
+
+    def create_value_box(self):
+        return ComboBox(self.values, parent=self)
 
 class BooleanParameter(Parameter):
     """docstring for Parameter"""
     def __init__(self, name, parent=None):
         super(BooleanParameter, self).__init__(name, parent=parent)
-        self.value_box = CheckBox(parent=self)
+        self._value = False
         self.height = 15
         self.height_collapsed = 15
 
     def width(self):
-        return self.label.boundingRect().topRight().x() + 18
+        return self.label.size().width() + 8 + 18
+
+    def kind(self):
+        return bool
+
+    def create_value_box(self):
+        return CheckBox(parent=self)
+
+    def paint_placeholder(self, painter):
+        painter.setPen(Qt.black)
+        painter.setBrush(QColor(40,40,40) if self.value() else QColor(220,220,220))
+        painter.drawRect(QRectF(self.box_width-17, -3, 13, 13))
 
 class FilenameParameter(StringParameter):
     """docstring for Parameter"""
-    def __init__(self, name, parent=None):
-        super(FilenameParameter, self).__init__(name, parent=parent)
-        self.value_box.setParentItem(None)
-        self.value_box = FilenameBox(parent=self)
+    def create_value_box(self):
+        return FilenameBox(parent=self)
         
     def width(self):
-        return self.label.boundingRect().topRight().x() + 20
+        return self.label.size().width() + 8 + 20
 
 class SliderBox(QGraphicsRectItem):
-    """docstring for SliderBox"""
+    """Slider for a NumericalParameter, which holds the value and its range"""
 
-    def __init__(self, datatype, min_value, max_value, increment, snap, parent=None):
+    def __init__(self, parent=None):
         super(SliderBox, self).__init__(parent=parent)
         self.parent = parent
         self.dragging = False
@@ -138,19 +258,12 @@ class SliderBox(QGraphicsRectItem):
 
         self.interactive = True
 
-        self.datatype  = datatype
-        self.min_value = min_value
-        self.max_value = max_value
-        self.increment = increment
-        self.snap      = snap
-        self._value = min_value
-
         self.height = 14
         self.rect_radius = 7.0
         self.control_distance = 0.55228*self.rect_radius
         self.setRect(3,15,94,self.height)
 
-        self.label = ValueBoxText(self.textFromValue(self._value), parent=self)
+        self.label = ValueBoxText(self.textFromValue(self.value()), parent=self)
         label_width = self.label.boundingRect().topRight().x()
         self.label.setPos(3+0.5*self.rect().width()-0.5*label_width,15-5)
 
@@ -171,7 +284,8 @@ class SliderBox(QGraphicsRectItem):
         painter.setPen(QPen(QBrush(linear_gradient), 0.9*self.height, Qt.SolidLine, Qt.RoundCap))
         path = QPainterPath()
         path.moveTo(3+self.rect_radius, 15 + 0.5*self.height)
-        fill_size = (self.rect().width()-2*self.rect_radius)*(self._value-self.min_value)/(self.max_value-self.min_value)
+        param = self.parent
+        fill_size = (self.rect().width()-2*self.rect_radius)*(self.value()-param.min_value)/(param.max_value-param.min_value)
         path.lineTo(3+self.rect_radius+fill_size, 7.5 + 0.5+self.height)
         painter.drawPath(path)
 
@@ -185,44 +299,19 @@ class SliderBox(QGraphicsRectItem):
         path.lineTo(3+self.rect_radius+fill_size, 15.0 + 0.5*self.height)
         painter.drawPath(path)
 
-    def valueFromText(self, text):
-        try:
-            if self.datatype is int:
-                val =  int(str(text))
-            else:
-                val = float(str(text))
-            return val
-        except:
-            self.scene().window.set_status("Got unreasonable input...")
-            return self._value
-
     def textFromValue(self, value):
-        if self.datatype is int:
+        if self.parent.datatype is int:
             return ("{:d}".format(value))
         else:
             return ("{:.4g}".format(value))
 
     def set_value(self, val):
-        changed = False
-        val = self.valueFromText(val)
-        if val >= self.min_value and val <= self.max_value:
-            if self.snap:
-                val = (val/self.snap)*self.snap
-            self._value = self.datatype(val)
-            changed = True
-        elif val < self.min_value:
-            self._value = self.datatype(self.min_value)
-            changed = True
-        else:
-            self._value = self.datatype(self.max_value)
-            changed = True
-            
-        self.label.full_text = self.textFromValue(self._value)
-        self.label.setPlainText(self.textFromValue(self._value))
+        self.parent.set_value(val)
+
+    def refresh_value(self):
+        self.label.full_text = self.textFromValue(self.value())
+        self.label.setPlainText(self.label.full_text)
         self.refresh_label()
-        self.update()
-        if changed:
-            self.parent.set_changed_flag()
 
     def refresh_label(self):
         label_width = self.label.boundingRect().topRight().x()
@@ -230,7 +319,7 @@ class SliderBox(QGraphicsRectItem):
         self.update()
 
     def value(self):
-        return self._value
+        return self.parent.value()
 
     def set_box_width(self, width):
         self.setRect(3,15, width-6, self.height)
@@ -241,7 +330,7 @@ class SliderBox(QGraphicsRectItem):
     def mousePressEvent(self, event):
         if self.interactive:
             self.dragging = True
-            self.original_value = self._value
+            self.original_value = self.value()
             self.drag_start = event.scenePos()
         else:
             super(SliderBox, self).mouseMoveEvent(event)
@@ -250,7 +339,7 @@ class SliderBox(QGraphicsRectItem):
         if self.interactive:
             if self.dragging:
                 delta = event.scenePos() - self.drag_start
-                value_change = self.increment*int(delta.x()/10.0)
+                value_change = self.parent.increment*int(delta.x()/10.0)
                 if value_change != 0.0:
                     self.value_changed = True
                 self.set_value(self.original_value + value_change)
@@ -268,18 +357,18 @@ class SliderBox(QGraphicsRectItem):
             super(SliderBox, self).mouseMoveEvent(event)
 
 class StringBox(QGraphicsRectItem):
-    """docstring for SliderBox"""
+    """Text box for a StringParameter, which holds the value"""
     def __init__(self, parent=None):
         super(StringBox, self).__init__(parent=parent)
+        self.parent = parent
         self.clicked = False
-        self._value = ""
 
         self.height = 14
         self.rect_radius = 7.0
         self.control_distance = 0.55228*self.rect_radius
         self.setRect(3,15,94,self.height)
 
-        self.label = ValueBoxText(self._value, parent=self)
+        self.label = ValueBoxText(self.value(), parent=self)
         label_width = self.label.boundingRect().topRight().x()
         self.label.setPos(3+0.5*self.rect().width()-0.5*label_width,15-5)
 
@@ -294,14 +383,13 @@ class StringBox(QGraphicsRectItem):
         painter.drawRoundedRect(self.rect(), self.rect_radius, self.rect_radius)
 
     def set_value(self, value):
-        self._value = value
-        self.label.full_text = value
-        self.label.setPlainText(value)
+        self.parent.set_value(value)
+
+    def refresh_value(self):
+        self.label.full_text = self.value()
+        self.label.setPlainText(self.label.full_text)
         self.label.clip_text()
         self.refresh_label()
-        self.update()
-        if hasattr(self, 'parent'):
-            self.parent.set_changed_flag()
 
     def refresh_label(self):
         label_width = self.label.boundingRect().topRight().x()
@@ -309,7 +397,7 @@ class StringBox(QGraphicsRectItem):
         self.update()
 
     def value(self):
-        return self._value
+        return self.parent.value()
 
     def set_box_width(self, width):
         self.setRect(3,15, width-6, self.height)
@@ -325,6 +413,14 @@ class StringBox(QGraphicsRectItem):
             self.label.set_text_interaction(True)
         self.clicked = False
 
+class ReadOnlyBox(StringBox):
+    """Text box showing the value of a Parameter that can't be edited"""
+    def value(self):
+        return str(self.parent.value())
+
+    def mouseReleaseEvent(self, event):
+        self.clicked = False
+
 class FilenameBox(StringBox):
     """docstring for FilenameBox"""
     def __init__(self, parent=None):
@@ -338,8 +434,6 @@ class FilenameBox(StringBox):
         path = os.path.dirname(os.path.realpath(__file__))
         fn = QFileDialog.getSaveFileName(None, 'Save Results As', path)
         self.set_value(fn[0])
-        self.label.clip_text()
-        self.refresh_label()
 
     def refresh_label(self):
         label_width = self.label.boundingRect().topRight().x()
@@ -371,26 +465,27 @@ class ComboBox(StringBox):
         self.clicked = False
         
 class CheckBox(QGraphicsRectItem):
-    """docstring for CheckBox"""
+    """Check box for a BooleanParameter, which holds the value"""
     def __init__(self, parent=None):
         super(CheckBox, self).__init__(parent=parent)
         self.parent = parent
         self.setRect(self.rect().width()-17, -3, 13, 13)
         self.unchecked_brush = QBrush(QColor(220,220,220))
         self.checked_brush = QBrush(QColor(40,40,40))
-        self.setBrush(self.unchecked_brush)
-        self._value = False
         self.clicked = False
+        self.refresh_value()
 
     def set_box_width(self, width):
         self.setRect(width-17, -3, 13, 13)
 
     def value(self):
-        return self._value
+        return self.parent.value()
 
     def set_value(self, value):
-        self._value = value
-        if self._value:
+        self.parent.set_value(value)
+
+    def refresh_value(self):
+        if self.value():
             self.setBrush(self.checked_brush)
         else:
             self.setBrush(self.unchecked_brush)
@@ -400,7 +495,7 @@ class CheckBox(QGraphicsRectItem):
 
     def mouseReleaseEvent(self, event):
         if self.clicked: 
-            self.set_value(not self._value)
+            self.set_value(not self.value())
         self.clicked = False
 
 class ValueBoxText(QGraphicsTextItem):
@@ -0,0 +1,119 @@
+# coding: utf-8
+# Raytheon BBN Technologies 2016
+# Contributiors: Graham Rowlands
+#
+# This file contains the partitioning of the pipeline across worker
+# processes, balancing the cost of the filters while keeping the data
+# crossing between processes to a minimum.
+
+from .pipeline import *
+from .rates import RateEstimator
+
+class Partition(object):
+    """Assignment of node names to workers, with the resulting loads and the
+    total weight of the edges crossing between workers."""
+    def __init__(self, assignment, loads, cut):
+        self.assignment = assignment
+        self.loads      = loads
+        self.cut        = cut
+
+    def imbalance(self):
+        mean = sum(self.loads)/float(len(self.loads)) if len(self.loads) > 0 else 0.0
+        return max(self.loads)/mean if mean > 0 else 1.0
+
+def weighted_edges(pipeline, edge_weight):
+    """Undirected neighbor weights between the existing nodes. edge_weight
+    maps (source name, sink name) to the data volume along that edge."""
+    neighbors = {name: {} for name in pipeline.nodes}
+    for source_name, conn_name, sink_name in pipeline.edges():
+        if source_name in neighbors:
+            w = edge_weight(source_name, sink_name)
+            neighbors[source_name][sink_name] = neighbors[source_name].get(sink_name, 0.0) + w
+            neighbors[sink_name][source_name] = neighbors[sink_name].get(source_name, 0.0) + w
+    return neighbors
+
+def cut_weight(neighbors, assignment):
+    return 0.5*sum(w for name, nbrs in neighbors.items()
+                     for other, w in nbrs.items() if assignment[name] != assignment[other])
+
+def partition(pipeline, workers, cost=None, edge_weight=None, tolerance=0.1, passes=4):
+    """Assign the enabled nodes of pipeline to workers.
+
+    Nodes are placed greedily in topological order, each going to the worker
+    it shares the most data with unless that worker would exceed its share of
+    the total cost by more than tolerance. Single node moves that reduce the
+    cut without breaking the balance are then applied for a few passes."""
+    cost        = cost or (lambda name: 1.0)
+    edge_weight = edge_weight or (lambda source, sink: 1.0)
+    workers     = max(1, int(workers))
+
+    order, cyclic = pipeline.topological_order()
+    # Digitizers belong to the acquisition itself, so only filters are placed
+    names = [n for n in order + sorted(cyclic) if pipeline[n].enabled and not pipeline[n].is_instrument]
+    costs = {n: max(float(cost(n)), 0.0) for n in names}
+    neighbors = weighted_edges(pipeline, edge_weight)
+    for name in list(neighbors.keys()):
+        if name not in costs:
+            neighbors.pop(name)
+    for nbrs in neighbors.values():
+        for other in [o for o in nbrs if o not in costs]:
+            nbrs.pop(other)
+
+    capacity = (1.0 + tolerance)*sum(costs.values())/workers
+    loads = [0.0]*workers
+    assignment = {}
+
+    for name in names:
+        affinity = [0.0]*workers
+        for other, w in neighbors[name].items():
+            if other in assignment:
+                affinity[assignment[other]] += w
+        candidates = [k for k in range(workers) if loads[k] + costs[name] <= capacity]
+        if len(candidates) == 0:
+            candidates = list(range(workers))
+        best = max(candidates, key=lambda k: (affinity[k], -loads[k]))
+        assignment[name] = best
+        loads[best] += costs[name]
+
+    for _ in range(passes):
+        moved = False
+        for name in names:
+            here = assignment[name]
+            gains = [0.0]*workers
+            for other, w in neighbors[name].items():
+                gains[assignment[other]] += w
+            for k in sorted(range(workers), key=lambda k: -gains[k]):
+                if k == here or gains[k] <= gains[here]:
+                    break
+                if loads[k] + costs[name] <= capacity:
+                    loads[here] -= costs[name]
+                    loads[k]    += costs[name]
+                    assignment[name] = k
+                    moved = True
+                    break
+        if not moved:
+            break
+
+    return Partition(assignment, loads, cut_weight(neighbors, assignment))
+
+def partition_costs(pipeline, timings=None):
+    """Cost and edge weight functions for partition. Node costs are the
+    measured total time when timings (from a profiling log) are given, and
+    otherwise the estimated input data rate. Edges are weighted by their
+    estimated data rate."""
+    estimator = RateEstimator(pipeline)
+    estimator.run()
+
+    def edge_weight(source, sink):
+        return estimator.wire_rate(source)
+
+    if timings:
+        measured = [t.total for t in timings.values()]
+        typical = sum(measured)/len(measured) if len(measured) > 0 else 1.0
+        def cost(name):
+            return timings[name].total if name in timings else typical
+    else:
+        def cost(name):
+            est = estimator.estimates.get(name)
+            return est.bytes_in_per_sec if est is not None and est.bytes_in_per_sec > 0 else 1.0
+    return cost, edge_weight
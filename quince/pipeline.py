@@ -0,0 +1,228 @@
+# coding: utf-8
+# Raytheon BBN Technologies 2016
+# Contributiors: Graham Rowlands
+#
+# This file contains a headless model of the measurement pipeline, built
+# either from the yaml settings or from the nodes of a live scene.
+
+from collections import OrderedDict, deque
+
+from .store import parameter_values
+
+# Keys of a filter entry that describe the graph, or where the filter runs,
+# rather than parameters
+STRUCTURAL_KEYS = ('type', 'source', 'enabled', 'affinity')
+
+def parse_source(source_text):
+    """Get the source names from a 'source' entry. Each comma separated
+    source contains the node name, optionally followed by whitespace and
+    the connector name. The connector name defaults to "source"."""
+    sources = []
+    if not source_text:
+        return sources
+    for source in str(source_text).split(","):
+        source = source.split()
+        if len(source) == 0:
+            continue
+        node_name = source[0]
+        conn_name = "source"
+        if len(source) == 2:
+            conn_name = source[1]
+        sources.append((node_name, conn_name))
+    return sources
+
+def format_source(sources):
+    """Inverse of parse_source"""
+    return ", ".join(n if c == "source" else n + " " + c for n, c in sources)
+
+def plain(value):
+    """Convert ruamel containers and scalars into json friendly values."""
+    if hasattr(value, 'items'):
+        return {str(k): plain(v) for k, v in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return [plain(v) for v in value]
+    elif isinstance(value, bool) or value is None:
+        return value
+    elif isinstance(value, int):
+        return int(value)
+    elif isinstance(value, float):
+        return float(value)
+    return str(value)
+
+def fingerprint(entry):
+    """Hash a node entry independently of the ordering of its keys."""
+    return hash(tuple(sorted((str(k), repr(v)) for k, v in entry.items())))
+
+class PipelineNode(object):
+    """A single filter or digitizer of the pipeline"""
+    def __init__(self, name, entry, is_instrument=False):
+        self.name          = name
+        self.entry         = entry
+        self.is_instrument = is_instrument
+        self.type          = entry.get('type')
+        self.enabled       = entry.get('enabled', True)
+        self.sources       = [] if is_instrument else parse_source(entry.get('source', ""))
+        self.params        = {k: v for k, v in entry.items() if k not in STRUCTURAL_KEYS}
+        self.fingerprint   = fingerprint(entry)
+
+    def source_names(self):
+        return [n for n, c in self.sources]
+
+class Pipeline(object):
+    """Headless graph of the pipeline nodes. Edges are stored by name so that
+    references to missing nodes are retained, and consumers are indexed so
+    that an edit can be propagated to the nodes downstream of it."""
+    def __init__(self):
+        self.nodes     = OrderedDict()
+        self.consumers = {} # name -> set of names of the nodes that list it as a source
+
+    @classmethod
+    def from_settings(cls, settings):
+        pipeline = cls()
+        pipeline.sync(settings_entries(settings))
+        return pipeline
+
+    @classmethod
+    def from_scene(cls, scene):
+        pipeline = cls()
+        pipeline.sync(scene_entries(scene))
+        return pipeline
+
+    def __contains__(self, name):
+        return name in self.nodes
+
+    def __getitem__(self, name):
+        return self.nodes[name]
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def set_node(self, name, entry, is_instrument=False):
+        """Add or replace a node, returning True if anything changed."""
+        if name in self.nodes:
+            old = self.nodes[name]
+            if old.fingerprint == fingerprint(entry) and old.is_instrument == is_instrument:
+                return False
+            self._unlink(old)
+        node = PipelineNode(name, entry, is_instrument)
+        self.nodes[name] = node
+        for source_name in node.source_names():
+            self.consumers.setdefault(source_name, set()).add(name)
+        return True
+
+    def remove_node(self, name):
+        if name in self.nodes:
+            self._unlink(self.nodes.pop(name))
+
+    def _unlink(self, node):
+        for source_name in node.source_names():
+            if source_name in self.consumers:
+                self.consumers[source_name].discard(node.name)
+                if len(self.consumers[source_name]) == 0:
+                    self.consumers.pop(source_name)
+
+    def sync(self, entries):
+        """Bring the pipeline in line with entries, a dictionary of
+        name -> (entry, is_instrument). Returns the set of node names that
+        were added, removed, or modified."""
+        changed = set()
+        for name in list(self.nodes.keys()):
+            if name not in entries:
+                self.remove_node(name)
+                changed.add(name)
+        for name, (entry, is_instrument) in entries.items():
+            if self.set_node(name, entry, is_instrument):
+                changed.add(name)
+        return changed
+
+    def edges(self):
+        """Yield (source name, connector name, sink name) for every source reference."""
+        for node in self.nodes.values():
+            for source_name, conn_name in node.sources:
+                yield source_name, conn_name, node.name
+
+    def downstream(self, name):
+        return self.consumers.get(name, set())
+
+    def descendants(self, names):
+        """All nodes reachable downstream of names, including names themselves."""
+        seen  = set(names)
+        queue = deque(names)
+        while queue:
+            for consumer in self.downstream(queue.popleft()):
+                if consumer not in seen:
+                    seen.add(consumer)
+                    queue.append(consumer)
+        return seen
+
+    def topological_order(self):
+        """Kahn's algorithm over the existing nodes. Returns the ordered names and
+        the set of names left over, which are the nodes on or behind a cycle."""
+        in_degree = {name: 0 for name in self.nodes}
+        for node in self.nodes.values():
+            for source_name in set(node.source_names()):
+                if source_name in in_degree:
+                    in_degree[node.name] += 1
+        queue = deque(n for n, d in in_degree.items() if d == 0)
+        order = []
+        while queue:
+            name = queue.popleft()
+            order.append(name)
+            for consumer in self.downstream(name):
+                if consumer in in_degree:
+                    in_degree[consumer] -= 1
+                    if in_degree[consumer] == 0:
+                        queue.append(consumer)
+        return order, set(in_degree.keys()).difference(order)
+
+def settings_entries(settings):
+    """Entries for Pipeline.sync from the yaml settings. As in the loader,
+    only digitizers are taken from the instruments."""
+    entries = OrderedDict()
+    for name, par in settings["instruments"].items():
+        if "rx_channels" in par.keys():
+            entries[name] = (par, True)
+    for name, par in settings["filters"].items():
+        entries[name] = (par, False)
+    return entries
+
+def scene_entries(scene):
+    """Entries for Pipeline.sync from the nodes of a live scene, including
+    those hidden inside groups. Parameter values are read from the store a
+    column at a time."""
+    entries = OrderedDict()
+    nodes = scene.all_nodes()
+    values = parameter_values(nodes)
+    for node in nodes:
+        entries[node.label.toPlainText()] = (node.dict_repr(values.get(node)), node.is_instrument)
+    return entries
+
+def update_settings(settings, entries, exact=False):
+    """Write entries (name -> (entry, is_instrument)) back into the yaml
+    settings. Existing entries are updated in place in order to keep their
+    comments, and filters and digitizers without an entry are pruned.
+    Instruments other than digitizers are left alone. When exact, keys that
+    are missing from an entry are removed from the settings as well."""
+    for name, (entry, is_instrument) in entries.items():
+        section = "instruments" if is_instrument else "filters"
+        # Create a new entry if necessary
+        if name not in settings[section].keys():
+            settings[section][name] = {}
+        # Only write the values that changed, as ruamel maps are slow to update
+        target = settings[section][name]
+        for k, v in entry.items():
+            if k not in target or target[k] != v:
+                target[k] = v
+        if exact:
+            for k in [k for k in settings[section][name].keys() if k not in entry]:
+                settings[section][name].pop(k)
+        # Drop a worker assignment that has since been cleared
+        if not is_instrument and 'affinity' not in entry and 'affinity' in settings[section][name].keys():
+            settings[section][name].pop('affinity')
+
+    for section in ("filters", "instruments"):
+        for name in list(settings[section].keys()):
+            if name not in entries:
+                if section == "instruments" and "rx_channels" not in settings[section][name].keys():
+                    continue
+                settings[section].pop(name)
@@ -0,0 +1,184 @@
+# coding: utf-8
+# Raytheon BBN Technologies 2016
+# Contributiors: Graham Rowlands
+#
+# This file contains a static estimate of the data rates flowing through
+# the pipeline, starting from the digitizer settings
+
+from .pipeline import *
+
+# Assumed when the digitizer settings don't say how often it triggers
+DEFAULT_TRIGGER_RATE = 10e3 # Hz
+
+# Seconds of data a filter is assumed to hold in its input queue
+QUEUE_DEPTH = 0.1
+
+class Stream(object):
+    """Estimate of the data leaving a node"""
+    def __init__(self, records_per_sec=0.0, samples_per_record=0, bytes_per_sample=4,
+                 segments=1, round_robins=1):
+        self.records_per_sec    = float(records_per_sec)
+        self.samples_per_record = samples_per_record
+        self.bytes_per_sample   = bytes_per_sample
+        # Remaining axes of the data, used by the averaging filters
+        self.segments           = segments
+        self.round_robins       = round_robins
+
+    @property
+    def bytes_per_record(self):
+        return self.samples_per_record*self.bytes_per_sample
+
+    @property
+    def bytes_per_sec(self):
+        return self.records_per_sec*self.bytes_per_record
+
+    def copy(self, **kwargs):
+        s = Stream(self.records_per_sec, self.samples_per_record, self.bytes_per_sample,
+                   self.segments, self.round_robins)
+        for k, v in kwargs.items():
+            setattr(s, k, v)
+        return s
+
+class Estimate(object):
+    """Estimated input, output, and buffer memory of a single node"""
+    def __init__(self, output, bytes_in_per_sec=0.0, memory=0.0):
+        self.output           = output
+        self.bytes_in_per_sec = bytes_in_per_sec
+        self.memory           = memory
+
+def number(params, keys, default):
+    for k in keys:
+        if k in params:
+            try:
+                return float(params[k])
+            except (TypeError, ValueError):
+                pass
+    return default
+
+def digitizer_stream(node):
+    p = node.params
+    rate = number(p, ('trigger_rate', 'rep_rate'), None)
+    if rate is None:
+        interval = number(p, ('trigger_interval',), None)
+        rate = 1.0/interval if interval else DEFAULT_TRIGGER_RATE
+    return Stream(records_per_sec=rate,
+                  samples_per_record=int(number(p, ('record_length',), 1024)),
+                  bytes_per_sample=4,
+                  segments=int(number(p, ('nbr_segments',), 1)),
+                  round_robins=int(number(p, ('nbr_round_robins',), 1)))
+
+# Rules for how each filter type transforms its input stream. Each takes the
+# node and the combined input stream and returns the output stream. Types
+# without a rule pass their input through unchanged.
+
+def channelizer_rule(node, stream):
+    decimation = max(1, int(number(node.params, ('decimation_factor',), 1)))
+    return stream.copy(samples_per_record=max(1, stream.samples_per_record//decimation),
+                       bytes_per_sample=8)
+
+def integrator_rule(node, stream):
+    return stream.copy(samples_per_record=1, bytes_per_sample=8 if stream.bytes_per_sample > 4 else 4)
+
+def averager_rule(node, stream):
+    axis = str(node.params.get('axis', ''))
+    if axis == 'round_robins':
+        return stream.copy(records_per_sec=stream.records_per_sec/max(1, stream.round_robins), round_robins=1)
+    elif axis == 'segments':
+        return stream.copy(records_per_sec=stream.records_per_sec/max(1, stream.segments),
+                           samples_per_record=stream.samples_per_record*stream.segments, segments=1)
+    return stream.copy()
+
+def sink_rule(node, stream):
+    return stream.copy(records_per_sec=0.0)
+
+RATE_RULES = {
+    'Channelizer':      channelizer_rule,
+    'KernelIntegrator': integrator_rule,
+    'Averager':         averager_rule,
+    'Plotter':          sink_rule,
+    'XYPlotter':        sink_rule,
+    'MeshPlotter':      sink_rule,
+    'WriteToHDF5':      sink_rule,
+    'DataBuffer':       sink_rule,
+    'Print':            sink_rule,
+}
+
+def buffer_memory(node, stream, output):
+    # Averagers accumulate a sum and a sum of squares of the full average
+    if node.type == 'Averager':
+        return 2*stream.bytes_per_record*max(1, stream.segments)
+    return QUEUE_DEPTH*stream.bytes_per_sec + output.bytes_per_record
+
+def combine(streams):
+    # Filters with several inputs consume them all, but (like the correlator)
+    # emit at the rate of the fastest one.
+    total = sum(s.bytes_per_sec for s in streams)
+    fastest = max(streams, key=lambda s: s.bytes_per_sec)
+    return fastest, total
+
+class RateEstimator(object):
+    """Propagates records per second and bytes per second from the digitizers
+    through the pipeline. After an edit only the touched nodes and the nodes
+    downstream of them are recomputed."""
+    def __init__(self, pipeline, rules=None):
+        self.pipeline  = pipeline
+        self.rules     = RATE_RULES if rules is None else rules
+        self.estimates = {}
+
+    def run(self):
+        self.estimates = {}
+        order, _ = self.pipeline.topological_order()
+        for name in order:
+            self.estimate(name)
+        return self.estimates
+
+    def update(self, changed):
+        stale = self.pipeline.descendants(changed)
+        for name in stale:
+            self.estimates.pop(name, None)
+        order, _ = self.pipeline.topological_order()
+        for name in order:
+            if name in stale:
+                self.estimate(name)
+        return self.estimates
+
+    def estimate(self, name):
+        node = self.pipeline[name]
+        if node.is_instrument:
+            output = digitizer_stream(node) if node.enabled else Stream()
+            self.estimates[name] = Estimate(output, 0.0, QUEUE_DEPTH*output.bytes_per_sec)
+            return
+
+        inputs = [self.estimates[s].output for s in node.source_names() if s in self.estimates]
+        if not node.enabled or len(inputs) == 0:
+            self.estimates[name] = Estimate(Stream())
+            return
+
+        stream, bytes_in = combine(inputs)
+        rule = self.rules.get(node.type)
+        output = rule(node, stream) if rule else stream.copy()
+        self.estimates[name] = Estimate(output, bytes_in, buffer_memory(node, stream, output))
+
+    def wire_rate(self, source_name):
+        """Bytes per second along the wires leaving source_name"""
+        if source_name in self.estimates:
+            return self.estimates[source_name].output.bytes_per_sec
+        return 0.0
+
+    def bytes_in(self, names):
+        """Total bytes per second into the named nodes. Nodes on cycles are
+        never estimated, and are left out."""
+        return sum(self.estimates[n].bytes_in_per_sec for n in names if n in self.estimates)
+
+    def bottlenecks(self, count=None):
+        """Node names ranked by the data they have to process"""
+        ranked = sorted(self.estimates.items(), key=lambda e: e[1].bytes_in_per_sec, reverse=True)
+        ranked = [(name, est) for name, est in ranked if est.bytes_in_per_sec > 0]
+        return ranked if count is None else ranked[:count]
+
+def format_bytes(value, suffix="B"):
+    for unit in ("", "k", "M", "G"):
+        if abs(value) < 1000.0:
+            return "{:.3g} {}{}".format(value, unit, suffix)
+        value /= 1000.0
+    return "{:.3g} T{}".format(value, suffix)
@@ -0,0 +1,208 @@
+# coding: utf-8
+# Raytheon BBN Technologies 2016
+# Contributiors: Graham Rowlands
+#
+# This file contains the scripting interface for building and editing
+# pipelines. Edits are made to a headless model, either of a measurement
+# file or of a live scene, and are only applied to the scene once the
+# outermost batch ends, in a single undoable step. For example:
+#
+#   from quince.script import Graph
+#   g = Graph.open("measure.yml")
+#   with g.batch():
+#       for q in range(64):
+#           demod = g.add("Channelizer", "q{}-demod".format(q), source="X6-1",
+#                         decimation_factor=4)
+#           g.add("KernelIntegrator", "q{}-int".format(q), source=demod)
+#   g.save()
+#
+# In the running app the console (View > Console) holds the same object,
+# bound to the canvas, as graph.
+
+from contextlib import contextmanager
+from collections import OrderedDict
+
+from .config import *
+from .pipeline import *
+from .layout import Layout
+
+class Graph(object):
+    """Scriptable pipeline. Nodes are addressed by their labels, and
+    connections are given as the source label optionally followed by the
+    output connector name, as in the 'source' entries of the yaml."""
+    def __init__(self, entries, settings=None, filename=None, scene=None):
+        self.settings  = settings
+        self.filename  = filename
+        self.scene     = scene
+        self.depth     = 0
+        self.numbers   = {} # Last number handed out per label
+        self._load(entries)
+
+    def _load(self, entries):
+        # Positions are only pending until applied, after which the canvas has them
+        self.entries   = OrderedDict((name, dict(entry)) for name, (entry, is_instrument) in entries.items())
+        self.instruments = set(name for name, (entry, is_instrument) in entries.items() if is_instrument)
+        self.positions = {}
+        self.pipeline  = Pipeline()
+        self.pipeline.sync(self.model_entries())
+
+    @classmethod
+    def open(cls, filename):
+        """Headless graph of a measurement file"""
+        settings, _, _ = yaml_load(filename)
+        return cls(settings_entries(settings), settings=settings, filename=filename)
+
+    @classmethod
+    def from_scene(cls, scene):
+        """Graph of a live scene. Edits are applied to the canvas at the end
+        of each batch, and the scene is read again before the next one."""
+        scene.sync_pipeline()
+        return cls(scene_entries(scene), settings=getattr(scene, 'settings', None), scene=scene)
+
+    def model_entries(self):
+        return OrderedDict((name, (entry, name in self.instruments)) for name, entry in self.entries.items())
+
+    @contextmanager
+    def batch(self):
+        """Group edits so that the canvas is only updated, and the undo step
+        only recorded, once at the end. Batches may be nested."""
+        self.catch_up()
+        self.depth += 1
+        try:
+            yield self
+        finally:
+            self.depth -= 1
+            if self.depth == 0:
+                self.flush()
+
+    def changed(self, name):
+        if name in self.entries:
+            self.pipeline.set_node(name, dict(self.entries[name]), name in self.instruments)
+        else:
+            self.pipeline.remove_node(name)
+        if self.depth == 0:
+            self.flush()
+
+    def flush(self):
+        if self.scene is not None:
+            self.scene.apply_entries(self.model_entries(), self.positions)
+
+    def refresh(self):
+        """Re-read a live scene, e.g. after editing it by hand"""
+        if self.scene is not None:
+            self.scene.sync_pipeline()
+            self._load(scene_entries(self.scene))
+
+    def catch_up(self):
+        """Pick up edits made on the canvas since the last edit or batch, so
+        that applying the model doesn't undo them. Within a batch the model
+        is left alone until it has been applied."""
+        if self.depth == 0:
+            self.refresh()
+
+    # Editing
+
+    def add(self, node_type, name=None, source=None, position=None, **params):
+        """Add a node, returning its label. Without a name the type is used,
+        numbered like the nodes added on the canvas."""
+        self.catch_up()
+        name = self.unique_name(name or node_type)
+        entry = OrderedDict([('type', node_type), ('enabled', True)])
+        entry.update(params)
+        entry['source'] = self.source_text(source)
+        self.entries[name] = entry
+        if position is not None:
+            self.positions[name] = tuple(position)
+        self.changed(name)
+        return name
+
+    def add_digitizer(self, node_type, name, **params):
+        self.catch_up()
+        entry = OrderedDict([('type', node_type), ('enabled', True), ('rx_channels', {})])
+        entry.update(params)
+        self.entries[name] = entry
+        self.instruments.add(name)
+        self.changed(name)
+        return name
+
+    def set(self, name, **params):
+        """Set parameters of a node. Setting enabled or affinity works too."""
+        self.catch_up()
+        self.entries[name].update(params)
+        self.changed(name)
+
+    def remove(self, name):
+        self.catch_up()
+        self.entries.pop(name)
+        self.instruments.discard(name)
+        self.positions.pop(name, None)
+        self.changed(name)
+
+    def connect(self, source, sink, connector="source"):
+        self.catch_up()
+        sources = parse_source(self.entries[sink].get('source', ""))
+        if (source, connector) not in sources:
+            sources.append((source, connector))
+            self.entries[sink]['source'] = self.source_text(sources)
+            self.changed(sink)
+
+    def disconnect(self, source, sink, connector=None):
+        self.catch_up()
+        sources = [(n, c) for n, c in parse_source(self.entries[sink].get('source', ""))
+                   if not (n == source and (connector is None or c == connector))]
+        self.entries[sink]['source'] = self.source_text(sources)
+        self.changed(sink)
+
+    # Queries
+
+    def nodes(self, node_type=None):
+        self.catch_up()
+        return [n for n, e in self.entries.items() if node_type is None or e.get('type') == node_type]
+
+    def params(self, name):
+        self.catch_up()
+        return dict(self.pipeline[name].params)
+
+    def sources(self, name):
+        self.catch_up()
+        return self.pipeline[name].source_names()
+
+    def consumers(self, name):
+        self.catch_up()
+        return sorted(self.pipeline.downstream(name))
+
+    def descendants(self, name):
+        self.catch_up()
+        return sorted(self.pipeline.descendants([name]).difference([name]))
+
+    def save(self, filename=None):
+        """Write the measurement file, or save the canvas in the app"""
+        if self.scene is not None:
+            if self.depth > 0:
+                self.flush()
+            self.scene.save_for_yaml()
+            return
+        update_settings(self.settings, self.model_entries())
+        yaml_dump(self.settings, filename or self.filename)
+        if len(self.positions) > 0:
+            layout = Layout(filename or self.filename)
+            layout.update(self.positions)
+            layout.write()
+
+    # Helpers
+
+    def unique_name(self, label):
+        if label not in self.entries:
+            return label
+        number = self.numbers.get(label, 0) + 1
+        while "{}-{:d}".format(label, number) in self.entries:
+            number += 1
+        self.numbers[label] = number
+        return "{}-{:d}".format(label, number)
+
+    def source_text(self, source):
+        if source is None:
+            return ""
+        if isinstance(source, str):
+            source = parse_source(source)
+        return format_source(source)
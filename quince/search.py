@@ -0,0 +1,128 @@
+# coding: utf-8
+# Raytheon BBN Technologies 2016
+# Contributiors: Graham Rowlands
+#
+# This file contains the search index over the node labels, types, and
+# parameter values of the pipeline.
+
+import re
+from bisect import bisect_left, insort
+
+from .pipeline import *
+
+def node_terms(node):
+    """Lower case terms under which a node can be found"""
+    label = node.name.lower()
+    # The whole label as well as its words, e.g. q17-demod is found by demod
+    terms = set([label] + [w for w in re.split(r'[\s\-_.:/]+', label) if w])
+    if node.type:
+        terms.add(str(node.type).lower())
+    for k, v in node.params.items():
+        if isinstance(v, (dict, list)):
+            continue
+        terms.add(str(v).lower())
+        terms.add("{}={}".format(k, v).lower())
+    return terms
+
+def fuzzy_score(query, text):
+    """Length of the shortest stretch of text holding the characters of query
+    in order, or None if it doesn't hold them at all."""
+    best = None
+    start = text.find(query[0])
+    while start >= 0:
+        pos = start
+        for c in query[1:]:
+            pos = text.find(c, pos + 1)
+            if pos < 0:
+                return best
+        span = pos - start + 1
+        if best is None or span < best:
+            best = span
+        start = text.find(query[0], start + 1)
+    return best
+
+class SearchIndex(object):
+    """Sorted index of (term, node name) pairs, so that prefix matches are a
+    binary search. Follows a Pipeline, only re-indexing the changed nodes."""
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.terms    = {} # name -> set of terms
+        self.index    = [] # sorted (term, name)
+
+    def run(self):
+        self.terms = {name: node_terms(node) for name, node in self.pipeline.nodes.items()}
+        self.index = sorted((t, name) for name, terms in self.terms.items() for t in terms)
+
+    def update(self, changed):
+        # Inserting into the sorted index one by one only pays off for small edits
+        if len(changed) > 64:
+            self.run()
+            return
+        for name in changed:
+            for t in self.terms.pop(name, ()):
+                i = bisect_left(self.index, (t, name))
+                if i < len(self.index) and self.index[i] == (t, name):
+                    self.index.pop(i)
+            if name in self.pipeline:
+                self.terms[name] = node_terms(self.pipeline[name])
+                for t in self.terms[name]:
+                    insort(self.index, (t, name))
+
+    def prefix(self, word):
+        """Names with a term starting with word, labels matching first"""
+        labels, others = set(), set()
+        i = bisect_left(self.index, (word, ""))
+        while i < len(self.index) and self.index[i][0].startswith(word):
+            term, name = self.index[i]
+            if term in name.lower():
+                labels.add(name)
+            else:
+                others.add(name)
+            i += 1
+        order = lambda n: (len(n), n)
+        return sorted(labels, key=order) + sorted(others.difference(labels), key=order)
+
+    def fuzzy(self, word):
+        """Names whose label holds the characters of word in order, best first"""
+        scored = []
+        for name in self.terms:
+            score = fuzzy_score(word, name.lower())
+            if score is not None:
+                scored.append((score, len(name), name))
+        return [name for score, length, name in sorted(scored)]
+
+    def search(self, query, limit=None):
+        """Names matching every word of query. Each word matches by prefix if
+        possible, and otherwise fuzzily against the labels."""
+        results = None
+        for word in query.lower().split():
+            matches = self.prefix(word) or self.fuzzy(word)
+            if results is None:
+                results = matches
+            else:
+                keep = set(matches)
+                results = [n for n in results if n in keep]
+        results = results or []
+        return results if limit is None else results[:limit]
+
+def rank_names(query, names, recent=()):
+    """Order names for a palette. Prefix matches come before substring
+    matches, which come before fuzzy matches. Within each, recently used
+    names (most recent first in recent) come first."""
+    recent_rank = {n: i for i, n in enumerate(recent)}
+    query = query.strip().lower()
+    ranked = []
+    for name in names:
+        lower = name.lower()
+        if not query or lower.startswith(query):
+            tier, span = 0, 0
+        elif query in lower:
+            tier, span = 1, 0
+        else:
+            span = fuzzy_score(query, lower)
+            if span is None:
+                continue
+            tier = 2
+        # Shorter names are closer matches, without a query just go alphabetically
+        ranked.append((tier, recent_rank.get(name, len(recent_rank)), span, len(name) if query else 0, name))
+    return [r[-1] for r in sorted(ranked)]
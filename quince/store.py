@@ -0,0 +1,139 @@
+# coding: utf-8
+# Raytheon BBN Technologies 2016
+# Contributiors: Graham Rowlands
+#
+# This file contains the columnar store of parameter values. The values of
+# all nodes of a type are kept in one table, with a column per parameter,
+# so that saving, validation and bulk edits can read a whole column at once
+# rather than going parameter by parameter. It deliberately avoids Qt.
+
+import numpy as np
+
+def column_dtype(kind):
+    """Numpy dtype for the values of a parameter of the given python type"""
+    return {int: np.int64, float: np.float64, bool: np.bool_}.get(kind, object)
+
+class ParameterTable(object):
+    """Parameter values of the nodes of one type, a row per node. Cells that
+    are set to a different value are remembered until taken, so that saving
+    only needs to touch those. The rows of deleted nodes are kept, without
+    their owner, so that undoing the deletion can restore them."""
+    def __init__(self, capacity=16):
+        self.capacity = capacity
+        self.columns  = {} # name -> array
+        self.owners   = [] # Node of each row
+        self.dirty    = set() # (row, name)
+
+    def __len__(self):
+        return len(self.owners)
+
+    def add_row(self, owner):
+        if len(self.owners) == self.capacity:
+            self.capacity *= 2
+            for name, column in self.columns.items():
+                grown = np.zeros(self.capacity, dtype=column.dtype)
+                grown[:len(column)] = column
+                self.columns[name] = grown
+        self.owners.append(owner)
+        return len(self.owners) - 1
+
+    def release_row(self, row):
+        self.owners[row] = None
+
+    def restore_row(self, row, owner):
+        self.owners[row] = owner
+
+    def add_column(self, name, kind):
+        dtype = column_dtype(kind)
+        if name not in self.columns:
+            self.columns[name] = np.zeros(self.capacity, dtype=dtype)
+            if dtype == object:
+                self.columns[name][:] = None
+        elif self.columns[name].dtype != dtype:
+            # Parameters of the same name but different types share a column of objects
+            self.columns[name] = self.columns[name].astype(object)
+
+    def get(self, row, name):
+        column = self.columns[name]
+        return column[row] if column.dtype == object else column[row].item()
+
+    def set(self, row, name, value, mark=True):
+        column = self.columns[name]
+        old = column[row]
+        if mark and old is not value and old != value:
+            self.dirty.add((row, name))
+        try:
+            column[row] = value
+        except (TypeError, ValueError):
+            # e.g. None in a numeric column
+            self.columns[name] = column.astype(object)
+            self.columns[name][row] = value
+
+    def column(self, name, rows):
+        """Values of a column for the given rows, as python objects"""
+        return self.columns[name][np.asarray(rows, dtype=np.intp)].tolist()
+
+    def row_values(self, rows):
+        """name -> value dictionaries of the given rows, read column by column"""
+        values = [{} for r in rows]
+        for name in self.columns:
+            for d, v in zip(values, self.column(name, rows)):
+                d[name] = v
+        return values
+
+class ParameterStore(object):
+    """Tables of parameter values by node type"""
+    def __init__(self):
+        self.tables = {}
+
+    def table(self, node_type):
+        if node_type not in self.tables:
+            self.tables[node_type] = ParameterTable()
+        return self.tables[node_type]
+
+    def clear(self):
+        self.tables = {}
+
+    def dirty(self):
+        """Names of the changed parameters of each node"""
+        changed = {}
+        for table in self.tables.values():
+            for row, name in table.dirty:
+                if table.owners[row] is not None:
+                    changed.setdefault(table.owners[row], set()).add(name)
+        return changed
+
+    def take_dirty(self):
+        """Names of the changed parameters of each node, forgetting them. The
+        changes of deleted nodes are kept in case they are restored."""
+        changed = self.dirty()
+        for table in self.tables.values():
+            table.dirty = set((row, name) for row, name in table.dirty if table.owners[row] is None)
+        return changed
+
+def parameter_values(nodes):
+    """node -> (name -> value) of the nodes' parameters, read a column at a
+    time from each table. Nodes without a row in a table are left out."""
+    grouped = {}
+    for node in nodes:
+        if node.store_row is not None:
+            grouped.setdefault(node.store_table, []).append(node)
+    values = {}
+    for table, members in grouped.items():
+        for node, v in zip(members, table.row_values([n.store_row for n in members])):
+            values[node] = v
+    return values
+
+def parameter_column(params):
+    """Current values of the given parameters, read a column at a time"""
+    values = [None]*len(params)
+    grouped = {}
+    for i, p in enumerate(params):
+        if p.table is not None:
+            grouped.setdefault((p.table, p.name), []).append(i)
+        else:
+            values[i] = p.value()
+    for (table, name), indices in grouped.items():
+        for i, v in zip(indices, table.column(name, [params[i].row for i in indices])):
+            values[i] = v
+    return values
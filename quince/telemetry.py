@@ -0,0 +1,173 @@
+# coding: utf-8
+# Raytheon BBN Technologies 2016
+# Contributiors: Graham Rowlands
+#
+# This file contains the reader for the telemetry published by a running
+# acquisition, along with a stand-in publisher for testing. Neither
+# depends on Qt, the overlay polls the reader from the GUI thread.
+#
+# The telemetry is a stream of json lines, one per update, of the form
+#   {"node": "Demod-q1", "records": 12345, "queue": 3, "time": 1.25}
+# where records is the cumulative number of records processed by the
+# filter, queue the current depth of its input queue, and time the
+# cumulative processing time in seconds.
+
+import os, os.path
+import time
+import json
+import socket
+import random
+import argparse
+import threading
+
+def parse_address(address):
+    """Returns (kind, target) for addresses of the form tcp://host:port,
+    unix:///path/to/socket, or a plain filename of json lines."""
+    if address.startswith("tcp://"):
+        host, port = address[len("tcp://"):].rsplit(":", 1)
+        return "tcp", (host, int(port))
+    elif address.startswith("unix://"):
+        return "unix", address[len("unix://"):]
+    return "file", address
+
+class TelemetryReader(threading.Thread):
+    """Reads telemetry on a background thread, keeping only the latest update
+    per node. However fast updates arrive, the GUI only sees one per node for
+    each time it polls."""
+    def __init__(self, address):
+        super(TelemetryReader, self).__init__()
+        self.daemon   = True
+        self.address  = address
+        self.running  = True
+        self.error    = None
+        self.received = 0
+        self.lock     = threading.Lock()
+        self.latest   = {}
+        self.sock     = None
+
+    def run(self):
+        kind, target = parse_address(self.address)
+        try:
+            if kind == "file":
+                self.read_lines(self.follow(target))
+            else:
+                family = socket.AF_INET if kind == "tcp" else socket.AF_UNIX
+                self.sock = socket.socket(family, socket.SOCK_STREAM)
+                self.sock.connect(target)
+                with self.sock.makefile('r') as stream:
+                    self.read_lines(stream)
+        except (OSError, ValueError) as e:
+            if self.running:
+                self.error = str(e)
+        self.running = False
+
+    def follow(self, filename):
+        # Like tail -f, keep reading as the file grows
+        with open(filename, 'r') as f:
+            while self.running:
+                line = f.readline()
+                if line:
+                    yield line
+                else:
+                    time.sleep(0.05)
+
+    def read_lines(self, lines):
+        for line in lines:
+            if not self.running:
+                break
+            try:
+                update = json.loads(line)
+                label  = update["node"]
+            except (ValueError, KeyError, TypeError):
+                continue
+            update["received"] = time.time()
+            with self.lock:
+                self.latest[label] = update
+                self.received += 1
+
+    def snapshot(self):
+        """Latest update for every node that reported since the last snapshot"""
+        with self.lock:
+            latest, self.latest = self.latest, {}
+        return latest
+
+    def stop(self):
+        self.running = False
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.sock.close()
+
+class NodeLoad(object):
+    """Rates derived from successive updates of a single node"""
+    def __init__(self):
+        self.previous        = None
+        self.records_per_sec = 0.0
+        self.busy            = 0.0 # Fraction of the time spent processing
+        self.queue           = 0
+
+    def add(self, update):
+        self.queue = update.get("queue", 0)
+        if self.previous is not None:
+            dt = update["received"] - self.previous["received"]
+            if dt > 0:
+                self.records_per_sec = (update.get("records", 0) - self.previous.get("records", 0))/dt
+                self.busy = (update.get("time", 0.0) - self.previous.get("time", 0.0))/dt
+        self.previous = update
+
+def publish(address, labels, rate=1000.0, duration=None):
+    """Stand-in for a running acquisition, publishing made up telemetry for
+    the given node labels at roughly rate updates per second."""
+    kind, target = parse_address(address)
+    counts = {l: [0, 0.0, random.uniform(0.1, 1.0)] for l in labels}
+
+    if kind == "file":
+        out = open(target, 'a')
+    else:
+        family = socket.AF_INET if kind == "tcp" else socket.AF_UNIX
+        server = socket.socket(family, socket.SOCK_STREAM)
+        if kind == "unix" and os.path.exists(target):
+            os.remove(target)
+        server.bind(target)
+        server.listen(1)
+        print("Waiting for quince to connect to {}".format(address))
+        conn, _ = server.accept()
+        out = conn.makefile('w')
+
+    start = time.time()
+    try:
+        while duration is None or time.time() - start < duration:
+            label = random.choice(labels)
+            records, busy, weight = counts[label]
+            counts[label][0] = records + int(random.uniform(50, 150)*weight)
+            counts[label][1] = busy + random.uniform(0.0, 2.0*weight)/rate*len(labels)
+            out.write(json.dumps({"node": label, "records": counts[label][0],
+                                  "queue": int(random.uniform(0, 20)*weight),
+                                  "time": counts[label][1]}) + "\n")
+            out.flush()
+            time.sleep(1.0/rate)
+    except (BrokenPipeError, ConnectionResetError, KeyboardInterrupt):
+        pass
+    finally:
+        try:
+            out.close()
+        except OSError:
+            pass
+        if kind != "file":
+            server.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish stand-in pipeline telemetry for the nodes of a measurement file.")
+    parser.add_argument('filename', type=str, help='Measurement library filename')
+    parser.add_argument('address', type=str, help='tcp://host:port, unix:///path, or a filename')
+    parser.add_argument('--rate', type=float, default=1000.0, help='Updates per second')
+    args = parser.parse_args()
+
+    from .config import yaml_load
+    settings, _, _ = yaml_load(args.filename)
+    publish(args.address, list(settings["filters"].keys()), rate=args.rate)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+# coding: utf-8
+# Raytheon BBN Technologies 2016
+# Contributiors: Graham Rowlands
+#
+# This file contains parameterized pipeline templates, i.e. filter chains
+# saved with placeholders such as ${channel} and ${source} that can be
+# instantiated many times over. Templates are stored as yaml in the same
+# form as the filters section of a measurement file.
+
+import os, os.path
+from string import Template
+from collections import OrderedDict
+
+from .config import *
+from .pipeline import *
+
+TEMPLATE_DIR = os.path.join(os.path.expanduser("~"), ".quince", "templates")
+
+def substitute(value, values):
+    if isinstance(value, str):
+        return Template(value).safe_substitute(values)
+    return value
+
+def parameterize(value, text, placeholder):
+    if isinstance(value, str) and text:
+        return value.replace("$", "$$").replace(text, "${" + placeholder + "}")
+    return value
+
+class PipelineTemplate(object):
+    """Filter entries keyed by label, with the positions of the nodes
+    relative to the first one. Labels, string parameters, and sources may
+    contain placeholders."""
+    def __init__(self, name, filters, positions, placeholders):
+        self.name         = name
+        self.filters      = filters
+        self.positions    = positions
+        self.placeholders = placeholders
+
+    @classmethod
+    def from_entries(cls, name, entries, positions, channel=None):
+        """Template from the filter entries (as from Node.dict_repr) of a
+        selection. Every occurrence of the channel text becomes ${channel},
+        and each node feeding the selection from outside becomes ${source},
+        ${source2}, and so on."""
+        placeholders = ['channel'] if channel else []
+        external = OrderedDict()
+        for label, entry in entries.items():
+            for source_name, conn_name in parse_source(entry.get('source', "")):
+                if source_name not in entries and source_name not in external:
+                    external[source_name] = 'source' if len(external) == 0 else 'source{}'.format(len(external)+1)
+        placeholders.extend(external.values())
+
+        filters = OrderedDict()
+        origin = positions[next(iter(entries))] if len(entries) > 0 else (0.0, 0.0)
+        relative = OrderedDict()
+        for label, entry in entries.items():
+            new_entry = OrderedDict()
+            for k, v in entry.items():
+                if k == 'source':
+                    sources = []
+                    for source_name, conn_name in parse_source(v):
+                        if source_name in external:
+                            source_name = "${" + external[source_name] + "}"
+                        else:
+                            source_name = parameterize(source_name, channel, 'channel')
+                        sources.append(source_name if conn_name == "source" else source_name + " " + conn_name)
+                    v = ", ".join(sources)
+                elif k not in ('type', 'enabled'):
+                    v = parameterize(v, channel, 'channel')
+                new_entry[k] = v
+            new_label = parameterize(label, channel, 'channel')
+            filters[new_label] = new_entry
+            relative[new_label] = [positions[label][0] - origin[0], positions[label][1] - origin[1]]
+        return cls(name, filters, relative, placeholders)
+
+    def instantiate(self, values, unique_name=None):
+        """Returns the filter entries and positions for one copy, with the
+        placeholders replaced by values. If given, unique_name turns each
+        substituted label into one that isn't taken yet."""
+        renamed = OrderedDict()
+        for label in self.filters.keys():
+            name = substitute(label, values)
+            renamed[label] = unique_name(name) if unique_name else name
+
+        filters   = OrderedDict()
+        positions = OrderedDict()
+        for label, entry in self.filters.items():
+            new_entry = OrderedDict()
+            for k, v in entry.items():
+                if k == 'source':
+                    sources = []
+                    for source_name, conn_name in parse_source(v):
+                        source_name = renamed.get(source_name, substitute(source_name, values))
+                        sources.append(source_name if conn_name == "source" else source_name + " " + conn_name)
+                    v = ", ".join(sources)
+                else:
+                    v = substitute(v, values)
+                new_entry[k] = v
+            filters[renamed[label]]   = new_entry
+            positions[renamed[label]] = self.positions[label]
+        return filters, positions
+
+    def to_dict(self):
+        # Plain mappings, which keep their order, rather than !!omap
+        return {'name': self.name, 'placeholders': list(self.placeholders),
+                'filters': {label: dict(entry) for label, entry in self.filters.items()},
+                'positions': {label: list(pos) for label, pos in self.positions.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['name'], data['filters'], data['positions'], list(data.get('placeholders', [])))
+
+def template_filename(name, dirname=TEMPLATE_DIR):
+    return os.path.join(dirname, "".join(c if c.isalnum() or c in "-_" else "_" for c in name) + ".yml")
+
+def save_template(template, dirname=TEMPLATE_DIR):
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+    filename = template_filename(template.name, dirname)
+    yaml_dump(template.to_dict(), filename)
+    return filename
+
+def load_templates(dirname=TEMPLATE_DIR):
+    """Dictionary of template name -> PipelineTemplate"""
+    templates = OrderedDict()
+    if not os.path.isdir(dirname):
+        return templates
+    for fn in sorted(os.listdir(dirname)):
+        if fn.endswith(".yml"):
+            data, _, _ = yaml_load(os.path.join(dirname, fn))
+            template = PipelineTemplate.from_dict(data)
+            templates[template.name] = template
+    return templates
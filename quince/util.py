@@ -22,6 +22,39 @@ def next_available_name(node_names, label):
 	except:
 		return label + '-?'
 
+def static_text(text, font=None):
+	"""QStaticText laid out for font, so that its size is known before painting"""
+	static = QStaticText(text)
+	static.setTextFormat(Qt.PlainText)
+	static.prepare(QTransform(), font or QFont())
+	return static
+
+class NameAllocator(object):
+	"""Hands out labels in the style of next_available_name, but keeps the
+	taken labels and the highest number used per label, so that allocating
+	many names doesn't rescan the scene each time."""
+	def __init__(self, node_names):
+		self.taken = set(node_names)
+		self.highest = {}
+		for name in self.taken:
+			match = re.match('(.*)-(\d+)$', name)
+			if match:
+				label, number = match.group(1), int(match.group(2))
+				self.highest[label] = max(self.highest.get(label, 0), number)
+
+	def unique(self, label):
+		# Keep the label itself if it is still free
+		if label not in self.taken:
+			self.taken.add(label)
+			return label
+		number = self.highest.get(label, 0) + 1
+		while "{}-{:d}".format(label, number) in self.taken:
+			number += 1
+		self.highest[label] = number
+		name = "{}-{:d}".format(label, number)
+		self.taken.add(name)
+		return name
+
 def strip_numbers(label):
 	try:
 		match_attempt = re.match('(.*?)(\d+)$', label)
@@ -30,6 +63,10 @@ def strip_numbers(label):
 		stripped = label
 	return stripped
 
+def natural_key(label):
+	# Sort 'q2' before 'q10'
+	return [int(s) if s.isdigit() else s.lower() for s in re.split('(\d+)', label)]
+
 class dummy_object_QPointF(QObject):
 	"""Fake object for animation purposes"""
 	def __init__(self, getter, setter):
@@ -0,0 +1,198 @@
+# coding: utf-8
+# Raytheon BBN Technologies 2016
+# Contributiors: Graham Rowlands
+#
+# This file contains the headless validation of measurement pipelines
+
+import sys
+import argparse
+from collections import namedtuple
+
+from .config import *
+from .catalog import load_catalog
+from .pipeline import *
+
+Diagnostic = namedtuple('Diagnostic', ['severity', 'code', 'node', 'message'])
+
+ERROR   = 'error'
+WARNING = 'warning'
+
+class Validator(object):
+    """Checks a Pipeline for dangling sources, cycles, disabled nodes feeding
+    enabled ones, and parameter values the Auspex filters will not accept.
+
+    Diagnostics are kept per node, so that after an edit only the touched
+    nodes and their direct consumers need to be checked again. Cycles are
+    global, but are only searched for when the edges may have changed."""
+    def __init__(self, pipeline, catalog=None):
+        self.pipeline = pipeline
+        self.loaded_catalog    = catalog
+        self.node_diagnostics  = {}
+        self.cycle_diagnostics = []
+
+    @property
+    def catalog(self):
+        # Loading the catalog instantiates every Auspex filter, so wait until it's needed
+        if self.loaded_catalog is None:
+            self.loaded_catalog = load_catalog()
+        return self.loaded_catalog
+
+    @property
+    def diagnostics(self):
+        diags = list(self.cycle_diagnostics)
+        for name in self.pipeline.nodes:
+            diags.extend(self.node_diagnostics.get(name, []))
+        return diags
+
+    def errors(self):
+        return [d for d in self.diagnostics if d.severity == ERROR]
+
+    def warnings(self):
+        return [d for d in self.diagnostics if d.severity == WARNING]
+
+    def offending_nodes(self):
+        """Dictionary of node name -> worst severity"""
+        worst = {}
+        for d in self.diagnostics:
+            if worst.get(d.node) != ERROR:
+                worst[d.node] = d.severity
+        return worst
+
+    def run(self):
+        self.node_diagnostics = {}
+        for name in self.pipeline.nodes:
+            self.check_node(name)
+        self.check_cycles()
+        return self.diagnostics
+
+    def update(self, changed):
+        """Recheck after the nodes in changed were added, removed, or modified."""
+        recheck = set(changed)
+        for name in changed:
+            recheck.update(self.pipeline.downstream(name))
+        for name in recheck:
+            self.node_diagnostics.pop(name, None)
+            if name in self.pipeline:
+                self.check_node(name)
+        if len(changed) > 0:
+            self.check_cycles()
+        return self.diagnostics
+
+    def check_node(self, name):
+        node  = self.pipeline[name]
+        diags = []
+        spec  = self.catalog.get(node.type)
+
+        if spec is None and len(self.catalog) > 0:
+            diags.append(Diagnostic(WARNING, 'unknown-type', name,
+                "Unknown node type {}".format(node.type)))
+
+        for source_name, conn_name in node.sources:
+            if source_name not in self.pipeline:
+                diags.append(Diagnostic(ERROR, 'dangling-source', name,
+                    "Could not find source {}".format(source_name)))
+                continue
+            source = self.pipeline[source_name]
+            source_spec = self.catalog.get(source.type)
+            if source_spec is not None and conn_name not in source_spec.outputs:
+                diags.append(Diagnostic(ERROR, 'dangling-source', name,
+                    "{} has no output connector {}".format(source_name, conn_name)))
+            if node.enabled and not source.enabled:
+                diags.append(Diagnostic(WARNING, 'disabled-source', name,
+                    "Enabled node is fed by disabled node {}".format(source_name)))
+
+        if spec is not None:
+            if len(node.sources) > 0 and 'sink' not in spec.inputs:
+                diags.append(Diagnostic(ERROR, 'no-sink', name,
+                    "{} has no sink connector".format(node.type)))
+            for param_name, param_spec in spec.parameters.items():
+                if param_name in node.params:
+                    problem = param_spec.check(node.params[param_name])
+                    if problem:
+                        diags.append(Diagnostic(ERROR, 'invalid-value', name,
+                            "{}: {}".format(param_name, problem)))
+
+        if len(diags) > 0:
+            self.node_diagnostics[name] = diags
+
+    def check_cycles(self):
+        _, cyclic = self.pipeline.topological_order()
+        # Kahn's algorithm also leaves behind the nodes downstream of a cycle,
+        # so only report the strongly connected components among the leftovers.
+        self.cycle_diagnostics = []
+        for component in strongly_connected(self.pipeline, cyclic):
+            for name in sorted(component):
+                self.cycle_diagnostics.append(Diagnostic(ERROR, 'cycle', name,
+                    "Node is part of a cycle through {}".format(", ".join(sorted(component)))))
+
+def strongly_connected(pipeline, names):
+    """Iterative Tarjan's algorithm over the subgraph of pipeline spanned by
+    names. Returns the components that actually contain a cycle."""
+    index    = {}
+    lowlink  = {}
+    stack    = []
+    on_stack = set()
+    components = []
+    counter  = 0
+
+    for root in names:
+        if root in index:
+            continue
+        work = [(root, iter(pipeline.downstream(root).intersection(names)))]
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            name, children = work[-1]
+            advanced = False
+            for child in children:
+                if child not in index:
+                    index[child] = lowlink[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(pipeline.downstream(child).intersection(names))))
+                    advanced = True
+                    break
+                elif child in on_stack:
+                    lowlink[name] = min(lowlink[name], index[child])
+            if advanced:
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[name])
+            if lowlink[name] == index[name]:
+                component = set()
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.add(member)
+                    if member == name:
+                        break
+                if len(component) > 1 or name in pipeline.downstream(name):
+                    components.append(component)
+    return components
+
+def validate_settings(settings, catalog=None):
+    return Validator(Pipeline.from_settings(settings), catalog).run()
+
+def validate_file(filename, catalog=None):
+    settings, _, _ = yaml_load(filename)
+    return validate_settings(settings, catalog)
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate a measurement library without the GUI.")
+    parser.add_argument('filename', type=str, help='Measurement library filename')
+    args = parser.parse_args()
+
+    diagnostics = validate_file(args.filename)
+    for d in diagnostics:
+        print("{}: {} [{}] {}".format(d.severity, d.node, d.code, d.message))
+    errors = len([d for d in diagnostics if d.severity == ERROR])
+    print("{} errors, {} warnings".format(errors, len(diagnostics)-errors))
+    return 1 if errors > 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -13,7 +13,10 @@ import glob
 import time
 import os
 import os.path
+import weakref
 import numpy as np
+from collections import OrderedDict
+from contextlib import contextmanager
 
 from .node import *
 from .wire import *
@@ -22,6 +25,19 @@ from .graph import *
 from .util import *
 from .inspect import *
 from .load import *
+from .pipeline import *
+from .validate import *
+from .experiment import *
+from .analysis import *
+from .search import *
+from .overlay import *
+from .minimap import *
+from .group import *
+from .template import *
+from .store import *
+from .diff import *
+from .script import Graph
+from .console import ConsoleDock
 
 def strip_vendor_names(instr_name):
     vns = ["Agilent", "Alazar", "Keysight", "Holzworth", "Yoko", "Yokogawa"]
@@ -35,21 +51,41 @@ def correct_resource_name(resource_name):
         resource_name = resource_name.replace(k, v)
     return resource_name
 
+# How many node types the palette remembers as recently used
+RECENT_NODE_TYPES = 8
+
+# Room left around the items for scrolling past them
+SCENE_MARGIN = 2000.0
+
 class NodeScene(QGraphicsScene):
     """docstring for NodeScene"""
     def __init__(self, window=None):
         super(NodeScene, self).__init__()
         self.window = window
-        self.backdrop = QGraphicsRectItem()
-        self.backdrop.setRect(-10000,-10000,20000,20000)
-        self.backdrop.setZValue(-100)
-
-        self.qr = QRectF(-10000,-10000,20000,20000)
-        self.setSceneRect(self.qr)
         self.setBackgroundBrush(QBrush(QColor(60,60,60)))
 
-        self.addItem(self.backdrop)
+        # The scene rect follows the items, with room to scroll past them,
+        # and is only recomputed once the scene has settled
+        self.bounds_timer = QTimer(self)
+        self.bounds_timer.setSingleShot(True)
+        self.bounds_timer.setInterval(250)
+        self.bounds_timer.timeout.connect(self.update_scene_rect)
+        self.changed.connect(self.schedule_scene_rect)
+        self.setSceneRect(QRectF(-SCENE_MARGIN, -SCENE_MARGIN, 2*SCENE_MARGIN, 2*SCENE_MARGIN))
+
+        self.parameter_store = ParameterStore()
+
+        # Collapsed nodes release their value boxes in a single sweep, without
+        # keeping deleted nodes alive
+        self.collapsed_nodes = weakref.WeakKeyDictionary() # node -> time it was collapsed
+        self.release_timer = QTimer(self)
+        self.release_timer.setSingleShot(True)
+        self.release_timer.timeout.connect(self.sweep_value_boxes)
+
+        self.wire_layer = WireLayer()
+        self.addItem(self.wire_layer)
         self.view = None
+        self.fade_layer = None
 
         self.menu = QMenu()
         self.sub_menus = {}
@@ -60,14 +96,49 @@ class NodeScene(QGraphicsScene):
         clear_wires.triggered.connect(self.clear_wires)
         self.menu.addAction(clear_wires)
 
-        self.last_click = self.backdrop.pos()
+        self.last_click = QPointF(0, 0)
 
         self.qt_settings = QSettings("BBN", "Quince")
+        self.layout = None # Node positions of the measurement file, once loaded
 
         self.undo_stack = QUndoStack(self)
 
+        # Headless mirror of the scene used for validation
+        self.pipeline  = Pipeline()
+        self.validator = Validator(self.pipeline)
+        self.load_diagnostics = []
+        self.compiler  = ExperimentCompiler()
+
+        # Anything with an update(changed) method that should follow the pipeline
+        self.pipeline_listeners = [self.validator]
+
+        # Listeners that follow edits are brought up to date with a single
+        # sync once the scene settles down
+        self.sync_timer = QTimer(self)
+        self.sync_timer.setSingleShot(True)
+        self.sync_timer.setInterval(500)
+        self.sync_timer.timeout.connect(self.sync_pipeline)
+
         self.update_screen()
 
+    def drawBackground(self, painter, rect):
+        painter.fillRect(rect, self.backgroundBrush())
+
+    def schedule_scene_rect(self, regions):
+        if not self.bounds_timer.isActive():
+            self.bounds_timer.start()
+
+    def update_scene_rect(self):
+        """Fit the scene rect to the items, keeping what the views show so
+        that they don't jump when it shrinks"""
+        self.wire_layer.fit()
+        rect = self.itemsBoundingRect()
+        for view in self.views():
+            rect = rect.united(view.mapToScene(view.viewport().rect()).boundingRect())
+        rect = rect.adjusted(-SCENE_MARGIN, -SCENE_MARGIN, SCENE_MARGIN, SCENE_MARGIN)
+        if rect != self.sceneRect():
+            self.setSceneRect(rect)
+
     def update_screen(self):
         if hasattr(self.window, 'view'):
             dpr = self.window.devicePixelRatio()
@@ -77,6 +148,7 @@ class NodeScene(QGraphicsScene):
     def connectors_nearby(self, position, exclude=[]):
         connectors = [i for i in self.items() if isinstance(i, Connector)
                                               and i.connector_type == 'input'
+                                              and i.isEnabled()
                                               and i not in exclude]
         rs = {}
         for i, conn in enumerate(connectors):
@@ -95,10 +167,25 @@ class NodeScene(QGraphicsScene):
         else:
             return None
 
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton and self.wire_layer.press(event.scenePos(), event.modifiers()):
+            event.accept()
+            return
+        return super(NodeScene, self).mousePressEvent(event)
+
     def mouseMoveEvent(self, event):
+        if self.wire_layer.dragging is not None:
+            self.wire_layer.drag(event.scenePos())
+            return
         self.crowded_connectors_nearby(event.scenePos())
         return super(NodeScene, self).mouseMoveEvent(event)
 
+    def mouseReleaseEvent(self, event):
+        if self.wire_layer.dragging is not None:
+            self.wire_layer.drop(event.scenePos())
+            return
+        return super(NodeScene, self).mouseReleaseEvent(event)
+
     def crowded_connectors_nearby(self, position):
         conns = [i for i in self.items() if isinstance(i, Connector)]
         for conn in conns:
@@ -111,8 +198,7 @@ class NodeScene(QGraphicsScene):
                     conn.implode_wires()
 
     def clear_wires(self, only_clear_orphaned=False):
-        wires = [i for i in self.items() if isinstance(i, Wire)]
-        for wire in wires:
+        for wire in self.wires():
             if only_clear_orphaned:
                 if wire.end_obj is None:
                     self.removeItem(wire)
@@ -134,65 +220,288 @@ class NodeScene(QGraphicsScene):
 
     def load_yaml(self):
         load_from_yaml(self)
+        # The values just loaded match the file
+        self.parameter_store.take_dirty()
+        # Dangling sources in the file never make it onto the canvas as wires,
+        # so keep the loader's view of them until the file is next written.
+        self.load_diagnostics = [d for d in validate_settings(self.settings, self.validator.catalog)
+                                 if d.code == 'dangling-source']
+        self.validate()
+
+    @contextmanager
+    def batch_updates(self):
+        """Hold off repainting the views until a group of edits is done"""
+        views = [v for v in self.views() if v.updatesEnabled()]
+        for v in views:
+            v.setUpdatesEnabled(False)
+        try:
+            yield
+        finally:
+            for v in views:
+                v.setUpdatesEnabled(True)
+            self.update()
+
+    def all_nodes(self):
+        """Every node of the pipeline, including those hidden inside groups"""
+        nodes = []
+        for i in self.items():
+            if isinstance(i, GroupNode):
+                nodes.extend(i.all_members())
+            elif isinstance(i, Node):
+                nodes.append(i)
+        return nodes
+
+    def release_value_boxes_later(self, node):
+        self.collapsed_nodes[node] = time.time()
+        if not self.release_timer.isActive():
+            self.release_timer.start(VALUE_BOX_LIFETIME)
+
+    def sweep_value_boxes(self):
+        """Release the value boxes of the nodes that have stayed collapsed for
+        VALUE_BOX_LIFETIME, and wait for the next one to come due."""
+        now = time.time()
+        for node, collapsed_at in list(self.collapsed_nodes.items()):
+            if not node.collapsed:
+                del self.collapsed_nodes[node]
+            elif now - collapsed_at >= 1e-3*VALUE_BOX_LIFETIME:
+                node.release_value_boxes()
+                del self.collapsed_nodes[node]
+        if len(self.collapsed_nodes) > 0:
+            due = min(self.collapsed_nodes.values()) + 1e-3*VALUE_BOX_LIFETIME
+            self.release_timer.start(max(0, int(1e3*(due - now))))
+
+    def schedule_sync(self, regions=None):
+        if not self.sync_timer.isActive():
+            self.sync_timer.start()
+
+    def sync_pipeline(self):
+        # Only the nodes whose representation changed since the last pass are rechecked
+        self.sync_timer.stop()
+        changed = self.pipeline.sync(scene_entries(self))
+        for listener in self.pipeline_listeners:
+            listener.update(changed)
+        return changed
+
+    def validate(self):
+        self.sync_pipeline()
+
+        diagnostics = self.load_diagnostics + self.validator.diagnostics
+        worst = {}
+        messages = {}
+        for d in diagnostics:
+            if worst.get(d.node) != ERROR:
+                worst[d.node] = d.severity
+            messages.setdefault(d.node, []).append("{}: {}".format(d.severity, d.message))
+
+        # Problems inside a group are shown on the group
+        for group in [i for i in self.items() if isinstance(i, GroupNode)]:
+            for member in group.all_members():
+                name = member.label.toPlainText()
+                if name in worst:
+                    group_name = group.label.toPlainText()
+                    if worst.get(group_name) != ERROR:
+                        worst[group_name] = worst[name]
+                    messages.setdefault(group_name, []).extend(["{}: {}".format(name, m) for m in messages[name]])
+
+        for node in [i for i in self.items() if isinstance(i, Node)]:
+            name = node.label.toPlainText()
+            if name in worst:
+                node.set_overlay('validation', QColor(220,60,60) if worst[name] == ERROR else QColor(240,170,40))
+                node.setToolTip("\n".join(messages[name]))
+            elif 'validation' in node.overlays:
+                node.clear_overlay('validation')
+                node.setToolTip("")
+
+        return diagnostics
 
     def reload_yaml(self):
-        # Store node settings before reloading
-        self.save_node_positions_to_settings()
+        # Store node positions before reloading
+        self.save_layout()
 
         # Don't retain any undo information, since it is outdated
         self.undo_stack.clear()
 
+        # Release a fade that may still be running from the last load
+        if getattr(self, 'fade_layer', None) is not None:
+            self.fade_layer.finish()
+
         # Reconstruct the scene
         nodes = [i for i in self.items() if isinstance(i, Node)]
-        wires = [i for i in self.items() if isinstance(i, Wire)]
-        for o in nodes+wires:
+        for o in nodes+self.wires():
             self.removeItem(o)
+        self.parameter_store.clear()
         self.load_yaml()
 
-    def save_node_positions_to_settings(self):
-        for n in [i for i in self.items() if isinstance(i, Node)]:
-            self.qt_settings.setValue("node_positions/" + n.label.toPlainText() + "_pos_x", n.pos().x())
-            self.qt_settings.setValue("node_positions/" + n.label.toPlainText() + "_pos_y", n.pos().y())
-        self.qt_settings.sync()
+    def affinities_changed(self):
+        self.window.partition_overlay.refresh()
+
+    def save_layout(self, prune=False):
+        """Write the positions that changed to the layout sidecar. When
+        pruning, the positions of nodes no longer on the canvas are dropped."""
+        if self.layout is None:
+            return
+        nodes = self.all_nodes()
+        self.layout.update({n.label.toPlainText(): (n.pos().x(), n.pos().y()) for n in nodes})
+        if prune:
+            self.layout.prune(n.label.toPlainText() for n in nodes)
+        try:
+            self.layout.write()
+        except OSError as e:
+            self.window.set_status("Could not save the layout: {}".format(str(e)), 5000)
 
     def save_for_yaml(self):
-        self.save_node_positions_to_settings()
+        self.save_layout(prune=True)
 
-        nodes      = [i for i in self.items() if isinstance(i, Node)]
+        nodes      = self.all_nodes()
         node_names = [n.label.toPlainText() for n in nodes]
 
         if not hasattr(self, 'settings'):
             self.window.set_status("Not launched with yaml config. Cannot save to yaml.")
             return
 
+        # Report, but don't prevent saving, any problems with the pipeline. The
+        # file is about to be rewritten from the canvas, so stale source
+        # references found at load time no longer apply.
+        self.load_diagnostics = []
+        diagnostics = self.validate()
+        errors = len([d for d in diagnostics if d.severity == ERROR])
+        if len(diagnostics) > 0:
+            self.window.set_status("Saving with {} errors and {} warnings in the pipeline.".format(errors, len(diagnostics)-errors), 5000)
+
         # Start from the original config file in order that we can save comments
-        # and other human-friendly conveniences.
-        for node, node_name in zip(nodes, node_names):
-            if node.is_instrument:
-                # Create a new entry if necessary
-                if node_name not in self.settings["instruments"].keys():
-                    self.settings["instruments"][node_name] = {}
-                for k, v in node.dict_repr().items():
-                    self.settings["instruments"][node_name][k] = v
-            else:
-                # Create a new entry if necessary
-                if node_name not in self.settings["filters"].keys():
-                    self.settings["filters"][node_name] = {}
-                for k, v in node.dict_repr().items():
-                    self.settings["filters"][node_name][k] = v
-
-        # Prune stale (deleted) filters from the config, but
-        # leave instruments other than digitizers alone
-        for section in ("filters", "instruments"):
-            for name in list(self.settings[section].keys()):
-                if name not in node_names:
-                    if section=="instruments" and "rx_channels" not in self.settings[section][name].keys():
-                        continue
-                    self.settings[section].pop(name)
+        # and other human-friendly conveniences. Of the nodes already in the file,
+        # only the parameters that changed since the last save, or that are
+        # missing from the file, are written.
+        entries = scene_entries(self)
+        changed = self.parameter_store.take_dirty()
+        for node, name in zip(nodes, node_names):
+            entry, is_instrument = entries[name]
+            saved = self.settings["instruments" if is_instrument else "filters"].get(name)
+            if saved is not None:
+                for k in node.parameters:
+                    if k in saved and k not in changed.get(node, ()):
+                        entry.pop(k, None)
+        update_settings(self.settings, entries)
 
         self.window.ignore_file_updates = True
         self.window.ignore_timer.start()
         yaml_dump(self.settings, self.window.meas_file)
+        self.window.stamps = self.window.yaml_stamps()
+
+    def edited_entries(self):
+        """Entries of the canvas as the file would have them, leaving out the
+        parameters of nodes in the file that it doesn't set and that haven't
+        been edited since, so that they compare with other libraries."""
+        entries = scene_entries(self)
+        if not hasattr(self, 'settings'):
+            return entries
+        changed = self.parameter_store.dirty()
+        for node in self.all_nodes():
+            entry, is_instrument = entries[node.label.toPlainText()]
+            saved = self.settings["instruments" if is_instrument else "filters"].get(node.label.toPlainText())
+            if saved is not None:
+                for k in node.parameters:
+                    if k not in saved and k not in changed.get(node, ()):
+                        entry.pop(k, None)
+        return entries
+
+    def apply_entries(self, entries, positions=None):
+        """Make the canvas match entries (name -> (entry, is_instrument)) as a
+        single undo step. Nothing is recorded if they already match."""
+        current = scene_entries(self)
+        if set(current.keys()) == set(entries.keys()):
+            if all(fingerprint(current[n][0]) == fingerprint(e) for n, (e, i) in entries.items()):
+                return
+        self.undo_stack.push(CommandApplyEntries(entries, positions or {}, self))
+
+    def sync_nodes(self, entries, positions):
+        """Create, delete, and update nodes and wires so that the canvas
+        matches entries. Nodes whose entry is unchanged are not touched."""
+        current = scene_entries(self)
+        nodes = {n.label.toPlainText(): n for n in self.all_nodes()}
+        missing = set()
+        with self.batch_updates():
+            removed = [nodes.pop(n) for n in current if n not in entries]
+            if len(removed) > 0:
+                CommandDeleteNodes(removed, self).redo()
+
+            created = []
+            for name, (entry, is_instrument) in entries.items():
+                if name not in nodes:
+                    create_func = getattr(self, "create_"+("".join(str(entry.get('type')).split())), None)
+                    if create_func is None:
+                        missing.add(entry.get('type'))
+                        continue
+                    nodes[name] = create_func(label=name)
+                    nodes[name].base_params = {}
+                    created.append(name)
+
+            for name, (entry, is_instrument) in entries.items():
+                if name not in nodes or (name in current and fingerprint(current[name][0]) == fingerprint(entry)):
+                    continue
+                node = nodes[name]
+                for k, v in entry.items():
+                    if k in node.parameters:
+                        if node.parameters[k].value() != v:
+                            node.parameters[k].set_value(v)
+                    elif k not in STRUCTURAL_KEYS:
+                        node.base_params[k] = v
+                for k in [k for k in node.base_params.keys() if k not in entry]:
+                    node.base_params.pop(k)
+                if node.enabled != entry.get('enabled', True):
+                    node.enabled = entry.get('enabled', True)
+                node.affinity = entry.get('affinity')
+
+                sources = parse_source(entry.get('source', ""))
+                if 'sink' not in node.inputs or (name in current and sources == parse_source(current[name][0].get('source', ""))):
+                    continue
+                sink = node.inputs['sink']
+                for w in list(sink.wires_in):
+                    w.start_obj.wires_out.remove(w)
+                    sink.wires_in.remove(w)
+                    self.removeItem(w)
+                for source_name, conn_name in sources:
+                    if source_name in nodes and conn_name in nodes[source_name].outputs:
+                        start = nodes[source_name].outputs[conn_name]
+                        wire = Wire(start)
+                        self.addItem(wire)
+                        start.wires_out.append(wire)
+                        wire.end_obj = sink
+                        sink.wires_in.append(wire)
+                        wire.set_start(start.scenePos())
+                        wire.set_end(sink.scenePos())
+
+            # Place new nodes where asked, otherwise to the right of their first source
+            placed = {}
+            for name in created:
+                node = nodes[name]
+                sources = [n for n, c in parse_source(entries[name][0].get('source', "")) if n in nodes]
+                if name in positions:
+                    node.setPos(QPointF(*positions[name]))
+                elif len(sources) > 0:
+                    count = placed[sources[0]] = placed.get(sources[0], -1) + 1
+                    node.setPos(nodes[sources[0]].pos() + QPointF(250, 150*count))
+                else:
+                    count = placed[None] = placed.get(None, -1) + 1
+                    node.setPos(self.last_click + QPointF(0, 150*count))
+        if len(missing) > 0:
+            self.window.set_status("Could not create nodes of type {}".format(", ".join(sorted(str(m) for m in missing))), 5000)
+
+    def add_node(self, type_name):
+        """Create a node of the given type at the last click, as an undoable
+        command, and remember the type as recently used."""
+        name = "create_"+("".join(type_name.split()))
+        if not hasattr(self, name):
+            self.window.set_status("Could not create a node of the requested type.")
+            return
+        self.undo_stack.push(CommandAddNode(name, getattr(self, name), self))
+        recent = [t for t in self.recent_node_types() if t != type_name]
+        self.qt_settings.setValue("recent_node_types", [type_name] + recent[:RECENT_NODE_TYPES-1])
+
+    def recent_node_types(self):
+        recent = self.qt_settings.value("recent_node_types", [])
+        # QSettings hands back a plain string for a single entry
+        return [recent] if isinstance(recent, str) else list(recent or [])
 
     def create_node_by_name(self, name):
         create_node_func_name = "create_"+("".join(name.split()))
@@ -204,22 +513,42 @@ class NodeScene(QGraphicsScene):
             return None
 
     def removeItem(self, item):
-        super(NodeScene, self).removeItem(item)
+        if isinstance(item, Wire):
+            self.wire_layer.remove(item)
+        else:
+            super(NodeScene, self).removeItem(item)
 
     def addItem(self, item):
-        super(NodeScene, self).addItem(item)
+        # Wires are drawn by the wire layer rather than being items of their own
+        if isinstance(item, Wire):
+            self.wire_layer.add(item)
+        else:
+            super(NodeScene, self).addItem(item)
+
+    def wires(self):
+        return list(self.wire_layer.wires.keys())
 
 class NodeView(QGraphicsView):
     """docstring for NodeView"""
     def __init__(self, scene):
         super(NodeView, self).__init__(scene)
         self.scene = scene
-        self.centerOn(self.scene.qr.center())
+        self.centerOn(QPointF(0, 0))
 
         self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
         self.setRenderHint(QPainter.Antialiasing)
         self.current_scale = 1.0
 
+    def center_on_label(self, label):
+        nodes = [i for i in self.scene.items() if isinstance(i, Node) and i.label.toPlainText() == label]
+        if len(nodes) > 0:
+            self.center_on_node(nodes[0])
+
+    def center_on_node(self, node):
+        self.centerOn(node.sceneBoundingRect().center())
+        self.scene.clearSelection()
+        node.setSelected(True)
+
     def wheelEvent(self, event):
         change = 0.001*event.angleDelta().y()/2.0
         self.scale(1+change, 1+change)
@@ -228,7 +557,12 @@ class NodeView(QGraphicsView):
     def keyPressEvent(self, event):
         if not self.scene.focusItem() and event.key() in [Qt.Key_Delete, Qt.Key_Backspace]:
             selected_nodes = [i for i in self.scene.items() if isinstance(i, Node) and i.isSelected()]
+            selected_wires = list(self.scene.wire_layer.selected)
+            self.scene.undo_stack.beginMacro("Delete")
+            if len(selected_wires) > 0:
+                self.scene.undo_stack.push(CommandDeleteWires(selected_wires, self.scene))
             self.scene.undo_stack.push(CommandDeleteNodes(selected_nodes, self.scene))
+            self.scene.undo_stack.endMacro()
         else:
             return super(NodeView, self).keyPressEvent(event)
 
@@ -239,6 +573,8 @@ class NodeView(QGraphicsView):
             return super(NodeView, self).mousePressEvent(fake)
         elif event.button() == Qt.LeftButton:
             self.setDragMode(QGraphicsView.RubberBandDrag)
+            if not event.modifiers() & Qt.ControlModifier and not self.scene.wire_layer.hit(self.mapToScene(event.pos())):
+                self.scene.wire_layer.select([])
         return super(NodeView, self).mousePressEvent(event)
 
     def mouseReleaseEvent(self, event):
@@ -247,6 +583,11 @@ class NodeView(QGraphicsView):
             fake = QMouseEvent(event.type(), event.pos(), Qt.LeftButton, Qt.LeftButton, event.modifiers())
             return super(NodeView, self).mouseReleaseEvent(fake)
         elif event.button() == Qt.LeftButton:
+            # Wires aren't items, so the layer picks them out of the rubber band itself
+            band = self.rubberBandRect()
+            if not band.isNull():
+                self.scene.wire_layer.select_in_rect(self.mapToScene(band).boundingRect(),
+                                                     add=bool(event.modifiers() & Qt.ControlModifier))
             a = super(NodeView, self).mouseReleaseEvent(event)
             self.setDragMode(QGraphicsView.NoDrag)
             return a
@@ -281,11 +622,26 @@ class NodeWindow(QMainWindow):
         selectAllAction.setStatusTip('Select All')
         selectAllAction.triggered.connect(self.select_all)
 
+        addNodeAction = QAction('&Add Node...', self)
+        addNodeAction.setShortcut('Ctrl+N')
+        addNodeAction.setStatusTip('Search the node types and add one at the cursor.')
+        addNodeAction.triggered.connect(self.open_palette)
+
+        findAction = QAction('&Find Nodes...', self)
+        findAction.setShortcut('Ctrl+F')
+        findAction.setStatusTip('Search the nodes by label, type, or parameter value.')
+        findAction.triggered.connect(self.find_nodes)
+
         selectAllConnectedAction = QAction('&Select All Connected', self)
         selectAllConnectedAction.setShortcut('Shift+Ctrl+A')
         selectAllConnectedAction.setStatusTip('Select All Connected')
         selectAllConnectedAction.triggered.connect(self.select_all_connected)
 
+        self.selectWiresAction = QAction('Select &Wires', self)
+        self.selectWiresAction.setCheckable(True)
+        self.selectWiresAction.setStatusTip('Allow wires to be selected, by clicking or with the rubber band, and deleted.')
+        self.selectWiresAction.toggled.connect(self.scene.wire_layer.set_selectable)
+
         constructExperimentAction = QAction('&Construct Experiment', self)
         constructExperimentAction.setShortcut('Shift+Ctrl+E')
         constructExperimentAction.setStatusTip('Construct Experiment')
@@ -325,6 +681,100 @@ class NodeWindow(QMainWindow):
         redoAction.setStatusTip('Redo')
         redoAction.triggered.connect(self.redo)
 
+        validateAction = QAction('&Validate', self)
+        validateAction.setShortcut('Shift+Ctrl+V')
+        validateAction.setStatusTip('Check the pipeline for problems Auspex would run into.')
+        validateAction.triggered.connect(self.validate)
+
+        self.rateAction = QAction('Show &Data Rates', self)
+        self.rateAction.setCheckable(True)
+        self.rateAction.setStatusTip('Estimate the data rate along every wire from the digitizer settings.')
+        self.rateAction.toggled.connect(self.show_data_rates)
+
+        telemetryAction = QAction('Connect &Telemetry...', self)
+        telemetryAction.setStatusTip('Overlay live throughput and backlog from a running acquisition.')
+        telemetryAction.triggered.connect(self.connect_telemetry)
+
+        stopTelemetryAction = QAction('Disconnect Telemetry', self)
+        stopTelemetryAction.setStatusTip('Stop following the telemetry of a running acquisition.')
+        stopTelemetryAction.triggered.connect(self.disconnect_telemetry)
+
+        profileAction = QAction('Load &Profile...', self)
+        profileAction.setStatusTip('Tint the nodes by their share of the pipeline time from a profiling log.')
+        profileAction.triggered.connect(self.load_profile)
+
+        clearProfileAction = QAction('Clear Profile', self)
+        clearProfileAction.setStatusTip('Remove the profiling heatmap.')
+        clearProfileAction.triggered.connect(self.clear_profile)
+
+        compareAction = QAction('&Compare With Library...', self)
+        compareAction.setStatusTip('Highlight the nodes that differ from another version of the measurement library.')
+        compareAction.triggered.connect(self.compare_library)
+
+        mergeLibraryAction = QAction('&Merge Library...', self)
+        mergeLibraryAction.setStatusTip('Merge another version of the measurement library into the canvas.')
+        mergeLibraryAction.triggered.connect(self.merge_library)
+
+        clearCompareAction = QAction('Clear Comparison', self)
+        clearCompareAction.setStatusTip('Remove the highlighting of differences.')
+        clearCompareAction.triggered.connect(self.clear_comparison)
+
+        groupAction = QAction('&Group', self)
+        groupAction.setShortcut('Ctrl+G')
+        groupAction.setStatusTip('Collapse the selected nodes into a single group node.')
+        groupAction.triggered.connect(self.group_selected)
+
+        expandGroupAction = QAction('E&xpand Group', self)
+        expandGroupAction.setShortcut('Shift+Ctrl+G')
+        expandGroupAction.setStatusTip('Restore the nodes inside the selected groups.')
+        expandGroupAction.triggered.connect(self.expand_selected_groups)
+
+        saveTemplateAction = QAction('Save Selection as &Template...', self)
+        saveTemplateAction.setStatusTip('Save the selected filters as a template with placeholders.')
+        saveTemplateAction.triggered.connect(self.save_template)
+
+        instantiateAction = QAction('&Instantiate Template...', self)
+        instantiateAction.setShortcut('Shift+Ctrl+T')
+        instantiateAction.setStatusTip('Add many copies of a template, e.g. one per channel.')
+        instantiateAction.triggered.connect(self.instantiate_template)
+
+        bulkEditAction = QAction('&Bulk Edit Parameters...', self)
+        bulkEditAction.setShortcut('Shift+Ctrl+B')
+        bulkEditAction.setStatusTip('Set a parameter on every selected node at once.')
+        bulkEditAction.triggered.connect(self.bulk_edit)
+
+        mergeAction = QAction('&Merge Redundant Filters', self)
+        mergeAction.setStatusTip('Merge filters with identical types, parameters, and inputs into one.')
+        mergeAction.triggered.connect(self.merge_redundant)
+
+        disableUnusedAction = QAction('Disable &Unused Filters', self)
+        disableUnusedAction.setStatusTip('Disable the filters whose output never reaches a writer or plotter.')
+        disableUnusedAction.triggered.connect(self.disable_unused)
+
+        self.showUnusedAction = QAction('Show &Unused Filters', self)
+        self.showUnusedAction.setCheckable(True)
+        self.showUnusedAction.setStatusTip('Outline the filters whose output never reaches a writer or plotter.')
+        self.showUnusedAction.toggled.connect(self.show_unused)
+
+        partitionAction = QAction('&Partition Across Workers...', self)
+        partitionAction.setStatusTip('Assign the filters to worker processes, balancing their cost.')
+        partitionAction.triggered.connect(self.partition_workers)
+
+        self.minimapAction = QAction('Show &Overview', self)
+        self.minimapAction.setShortcut('Shift+Ctrl+M')
+        self.minimapAction.setCheckable(True)
+        self.minimapAction.setStatusTip('Show an overview of the whole pipeline for navigating.')
+
+        consoleAction = QAction('&Console', self)
+        consoleAction.setShortcut('Ctrl+`')
+        consoleAction.setStatusTip('Script the pipeline from a python console.')
+        consoleAction.triggered.connect(self.show_console)
+
+        self.showPartitionAction = QAction('Show &Partitions', self)
+        self.showPartitionAction.setCheckable(True)
+        self.showPartitionAction.setStatusTip('Outline the filters in the color of their worker process.')
+        self.showPartitionAction.toggled.connect(self.show_partitions)
+
         debugAction = QAction('&Debug', self)
         debugAction.setShortcut('Shift+Ctrl+Alt+D')
         debugAction.setStatusTip('Debug!')
@@ -332,25 +782,55 @@ class NodeWindow(QMainWindow):
 
         fileMenu = self.menuBar().addMenu('&File')
         editMenu = self.menuBar().addMenu('&Edit')
+        viewMenu = self.menuBar().addMenu('&View')
         helpMenu = self.menuBar().addMenu('&Help')
         # fileMenu.addAction(openAction)
         fileMenu.addAction(saveAction)
         # fileMenu.addAction(exportAction)
         fileMenu.addAction(exitAction)
 
+        editMenu.addAction(addNodeAction)
         editMenu.addAction(selectAllAction)
         editMenu.addAction(selectAllConnectedAction)
+        editMenu.addAction(self.selectWiresAction)
+        editMenu.addAction(findAction)
         editMenu.addAction(collapseAllAction)
         editMenu.addAction(expandAllAction)
         editMenu.addAction(constructExperimentAction)
         editMenu.addAction(toggleEnabledAction)
         editMenu.addAction(duplicateAction)
+        editMenu.addAction(bulkEditAction)
+        editMenu.addAction(groupAction)
+        editMenu.addAction(expandGroupAction)
+        editMenu.addAction(saveTemplateAction)
+        editMenu.addAction(instantiateAction)
         editMenu.addSeparator()
         editMenu.addAction(autoLayoutAction)
+        editMenu.addAction(validateAction)
+        editMenu.addAction(mergeAction)
+        editMenu.addAction(disableUnusedAction)
+        editMenu.addAction(partitionAction)
         editMenu.addSeparator()
         editMenu.addAction(undoAction)
         editMenu.addAction(redoAction)
 
+        viewMenu.addAction(self.minimapAction)
+        viewMenu.addAction(consoleAction)
+        viewMenu.addSeparator()
+        viewMenu.addAction(self.rateAction)
+        viewMenu.addAction(self.showPartitionAction)
+        viewMenu.addAction(self.showUnusedAction)
+        viewMenu.addSeparator()
+        viewMenu.addAction(telemetryAction)
+        viewMenu.addAction(stopTelemetryAction)
+        viewMenu.addSeparator()
+        viewMenu.addAction(profileAction)
+        viewMenu.addAction(clearProfileAction)
+        viewMenu.addSeparator()
+        viewMenu.addAction(compareAction)
+        viewMenu.addAction(mergeLibraryAction)
+        viewMenu.addAction(clearCompareAction)
+
         helpMenu.addAction(debugAction)
 
         # Setup layout
@@ -363,11 +843,40 @@ class NodeWindow(QMainWindow):
 
         self.setCentralWidget(self.main_widget)
 
-        # Establish automatic QSettings update timer that
-        # writes the node positions every 3s
+        # Analysis overlays and their panels
+        self.rate_dock = NodeTableDock("Data Rates", ["Node", "Input", "Buffer"], self)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.rate_dock)
+        self.rate_dock.hide()
+        self.rate_overlay = RateOverlay(self.scene, self.rate_dock)
+        self.telemetry_overlay = TelemetryOverlay(self.scene)
+        self.hot_dock = NodeTableDock("Hot Nodes", ["Node", "Share", "Calls", "Total (s)", "Mean (ms)"], self)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.hot_dock)
+        self.hot_dock.hide()
+        self.heatmap_overlay = HeatmapOverlay(self.scene, self.hot_dock)
+        self.partition_overlay = PartitionOverlay(self.scene)
+        self.diff_dock = NodeTableDock("Differences", ["Node", "Change", "Details"], self)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.diff_dock)
+        self.diff_dock.hide()
+        self.diff_overlay = DiffOverlay(self.scene, self.diff_dock)
+        self.search_index = SearchIndex(self.scene.pipeline)
+        self.scene.pipeline_listeners.append(self.search_index)
+        self.minimap_dock = MinimapDock(self.view, self)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.minimap_dock)
+        self.minimap_dock.hide()
+        self.minimapAction.toggled.connect(self.minimap_dock.setVisible)
+        self.minimap_dock.visibilityChanged.connect(self.minimapAction.setChecked)
+        self.console_dock = None # Created the first time it is shown
+        self.palette = None # Built the first time it is opened
+        self.search_dock = SearchDock(self, self.search_index)
+        self.addDockWidget(Qt.LeftDockWidgetArea, self.search_dock)
+        self.search_dock.hide()
+        self.unused_overlay = UnusedOverlay(self.scene)
+
+        # Establish automatic layout update timer that
+        # writes any moved node positions every 3s
         self.settings_timer = QTimer(self)
         self.settings_timer.setInterval(3000)
-        self.settings_timer.timeout.connect(self.scene.save_node_positions_to_settings)
+        self.settings_timer.timeout.connect(self.scene.save_layout)
         self.settings_timer.start()
 
         # Create the pipeline start node if possible
@@ -410,6 +919,7 @@ class NodeWindow(QMainWindow):
 
         # Perform a preliminary loading to find all of the connected files...
         _, self.filenames, self.dirname = yaml_load(self.meas_file)
+        self.stamps = self.yaml_stamps()
 
         # Delay timer to avoid multiple firings
         self.update_timer = QTimer(self)
@@ -443,17 +953,309 @@ class NodeWindow(QMainWindow):
     def stop_ignoring_updates(self):
         self.ignore_file_updates = False
 
+    def yaml_stamps(self):
+        try:
+            return file_stamps(getattr(self, 'filenames', []))
+        except OSError:
+            return None
+
     def yaml_needs_update(self, path):
+        # The directory also changes when the layout sidecar or the graph
+        # cache next to the measurement file are written, so only reload
+        # when one of the yaml files itself has changed.
+        if self.stamps is not None and self.yaml_stamps() == self.stamps:
+            return
         if not self.update_timer.isActive() and not self.ignore_file_updates:
             self.update_timer.start()
 
     def update_yaml(self):
         self.set_status("Files changed on disk, reloading.")
+        self.stamps = self.yaml_stamps()
         self.scene.reload_yaml()
 
     def save(self):
         self.scene.save_for_yaml()
 
+    def validate(self):
+        diagnostics = self.scene.validate()
+        errors = [d for d in diagnostics if d.severity == ERROR]
+        if len(diagnostics) == 0:
+            self.set_status("No problems found.")
+        else:
+            # The rest are in the tooltips of the outlined nodes
+            first = (errors + diagnostics)[0]
+            self.set_status("Found {} errors and {} warnings. {}: {} [{}] {}".format(
+                len(errors), len(diagnostics)-len(errors), first.severity, first.node, first.code, first.message), 10000)
+
+    def show_data_rates(self, show):
+        if show:
+            self.rate_overlay.enable()
+            self.rate_dock.show()
+        else:
+            self.rate_overlay.disable()
+            self.rate_dock.hide()
+
+    def connect_telemetry(self):
+        address, ok = QInputDialog.getText(self, "Connect Telemetry",
+            "tcp://host:port, unix:///path, or a json lines file:",
+            text=self.scene.qt_settings.value("telemetry_address", "tcp://127.0.0.1:5555"))
+        if ok and address:
+            self.scene.qt_settings.setValue("telemetry_address", address)
+            self.telemetry_overlay.connect(address)
+            self.set_status("Following telemetry from {}".format(address))
+
+    def disconnect_telemetry(self):
+        self.telemetry_overlay.disconnect()
+
+    def open_palette(self):
+        if self.palette is None:
+            catalog = self.scene.validator.catalog
+            names = [n for n in catalog.keys() if hasattr(self.scene, "create_"+("".join(n.split())))]
+            self.palette = NodePalette(names, {n: catalog[n].category for n in names}, self)
+            self.palette.chosen.connect(self.scene.add_node)
+
+        # Drop the node under the cursor if it's over the canvas
+        cursor = self.view.mapFromGlobal(QCursor.pos())
+        if not self.view.viewport().rect().contains(cursor):
+            cursor = self.view.viewport().rect().center()
+        self.scene.last_click = self.view.mapToScene(cursor)
+        self.palette.open_at(self.view.mapToGlobal(cursor), self.scene.recent_node_types())
+
+    def show_console(self):
+        if self.console_dock is None:
+            self.console_dock = ConsoleDock({'graph': Graph.from_scene(self.scene), 'Graph': Graph,
+                                             'scene': self.scene, 'window': self}, self)
+            self.addDockWidget(Qt.BottomDockWidgetArea, self.console_dock)
+        else:
+            # Pick up any edits made on the canvas in the meantime
+            self.console_dock.interpreter.locals['graph'].refresh()
+        self.console_dock.show()
+        self.console_dock.input.setFocus()
+
+    def find_nodes(self):
+        self.search_dock.activate()
+
+    def group_selected(self):
+        selected_nodes = [i for i in self.scene.items() if isinstance(i, Node) and i.isSelected()]
+        if len(selected_nodes) < 2:
+            self.set_status("Select at least two nodes to group.")
+            return
+        self.scene.undo_stack.push(CommandGroupNodes(selected_nodes, self.scene))
+
+    def expand_selected_groups(self):
+        groups = [i for i in self.scene.items() if isinstance(i, GroupNode) and i.isSelected()]
+        if len(groups) > 0:
+            self.scene.undo_stack.push(CommandExpandGroups(groups, self.scene))
+
+    def save_template(self):
+        selected_nodes = [n for n in self.scene.all_nodes() if n.isSelected() and not n.is_instrument]
+        if len(selected_nodes) == 0:
+            self.set_status("Select the filters to save as a template.")
+            return
+        selected_nodes.sort(key=lambda n: (n.pos().x(), n.pos().y()))
+        labels = [n.label.toPlainText() for n in selected_nodes]
+
+        name, ok = QInputDialog.getText(self, "Save Template", "Template name:")
+        if not ok or not name:
+            return
+        # Suggest the part of the labels before the first dash, e.g. q1 of q1-demod
+        channel, ok = QInputDialog.getText(self, "Save Template",
+            "Text in the labels and parameters to replace by ${channel} (blank for none):",
+            text=os.path.commonprefix(labels).split("-")[0])
+        if not ok:
+            return
+
+        entries   = OrderedDict((n.label.toPlainText(), n.dict_repr()) for n in selected_nodes)
+        positions = {n.label.toPlainText(): (n.pos().x(), n.pos().y()) for n in selected_nodes}
+        template  = PipelineTemplate.from_entries(name, entries, positions, channel or None)
+        filename  = save_template(template)
+        self.set_status("Saved template {} with placeholders {} to {}".format(
+            name, ", ".join(template.placeholders) or "(none)", filename), 5000)
+
+    def instantiate_template(self):
+        templates = load_templates()
+        if len(templates) == 0:
+            self.set_status("No templates saved yet.")
+            return
+        dialog = TemplateDialog(templates, self)
+        if not dialog.exec_():
+            return
+        template, count, start, patterns = dialog.result_values()
+        # Patterns may refer to the copy number as {i}
+        instances = [{k: p.replace("{i}", str(i)) for k, p in patterns.items()} for i in range(start, start+count)]
+
+        t0 = time.time()
+        command = CommandInstantiateTemplate(template, instances, self.scene.last_click, self.scene)
+        self.scene.undo_stack.push(command)
+        message = "Created {} nodes in {:.2f} s.".format(len(command.new_nodes), time.time()-t0)
+        if len(command.missing) > 0:
+            message += " Unknown types: {}".format(", ".join(sorted(str(m) for m in command.missing)))
+        self.set_status(message, 5000)
+
+    def bulk_edit(self):
+        selected_nodes = [i for i in self.scene.items() if isinstance(i, Node) and i.isSelected()]
+        selected_nodes.sort(key=lambda n: natural_key(n.label.toPlainText()))
+        # Offer the parameters by name and kind, so e.g. a numerical axis
+        # isn't mixed up with a combo box of the same name
+        params = {}
+        for node in selected_nodes:
+            for name, param in node.parameters.items():
+                params.setdefault((name, type(param)), []).append(param)
+        if len(params) == 0:
+            self.set_status("No parameters on the selected nodes.")
+            return
+
+        dialog = BulkEditDialog(sorted(params.keys(), key=lambda k: (k[0], k[1].__name__)), self)
+        if not dialog.exec_():
+            return
+        key, mode, text = dialog.result_values()
+        targets = params[key]
+        try:
+            if issubclass(key[1], BooleanParameter) and mode == 'set':
+                text = text.strip().lower() in ('1', 'true', 'yes', 'on')
+            values = bulk_values(parameter_column(targets), mode, text)
+            if issubclass(key[1], NumericalParameter):
+                values = [targets[0].datatype(float(v)) for v in values]
+        except Exception as e:
+            self.set_status("Could not evaluate {}: {}".format(text, str(e)), 5000)
+            return
+        self.scene.undo_stack.push(CommandSetParameters(list(zip(targets, values)), self.scene))
+        self.set_status("Set {} on {} nodes.".format(key[0], len(targets)))
+
+    def merge_redundant(self):
+        self.scene.sync_pipeline()
+        pipeline = self.scene.pipeline
+        groups = redundant_groups(pipeline)
+        if len(groups) == 0:
+            self.set_status("No redundant filters found.")
+            return
+
+        # Filters hidden inside collapsed groups aren't on the canvas to be
+        # rewired or removed, so only those outside of groups are merged
+        nodes_by_label = {i.label.toPlainText(): i for i in self.scene.all_nodes()}
+        visible = set(i for i in self.scene.items() if isinstance(i, Node))
+        groups = [[n for n in names if nodes_by_label[n] in visible] for names in groups]
+        groups = [names for names in groups if len(names) > 1]
+        if len(groups) == 0:
+            self.set_status("Redundant filters are hidden inside groups, expand them to merge.")
+            return
+
+        estimator = RateEstimator(pipeline)
+        estimator.run()
+        saved = estimator.bytes_in([n for names in groups for n in names[1:]])
+
+        node_groups = [(nodes_by_label[names[0]], [nodes_by_label[n] for n in names[1:]]) for names in groups]
+        self.scene.undo_stack.push(CommandMergeNodes(node_groups, self.scene))
+        self.set_status("Merged {} redundant filters, saving an estimated {} of processing.".format(
+            sum(len(names)-1 for names in groups), format_bytes(saved, "B/s")), 5000)
+
+    def unused_summary(self):
+        """Names of the unused filters and the estimated data rate they process"""
+        self.scene.sync_pipeline()
+        names = unused_nodes(self.scene.pipeline, self.unused_overlay.sinks)
+        estimator = RateEstimator(self.scene.pipeline)
+        estimator.run()
+        return names, estimator.bytes_in(names)
+
+    def show_unused(self, show):
+        if show:
+            self.unused_overlay.enable()
+            names, rate = self.unused_summary()
+            self.set_status("{} unused filters processing an estimated {}.".format(
+                len(names), format_bytes(rate, "B/s")), 5000)
+        else:
+            self.unused_overlay.disable()
+
+    def disable_unused(self):
+        names, rate = self.unused_summary()
+        if len(names) == 0:
+            self.set_status("No unused filters found.")
+            return
+        nodes_by_label = {i.label.toPlainText(): i for i in self.scene.all_nodes()}
+        self.scene.undo_stack.push(CommandSetEnabled([nodes_by_label[n] for n in names], False, self.scene))
+        self.unused_overlay.refresh()
+        self.set_status("Disabled {} unused filters, removing an estimated {} of processing.".format(
+            len(names), format_bytes(rate, "B/s")), 5000)
+
+    def partition_workers(self):
+        workers, ok = QInputDialog.getInt(self, "Partition Across Workers", "Number of worker processes:",
+                                          os.cpu_count() or 4, 1, 1024)
+        if not ok:
+            return
+        self.scene.sync_pipeline()
+        # Prefer measured timing over the estimated data rates
+        cost, edge_weight = partition_costs(self.scene.pipeline, self.heatmap_overlay.timings)
+        result = partition(self.scene.pipeline, workers, cost, edge_weight)
+
+        nodes_by_label = {i.label.toPlainText(): i for i in self.scene.all_nodes() if not i.is_instrument}
+        affinities = {node: result.assignment.get(name) for name, node in nodes_by_label.items()}
+        self.scene.undo_stack.push(CommandSetAffinity(affinities, self.scene))
+        self.showPartitionAction.setChecked(True)
+        self.set_status("Assigned filters to {} workers, {} crossing between workers, load imbalance {:.2f}.".format(
+            workers, format_bytes(result.cut, "B/s"), result.imbalance()), 5000)
+
+    def show_partitions(self, show):
+        if show:
+            self.partition_overlay.enable()
+        else:
+            self.partition_overlay.disable()
+
+    def load_profile(self):
+        fn, _ = QFileDialog.getOpenFileName(self, 'Open Profiling Log', self.dirname if hasattr(self, 'dirname') else "",
+                                            "Profiles (*.csv *.json *.jsonl);;All files (*)")
+        if not fn:
+            return
+        try:
+            self.heatmap_overlay.load(fn)
+        except (OSError, ValueError) as e:
+            self.set_status("Could not read profile: {}".format(str(e)), 5000)
+            return
+        self.hot_dock.show()
+        self.set_status("Loaded timing for {} nodes.".format(len(self.heatmap_overlay.timings)))
+
+    def clear_profile(self):
+        self.heatmap_overlay.disable()
+        self.hot_dock.hide()
+
+    def open_library(self, title):
+        fn, _ = QFileDialog.getOpenFileName(self, title, self.dirname if hasattr(self, 'dirname') else "",
+                                            "Measurement libraries (*.yml *.yaml);;All files (*)")
+        if not fn:
+            return None
+        try:
+            return load_entries(fn)[1]
+        except Exception as e:
+            self.set_status("Could not read {}: {}".format(fn, str(e)), 5000)
+            return None
+
+    def compare_library(self):
+        entries = self.open_library('Compare With Library')
+        if entries is None:
+            return
+        self.diff_overlay.compare(entries)
+        self.diff_dock.show()
+        self.set_status("{} nodes differ.".format(len(self.diff_overlay.diffs)), 5000)
+
+    def merge_library(self):
+        base = self.open_library('Common Ancestor of the Libraries')
+        if base is None:
+            return
+        theirs = self.open_library('Library to Merge')
+        if theirs is None:
+            return
+        ours = self.scene.edited_entries()
+        merged, conflicts = merge_entries(base, ours, theirs)
+        self.scene.apply_entries(merged)
+        # Show what the merge changed, conflicts keep our value
+        self.diff_overlay.compare(ours, conflicts)
+        self.diff_dock.show()
+        self.set_status("Merged {} nodes with {} conflicts.".format(
+            len(self.diff_overlay.diffs), len(conflicts)), 5000)
+
+    def clear_comparison(self):
+        self.diff_overlay.disable()
+        self.diff_dock.hide()
+
     def undo(self):
         self.scene.undo_stack.undo()
 
@@ -461,9 +1263,17 @@ class NodeWindow(QMainWindow):
         self.scene.undo_stack.redo()
 
     def construct_experiment(self):
-        nodes = [i for i in self.scene.items() if isinstance(i, Node)]
-        wires = [i for i in self.scene.items() if isinstance(i, Wire)]
-        create_experiment_graph(nodes, wires)
+        if NO_AUSPEX:
+            self.set_status("Auspex is required to construct an experiment.")
+            return
+        self.scene.sync_pipeline()
+        try:
+            self.experiment = self.scene.compiler.compile(self.scene.pipeline)
+        except Exception as e:
+            self.set_status("Could not construct experiment: {}".format(str(e)), 5000)
+            return
+        self.set_status("Constructed experiment with {} filters.".format(
+            sum(len(b.filters) for b in self.scene.compiler.branches.values())))
 
     def select_all(self):
         nodes = [i for i in self.scene.items() if isinstance(i, Node)]
@@ -472,7 +1282,7 @@ class NodeWindow(QMainWindow):
 
     def select_all_connected(self):
         selected_nodes = [i.label.toPlainText() for i in self.scene.items() if isinstance(i, Node) and i.isSelected()]
-        wires = [i for i in self.scene.items() if isinstance(i, Wire)]
+        wires = self.scene.wires()
         nodes_by_label = {i.label.toPlainText(): i for i in self.scene.items() if isinstance(i, Node)}
         graph = generate_graph(wires)
 
@@ -490,7 +1300,7 @@ class NodeWindow(QMainWindow):
         if len(selected_nodes) == 0:
             self.set_status("No nodes selected.")
             return
-        wires = [i for i in self.scene.items() if isinstance(i, Wire)]
+        wires = self.scene.wires()
         nodes_by_label = {i.label.toPlainText(): i for i in self.scene.items() if isinstance(i, Node)}
         graph = generate_graph(wires, dag=True)
 
@@ -508,7 +1318,7 @@ class NodeWindow(QMainWindow):
 
     def auto_layout(self):
         nodes = [i for i in self.scene.items() if isinstance(i, Node)]
-        wires = [i for i in self.scene.items() if isinstance(i, Wire)]
+        wires = self.scene.wires()
         nodes_by_label = {i.label.toPlainText(): i for i in self.scene.items() if isinstance(i, Node)}
         graph = generate_graph(wires, dag=True)
         input_nodes = graph_input_nodes(graph)
@@ -528,10 +1338,13 @@ class NodeWindow(QMainWindow):
             n.change_collapsed_state(False)
 
     def duplicate(self):
-        selected_nodes = [i for i in self.scene.items() if isinstance(i, Node) and i.isSelected()]
+        selected_nodes = [i for i in self.scene.items() if isinstance(i, Node) and i.isSelected()
+                                                           and not isinstance(i, GroupNode)]
         self.scene.undo_stack.push(CommandDuplicateNodes(selected_nodes, self.scene))
 
     def cleanup(self):
+        self.telemetry_overlay.disconnect()
+
         # Have to manually close proxy widgets
         nodes = [i for i in self.scene.items() if isinstance(i, Node)]
         for n in nodes:
@@ -8,11 +8,34 @@ from qtpy.QtGui import *
 from qtpy.QtCore import *
 from qtpy.QtWidgets import *
 
+from collections import OrderedDict
+
 from .conn import *
 from .param import *
 
+# Size of the cells of the spatial index of the wire layer
+WIRE_CELL = 256.0
+
+END_CAP_RADIUS = 5.0
+END_CAP_COLOR  = QColor(130, 170, 170)
+
+# Connected wires without an overlay style are stroked together in a single
+# color halfway along the gradient of a wire being dragged
+WIRE_COLOR = QColor(154, 174, 174)
+
+# Wires are hit within this distance of a polyline following the curve
+WIRE_TOLERANCE = 4.0
+WIRE_SEGMENTS  = 12
+
+SELECTED_WIRE_COLOR = QColor(247, 217, 17)
+
+def end_cap_rect(end):
+    return QRectF(end.x()-END_CAP_RADIUS, end.y()-END_CAP_RADIUS, 2*END_CAP_RADIUS, 2*END_CAP_RADIUS)
+
 class Wire(QGraphicsPathItem):
-    """docstring for Wire"""
+    """Connection between an output and an input or parameter. Connected
+    wires are drawn by the WireLayer of the scene, and only become items of
+    their own while being dragged around."""
     def __init__(self, start_obj, parent=None):
         self.path = QPainterPath()
         super(Wire, self).__init__(self.path, parent=parent)
@@ -22,52 +45,46 @@ class Wire(QGraphicsPathItem):
         self.end       = self.start
         self.start_obj = start_obj
         self.end_obj   = None
+        self.layer     = None # WireLayer while added to a scene
+        self.cap       = self.end # End cap as last drawn by the item
+        self.hit_key   = None     # Ends for which the hit shape was made
+        self.hit_line  = None
+        self.hit_path  = None
+
+        # Connectors of a group node the wire is drawn to while its
+        # actual ends are hidden inside the group
+        self.start_proxy = None
+        self.end_proxy   = None
+
+        # Color and width set by analysis overlays, e.g. the data rates
+        self.overlay_style = None
         self.make_path()
 
-        self.setZValue(0)
+        self.setZValue(1)
         self.set_start(self.start)
 
-        # Add endpoint circle
-        rad = 5
-        self.end_image = QGraphicsEllipseItem(-rad, -rad, 2*rad, 2*rad, parent=self)
-        self.end_image.setBrush(QColor(130, 170, 170))
-        self.end_image.setPos(self.start)
-
-        # Setup behavior for unlinking the end of the wire, monkeypatch!
-        def mpe(event):
-            self.unhook(event)
-        def mme(event):
-            self.set_end(event.scenePos())
-            exclude = list(self.start_obj.parent.inputs.values())
-            self.scene().connectors_nearby(event.scenePos(), exclude=exclude)
-        def mre(event):
-            exclude = list(self.start_obj.parent.inputs.values())
-            nearest = self.scene().connectors_nearby(event.scenePos(), exclude=exclude)
-            self.decide_drop(nearest)
-
-        self.end_image.mousePressEvent   = mpe
-        self.end_image.mouseMoveEvent    = mme
-        self.end_image.mouseReleaseEvent = mre
-
-    def unhook(self, event):
+    def unhook(self):
         self.end_obj.wires_in.remove(self)
         self.start_obj.wires_out.remove(self)
         self.end_obj = None
+        self.make_path()
 
     def decide_drop(self, drop_site):
+        # Once connected the wire is handed back to the layer and leaves the scene
+        scene = self.scene()
         self.setVisible(False)
         success = True
 
         if isinstance(drop_site, Connector):
             if self.start_obj.parent.name in ["Sweep", "Parameter"]:
-                self.scene().window.set_status("Can't connect a sweep or parameter to a data connector.")
+                scene.window.set_status("Can't connect a sweep or parameter to a data connector.")
             elif drop_site.connector_type == 'input':
 
                 # Check if there are restrictions on the allowed drop destinations, then act on them
                 if len(self.start_obj.parent.allowed_destinations) > 0 and self.start_obj.name in self.start_obj.parent.allowed_destinations.keys():
                     success = drop_site.name == self.start_obj.parent.allowed_destinations[self.start_obj.name]
                     if not success:
-                        self.scene().window.set_status("Can't connect {} connector to {}, only to {}.".format(self.start_obj.name, drop_site.name, self.start_obj.parent.allowed_destinations[self.start_obj.name]))
+                        scene.window.set_status("Can't connect {} connector to {}, only to {}.".format(self.start_obj.name, drop_site.name, self.start_obj.parent.allowed_destinations[self.start_obj.name]))
 
         elif isinstance(drop_site, Parameter):
             if self.start_obj.parent.name in ["Sweep", "Parameter"]:
@@ -76,17 +93,17 @@ class Wire(QGraphicsPathItem):
                 if self.start_obj.parent.name == "Sweep":
                     self.start_obj.parent.update_fields_from_connector()
             else:
-                self.scene().window.set_status("Can't connect data connector to parameter.")
+                scene.window.set_status("Can't connect data connector to parameter.")
                 success = False
 
         else:
             success = False
 
         if success:
-            self.scene().undo_stack.push(CommandConnectWire(self, drop_site, self.scene()))
+            scene.undo_stack.push(CommandConnectWire(self, drop_site, scene))
 
         self.setVisible(True)
-        self.scene().clear_wires(only_clear_orphaned=True)
+        scene.clear_wires(only_clear_orphaned=True)
 
     def set_start(self, start):
         self.start = start
@@ -95,16 +112,82 @@ class Wire(QGraphicsPathItem):
     def set_end(self, end):
         self.end = end
         self.make_path()
-        self.end_image.setPos(end)
 
     def make_path(self):
         self.path = QPainterPath()
         self.path.moveTo(self.start.x()+7, self.start.y())
         halfway_x = self.start.x() + 0.5*(self.end.x()-self.start.x())
         self.path.cubicTo(halfway_x, self.start.y(), halfway_x, self.end.y(), self.end.x(), self.end.y())
+        if self.layer is not None:
+            self.layer.wire_changed(self)
+
+    def hit_polyline(self):
+        """Points along the curve, only recomputed when the ends have moved"""
+        key = (self.start.x(), self.start.y(), self.end.x(), self.end.y())
+        if key != self.hit_key:
+            sx, y0, x3, y3 = key
+            x0, hx = sx + 7, sx + 0.5*(x3-sx)
+            self.hit_line = []
+            for k in range(WIRE_SEGMENTS+1):
+                t = k/WIRE_SEGMENTS
+                a, b, c, d = (1-t)**3, 3*t*(1-t)**2, 3*t*t*(1-t), t**3
+                self.hit_line.append((a*x0 + (b+c)*hx + d*x3, (a+b)*y0 + (c+d)*y3))
+            self.hit_key  = key
+            self.hit_path = None
+        return self.hit_line
+
+    def hit_shape(self):
+        """Band around the polyline, in place of the outline of the stroked curve"""
+        points = self.hit_polyline()
+        if self.hit_path is None:
+            line = QPainterPath()
+            line.moveTo(*points[0])
+            for p in points[1:]:
+                line.lineTo(*p)
+            stroker = QPainterPathStroker()
+            stroker.setWidth(2*WIRE_TOLERANCE)
+            self.hit_path = stroker.createStroke(line)
+        return self.hit_path
+
+    def hits(self, pos):
+        px, py = pos.x(), pos.y()
+        points = self.hit_polyline()
+        for (x1, y1), (x2, y2) in zip(points[:-1], points[1:]):
+            dx, dy = x2-x1, y2-y1
+            length2 = dx*dx + dy*dy
+            t = 0.0 if length2 == 0 else max(0.0, min(1.0, ((px-x1)*dx + (py-y1)*dy)/length2))
+            ex, ey = x1 + t*dx - px, y1 + t*dy - py
+            if ex*ex + ey*ey <= WIRE_TOLERANCE*WIRE_TOLERANCE:
+                return True
+        return False
+
+    def shape(self):
+        return self.hit_shape()
+
+    def style_key(self):
+        """Wires with the same key are stroked together by the layer"""
+        if self.overlay_style is not None:
+            color, width = self.overlay_style
+            return (color.rgba(), width)
+        return None
+
+    def layer_rect(self):
+        """Region covered by the wire, including its end cap"""
+        margin = 6.0 + (0.5*self.overlay_style[1] if self.overlay_style is not None else 2.0)
+        return self.path.controlPointRect().adjusted(-margin, -margin, margin, margin)
+
+    def apply_path(self):
+        """Set up the path and pen for drawing the wire as an item of its own"""
+        self.prepareGeometryChange()
+        self.cap = QPointF(self.end)
         self.setPath(self.path)
         self.setBrush(QBrush(Qt.NoBrush))
 
+        if self.overlay_style is not None and self.end_obj:
+            color, width = self.overlay_style
+            self.setPen(QPen(color, width, Qt.SolidLine, Qt.RoundCap))
+            return
+
         linear_gradient = QLinearGradient(self.start, self.end)
         linear_gradient.setColorAt(0, QColor(128, 128, 128))
         if self.end_obj:
@@ -113,9 +196,22 @@ class Wire(QGraphicsPathItem):
         else:
             linear_gradient.setColorAt(1.0, QColor(220, 220, 180))
             line_type = Qt.DashLine
-        
+
         self.setPen(QPen(QBrush(linear_gradient), 4.0, line_type, Qt.RoundCap))
 
+    def boundingRect(self):
+        return super(Wire, self).boundingRect().united(end_cap_rect(self.cap))
+
+    def paint(self, painter, option, widget):
+        super(Wire, self).paint(painter, option, widget)
+        painter.setPen(QPen())
+        painter.setBrush(END_CAP_COLOR)
+        painter.drawEllipse(end_cap_rect(self.cap))
+
+    def set_overlay_style(self, style):
+        if style != self.overlay_style:
+            self.overlay_style = style
+            self.make_path()
 
     def dict_repr(self):
         dat = {}
@@ -123,6 +219,200 @@ class Wire(QGraphicsPathItem):
         dat['end'] = {'node': self.end_obj.parent.label.toPlainText(), 'connector_name': self.end_obj.name}
         return dat
 
+class WireLayer(QGraphicsItem):
+    """Single item that draws every connected wire of the scene, stroking
+    the wires that share a style together. The region of each wire is kept
+    in a grid, so that only the wires in the exposed region are drawn, only
+    the region of a wire that changed is repainted, and end caps can be
+    found under the mouse. Wires that aren't connected, e.g. while being
+    dragged, are promoted to items of their own. Wires can only be selected,
+    by clicking or with the rubber band, once that is enabled."""
+    def __init__(self):
+        super(WireLayer, self).__init__()
+        self.wires    = OrderedDict() # wire -> indexed rect, None when promoted
+        self.cells    = {}            # (column, row) -> set of wires
+        self.bounds   = QRectF()
+        self.dragging = None          # Wire unhooked by the mouse
+        self.selectable = False
+        self.selected   = set()
+        self.setZValue(0.5)
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+        self.setAcceptedMouseButtons(Qt.NoButton)
+
+    def cell_range(self, rect):
+        return [(i, j) for i in range(int(rect.left()//WIRE_CELL), int(rect.right()//WIRE_CELL)+1)
+                       for j in range(int(rect.top()//WIRE_CELL), int(rect.bottom()//WIRE_CELL)+1)]
+
+    def wires_in_rect(self, rect):
+        found = set()
+        for cell in self.cell_range(rect):
+            found.update(self.cells.get(cell, ()))
+        return [w for w in found if self.wires[w] is not None and self.wires[w].intersects(rect)]
+
+    def index(self, wire, rect):
+        for cell in self.cell_range(rect):
+            self.cells.setdefault(cell, set()).add(wire)
+        if not self.bounds.contains(rect):
+            self.prepareGeometryChange()
+            self.bounds = self.bounds.united(rect)
+
+    def fit(self):
+        """Shrink the bounds to the wires, as they only grow when wires move"""
+        bounds = QRectF()
+        for rect in self.wires.values():
+            if rect is not None:
+                bounds = bounds.united(rect)
+        if bounds != self.bounds:
+            self.prepareGeometryChange()
+            self.bounds = bounds
+
+    def unindex(self, wire):
+        rect = self.wires.get(wire)
+        if rect is not None:
+            for cell in self.cell_range(rect):
+                self.cells[cell].discard(wire)
+            self.update(rect)
+
+    def add(self, wire):
+        if wire.layer is self:
+            return
+        wire.layer = self
+        self.wires[wire] = None
+        self.wire_changed(wire)
+
+    def remove(self, wire):
+        if wire.layer is not self:
+            return
+        self.unindex(wire)
+        self.wires.pop(wire)
+        wire.layer = None
+        self.selected.discard(wire)
+        if wire.scene() is not None:
+            QGraphicsScene.removeItem(wire.scene(), wire)
+        if self.dragging is wire:
+            self.dragging = None
+
+    def wire_changed(self, wire):
+        """Repaint just the old and new regions of the wire, and promote or
+        demote it depending on whether it is connected"""
+        self.unindex(wire)
+        if wire.end_obj is None:
+            self.wires[wire] = None
+            wire.apply_path()
+            if wire.scene() is None and self.scene() is not None:
+                QGraphicsScene.addItem(self.scene(), wire)
+        else:
+            if wire.scene() is not None:
+                QGraphicsScene.removeItem(wire.scene(), wire)
+            rect = wire.layer_rect()
+            self.wires[wire] = rect
+            self.index(wire, rect)
+            self.update(rect)
+
+    def end_cap_at(self, pos):
+        """Nearest wire whose end cap is under pos, leaving out wires that
+        end on the connectors of a collapsed group"""
+        point = QRectF(pos.x(), pos.y(), 0.1, 0.1)
+        nearest, nearest_r = None, END_CAP_RADIUS
+        for wire in self.wires_in_rect(point):
+            if wire.end_proxy is not None:
+                continue
+            r = QLineF(pos, wire.end).length()
+            if r <= nearest_r:
+                nearest, nearest_r = wire, r
+        return nearest
+
+    def wire_at(self, pos):
+        if not self.selectable:
+            return None
+        near = QRectF(pos.x()-WIRE_TOLERANCE, pos.y()-WIRE_TOLERANCE, 2*WIRE_TOLERANCE, 2*WIRE_TOLERANCE)
+        for wire in self.wires_in_rect(near):
+            if wire.hits(pos):
+                return wire
+        return None
+
+    def set_selectable(self, selectable):
+        self.selectable = selectable
+        if not selectable:
+            self.select([])
+
+    def select(self, wires, add=False):
+        changed = set(wires) ^ self.selected if not add else set(wires) - self.selected
+        self.selected = self.selected | set(wires) if add else set(wires)
+        for wire in changed:
+            if self.wires.get(wire) is not None:
+                self.update(self.wires[wire])
+
+    def select_in_rect(self, rect, add=False):
+        if self.selectable:
+            self.select([w for w in self.wires_in_rect(rect) if w.hit_shape().intersects(rect)], add)
+
+    def boundingRect(self):
+        return self.bounds
+
+    def shape(self):
+        # The scene hands mouse presses to the layer itself, so that the
+        # layer never takes part in the hit-tests of the view
+        return QPainterPath()
+
+    def hit(self, pos):
+        return self.end_cap_at(pos) is not None or self.wire_at(pos) is not None
+
+    def paint(self, painter, option, widget):
+        strokes = OrderedDict()
+        caps = QPainterPath()
+        for wire in self.wires_in_rect(option.exposedRect):
+            key = wire.style_key()
+            if key not in strokes:
+                strokes[key] = (wire.overlay_style, QPainterPath())
+            strokes[key][1].addPath(wire.path)
+            caps.addEllipse(end_cap_rect(wire.end))
+
+        painter.setBrush(Qt.NoBrush)
+        for style, path in strokes.values():
+            color, width = style if style is not None else (WIRE_COLOR, 4.0)
+            painter.setPen(QPen(color, width, Qt.SolidLine, Qt.RoundCap))
+            painter.drawPath(path)
+        if len(self.selected) > 0:
+            highlight = QPainterPath()
+            for wire in self.selected:
+                if self.wires.get(wire) is not None and self.wires[wire].intersects(option.exposedRect):
+                    highlight.addPath(wire.path)
+            painter.setPen(QPen(SELECTED_WIRE_COLOR, 2.0, Qt.SolidLine, Qt.RoundCap))
+            painter.drawPath(highlight)
+        painter.setPen(QPen())
+        painter.setBrush(END_CAP_COLOR)
+        painter.drawPath(caps)
+
+    def press(self, pos, modifiers):
+        """Unhook the end of the wire under the mouse, or select the wire.
+        Returns whether the press was taken."""
+        wire = self.end_cap_at(pos)
+        if wire is not None:
+            self.dragging = wire
+            wire.unhook()
+            return True
+        wire = self.wire_at(pos)
+        if wire is None:
+            return False
+        if modifiers & Qt.ControlModifier:
+            self.select(self.selected ^ set([wire]))
+        else:
+            self.scene().clearSelection()
+            self.select([wire])
+        return True
+
+    def drag(self, pos):
+        self.dragging.set_end(pos)
+        exclude = list(self.dragging.start_obj.parent.inputs.values())
+        self.scene().connectors_nearby(pos, exclude=exclude)
+
+    def drop(self, pos):
+        wire, self.dragging = self.dragging, None
+        exclude = list(wire.start_obj.parent.inputs.values())
+        nearest = self.scene().connectors_nearby(pos, exclude=exclude)
+        wire.decide_drop(nearest)
+
 class CommandConnectWire(QUndoCommand):
     def __init__(self, wire, drop_site, scene):
         super(CommandConnectWire, self).__init__("Connect wire {}".format(wire))
@@ -131,7 +421,7 @@ class CommandConnectWire(QUndoCommand):
         self.drop_site = drop_site
 
     def redo(self):
-        if self.wire not in self.scene.items():
+        if self.wire.layer is None:
             self.scene.addItem(self.wire)
         self.wire.set_end(self.drop_site.scenePos())
         self.wire.end_obj = self.drop_site
@@ -144,3 +434,21 @@ class CommandConnectWire(QUndoCommand):
         self.wire.end_obj.wires_in.pop(self.wire.end_obj.wires_in.index(self.wire))
         self.wire.start_obj.wires_out.pop(self.wire.start_obj.wires_out.index(self.wire))
         self.scene.removeItem(self.wire)
+
+class CommandDeleteWires(QUndoCommand):
+    def __init__(self, wires, scene):
+        super(CommandDeleteWires, self).__init__("Delete {} wires".format(len(wires)))
+        self.wires = wires
+        self.scene = scene
+
+    def redo(self):
+        for w in self.wires:
+            w.end_obj.wires_in.remove(w)
+            w.start_obj.wires_out.remove(w)
+            self.scene.removeItem(w)
+
+    def undo(self):
+        for w in self.wires:
+            w.end_obj.wires_in.append(w)
+            w.start_obj.wires_out.append(w)
+            self.scene.addItem(w)
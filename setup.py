@@ -20,6 +20,13 @@ setup(
     # package_dir={'':'quince'},
     packages=['quince'],
     scripts=script_names,
+    entry_points={
+        'console_scripts': [
+            'quince-compile = quince.experiment:main',
+            'quince-validate = quince.validate:main',
+            'quince-diff = quince.diff:main',
+        ]
+    },
     data_files=["assets"],
     description='Quince is a node centric experience.',
     long_description=open('README.md').read(),
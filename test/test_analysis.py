@@ -0,0 +1,35 @@
+# coding: utf-8
+# Raytheon BBN Technologies 2016
+# Contributiors: Graham Rowlands
+#
+# This file contains the tests of the headless pipeline analyses
+
+import unittest
+
+from quince.pipeline import *
+from quince.analysis import *
+
+def make_pipeline(filters, instruments=("dig",)):
+    pipeline = Pipeline()
+    pipeline.sync(dict([(name, ({'type': 'X6'}, True)) for name in instruments] +
+                       [(name, (entry, False)) for name, entry in filters.items()]))
+    return pipeline
+
+class CanonicalIdsTestCase(unittest.TestCase):
+
+    def test_missing_source(self):
+        pipeline = make_pipeline({'a': {'type': 'Channelizer', 'source': 'dig'},
+                                  'b': {'type': 'KernelIntegrator', 'source': 'a, ghost'}})
+        ids = canonical_ids(pipeline)
+        self.assertEqual(set(ids.keys()), {'dig', 'a', 'b'})
+        self.assertEqual(redundant_groups(pipeline), [])
+
+    def test_missing_source_redundant(self):
+        pipeline = make_pipeline({'a': {'type': 'Channelizer', 'source': 'dig'},
+                                  'b': {'type': 'KernelIntegrator', 'source': 'a, ghost'},
+                                  'c': {'type': 'KernelIntegrator', 'source': 'ghost, a'},
+                                  'd': {'type': 'KernelIntegrator', 'source': 'a, other'}})
+        self.assertEqual(redundant_groups(pipeline), [['b', 'c']])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+# coding: utf-8
+# Raytheon BBN Technologies 2016
+# Contributiors: Graham Rowlands
+#
+# This file contains the tests of the data rate estimates
+
+import unittest
+
+from quince.pipeline import *
+from quince.analysis import *
+from quince.rates import *
+
+class RateEstimatorTestCase(unittest.TestCase):
+
+    def test_unused_cycle(self):
+        pipeline = Pipeline()
+        pipeline.sync({'dig': ({'type': 'X6', 'record_length': 1024}, True),
+                       'a':   ({'type': 'Channelizer', 'source': 'dig, b'}, False),
+                       'b':   ({'type': 'Channelizer', 'source': 'a'}, False)})
+        estimator = RateEstimator(pipeline)
+        estimator.run()
+        names = unused_nodes(pipeline)
+        self.assertEqual(sorted(names), ['a', 'b'])
+        self.assertNotIn('a', estimator.estimates)
+        self.assertEqual(estimator.bytes_in(names), 0.0)
+        self.assertEqual(estimator.bytes_in(['dig']), estimator.estimates['dig'].bytes_in_per_sec)
+
+if __name__ == '__main__':
+    unittest.main()
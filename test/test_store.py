@@ -0,0 +1,32 @@
+# coding: utf-8
+# Raytheon BBN Technologies 2016
+# Contributiors: Graham Rowlands
+#
+# This file contains the tests of the columnar parameter store
+
+import unittest
+
+from quince.store import *
+
+class ParameterStoreTestCase(unittest.TestCase):
+
+    def test_released_rows(self):
+        store = ParameterStore()
+        table = store.table('Channelizer')
+        table.add_column('decimation_factor', int)
+        a, b = table.add_row('a'), table.add_row('b')
+        table.set(a, 'decimation_factor', 4)
+        table.set(b, 'decimation_factor', 8)
+
+        table.release_row(a)
+        self.assertEqual(store.dirty(), {'b': {'decimation_factor'}})
+        self.assertEqual(store.take_dirty(), {'b': {'decimation_factor'}})
+        self.assertEqual(store.dirty(), {})
+
+        # Changes of a deleted node come back with it
+        table.restore_row(a, 'a')
+        self.assertEqual(store.take_dirty(), {'a': {'decimation_factor'}})
+        self.assertEqual(table.get(a, 'decimation_factor'), 4)
+
+if __name__ == '__main__':
+    unittest.main()